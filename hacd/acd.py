@@ -9,15 +9,18 @@
 #                  http://www.gnu.org/licenses/
 # *****************************************************************************
 from hacd.cut_generators.cut_generators_enum import CutGenerator
+from hacd.hull import HullBackend
 from hacd.util.geometry import PolytopeDescription
 from hacd.util.data_reader import get_cell_decompositions
 from hacd.util import argparse_helpers
+from hacd.util.cache import NodeCache
+from hacd.planar import planar_union_from_json
 import argparse
 import logging
 import os
 import json
 
-from acd_tree import build_acd, render_tree_dict
+from acd_tree import build_acd, render_tree_dict, acd_parameters
 
 
 def _arguments():
@@ -82,6 +85,68 @@ def _arguments():
             type=int,
             help="Nr of cuts that are tried in each step."
         ),
+        "sweepsPerOrthant": ArgHolder(
+            "--sweepsPerOrthant",
+            default=100,
+            type=int,
+            help="Nr of sweep directions per orthant that the sweep cut generator tries"
+        ),
+        "nrExactCuts": ArgHolder(
+            "--nrExactCuts",
+            default=0,
+            type=int,
+            help="If positive, the nrCuts cuts are screened by estimated volumes"
+                 " and only the nrExactCuts best are evaluated exactly"
+        ),
+        "hullBackend": ArgHolder(
+            "--hullBackend",
+            default=HullBackend.SWEEP,
+            action=argparse_helpers.enum_action(HullBackend),
+            help="Method for convex hulls, qhull (needs scipy) computes hull volumes directly"
+                 " from the vertices"
+        ),
+        "processes": ArgHolder(
+            "--processes",
+            default=1,
+            type=int,
+            help="Nr of processes that evaluate sweep directions of nodes with many events"
+        ),
+        "cacheDir": ArgHolder(
+            "--cacheDir",
+            default=None,
+            help="Directory of a persistent cache for node computations that is shared"
+                 " between runs"
+        ),
+        "cacheSize": ArgHolder(
+            "--cacheSize",
+            default=1024,
+            type=int,
+            help="Maximal size of the cache in MB"
+        ),
+        "planar": ArgHolder(
+            "--planar",
+            action="store_true",
+            help="Use the planar engine for 2D instances (polygons instead of cell"
+                 " decompositions, only sweep and facet cuts)"
+        ),
+        "progressFile": ArgHolder(
+            "--progressFile",
+            default=None,
+            help="Json file that is rewritten during the run with the progress of the"
+                 " decomposition (finished nodes, errors, time per phase, estimated time left)"
+        ),
+        "noRender": ArgHolder(
+            "--noRender",
+            action="store_true",
+            help="Do not render tree.png (no graphviz/matplotlib needed)"
+        ),
+        "warmStart": ArgHolder(
+            "--warmStart",
+            default=None,
+            type=argparse_helpers.valid_file,
+            help="tree.json of an earlier run on the same polytopes."
+                 " Its nodes are reused and only refined where necessary"
+        ),
     }
 
     # Define all possible arguments
@@ -117,6 +182,8 @@ if __name__ == "__main__":
         parser.set_defaults()
     # Parse args and init parameter dictionary.
     args = parser.parse_args()
+    if args.planar and args.cutGenerator not in (CutGenerator.SWEEP, CutGenerator.FACET):
+        parser.error("--planar supports only the sweep and the facet cut generator")
     instance_file = os.path.basename(args.polytopePath)
     instance = os.path.splitext(instance_file)[0]
     output_dir = os.path.abspath(args.outputDir + '/{}_{}_mD{}_nrC{}'.format(
@@ -136,16 +203,48 @@ if __name__ == "__main__":
 
     params = {k: v for (k, v) in vars(args).iteritems()}
     logger.info("Using the following parameters:\n%s" % str(params))
-    union_cd, convex_cd = get_cell_decompositions(args.polytopePath,
-                                                  description=args.polytopeDescription,
-                                                  reduce_hyperplanes=args.reduceHyperplanes)
+    if args.planar:
+        union_cd, convex_cd = planar_union_from_json(args.polytopePath,
+                                                     description=args.polytopeDescription), None
+    else:
+        union_cd, convex_cd = get_cell_decompositions(args.polytopePath,
+                                                      description=args.polytopeDescription,
+                                                      reduce_hyperplanes=args.reduceHyperplanes)
+    previous_tree, previous_parameters = None, None
+    if args.warmStart:
+        with open(args.warmStart) as fin:
+            previous_tree = json.load(fin)
+        parameters_path = os.path.join(os.path.dirname(args.warmStart), 'parameters.json')
+        if os.path.isfile(parameters_path):
+            with open(parameters_path) as fin:
+                previous_parameters = json.load(fin)
+    cache = NodeCache(args.cacheDir, args.cacheSize * 2 ** 20) if args.cacheDir else None
     tree = build_acd(union_cd,
                      convex_cd,
                      max_vol_error=args.maxVolError,
                      max_depth=args.maxDepth,
                      cut_generator=args.cutGenerator,
-                     nr_cuts=args.nrCuts)
+                     nr_cuts=args.nrCuts,
+                     previous_tree=previous_tree,
+                     previous_parameters=previous_parameters,
+                     sweeps_per_orthant=args.sweepsPerOrthant,
+                     nr_exact_cuts=args.nrExactCuts or None,
+                     cache=cache,
+                     processes=args.processes,
+                     hull_backend=args.hullBackend,
+                     progress_file=args.progressFile)
 
     with open(os.path.join(output_dir, 'tree.json'), 'w') as fout:
         json.dump(tree.as_dict(), fout, indent=3)
-    render_tree_dict(os.path.join(output_dir, 'tree.json'))
+    with open(os.path.join(output_dir, 'parameters.json'), 'w') as fout:
+        json.dump(acd_parameters(args.maxVolError,
+                                 args.maxDepth,
+                                 args.cutGenerator,
+                                 args.nrCuts,
+                                 args.sweepsPerOrthant,
+                                 args.nrExactCuts or None), fout, indent=3)
+    if not args.noRender:
+        try:
+            render_tree_dict(os.path.join(output_dir, 'tree.json'))
+        except ImportError as e:
+            logger.warning("tree.png is not rendered: {}".format(e))
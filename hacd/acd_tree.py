@@ -8,87 +8,395 @@
 #  the License, or (at youroption) any later version.
 #                  http://www.gnu.org/licenses/
 # *****************************************************************************
+import copy
 import json
+import logging
 import os
+import random
+import time
+
+import numpy as np
 
 from hacd.cut_generators.cut_generators_enum import CutGenerator
-from node import Node
+from hacd.cut_generators.sweep import sweep_pool, close_sweep_pool
+from hacd.hull import HullBackend
+from hacd.util.geometry import boxes_overlap, events_bounding_box, halfspace_excludes
+from hacd.util.geometry import polytope_keys
+from hacd.planar import PlanarNode, PlanarUnion
+from hacd.progress import ProgressMonitor
+from node import Node, error_small_enough
 
-import pygraphviz as pgv
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
-import matplotlib.cm as cmx
+from sweepvolume.geometry import Hyperplane
 
 
 class LightNode(object):
+    """
+    Compact record of a finished node: its metrics (dict), its provenance (halfspace or cluster)
+    and, if requested, its convex hull as (A, b, vertices) arrays with hull {x : A*x + b >= 0}.
+    """
+    __slots__ = ('id', 'halfspace', 'cluster', 'parent_id', 'children', 'dict', 'hull', 'bbox')
+
     def __init__(self,
                  id,
                  parentID,
                  dict=None,
-                 convex_cd=None,
+                 hull=None,
                  halfspace=None,
-                 cluster=None):
+                 cluster=None,
+                 bbox=None):
         self.id = id
         self.halfspace = halfspace
         self.cluster = cluster
         self.parent_id = parentID
         self.children = None
         self.dict = dict
-        self.convex_cd = convex_cd
+        self.hull = hull
+        self.bbox = bbox
 
 
 class Tree(object):
-    def __init__(self, root_node):
+    def __init__(self, root_node, keep_hulls=False):
+        """
+        :param root_node: Node object of the whole union of polytopes
+        :param keep_hulls: if True, the records of the nodes keep their convex hull as arrays
+        """
         self.root = root_node
         self.root.dict = self.root.as_dict()
+        # nodes are released once they are finished, restoring nodes starts from the whole union
+        self.union_cd = root_node.union_cd
+        self.keep_hulls = keep_hulls
         self.leafes = []
         self.inner_nodes = []
+        # seconds spent in the phases of the decomposition (see iter_dfs)
+        self.phase_seconds = {'clusters': 0., 'cuts': 0., 'best_cut': 0., 'copies': 0.}
+
+    def _add_phase_time(self, phase, start):
+        self.phase_seconds[phase] += time.time() - start
+
+    def dfs(self, nr_cuts, nodes_to_decompose=None):
+        """
+        Decomposes nodes depth first until every node is finished.
+        :param nr_cuts: Nr of cuts that are tried in each step.
+        :param nodes_to_decompose: list of (node, halfspace, cluster) tuples to start from.
+         If None the decomposition starts at the root.
+        """
+        for _ in self.iter_dfs(nr_cuts, nodes_to_decompose):
+            pass
 
-    def dfs(self, nr_cuts):
-        nodes_to_decompose = [(self.root, None, None)]
+    def iter_dfs(self, nr_cuts, nodes_to_decompose=None):
+        """
+        Generator version of dfs that yields the LightNode of every node as soon as the node is
+        finished, i.e. as leaf or as inner node whose children have been created.
+        Clusters that are translated copies of a sibling are not decomposed; the subtree of the
+        sibling is copied (see copy_subtree) after all other nodes are finished.
+        """
+        if nodes_to_decompose is None:
+            nodes_to_decompose = [(self.root, None, None)]
+        # (copy id, parent id, representative id, translation, cluster) of translated clusters
+        copies = []
         while nodes_to_decompose:
             current_node = nodes_to_decompose.pop()
             current_node[0].logStatistics()
             if current_node[0].check_abort():
-                self.leafes.append(LightNode(
-                    current_node[0].id,
-                    current_node[0].parent_id,
-                    convex_cd=current_node[0].convex_cd,
-                    halfspace=current_node[1],
-                    cluster=current_node[2],
-                    dict=current_node[0].as_dict()
-                ))
+                yield self.add_leaf(*current_node)
                 continue
             # Find and resolve clusters
+            start = time.time()
             clusters = current_node[0].find_clusters()
 
             if len(clusters) > 1:
-                current_node[0].children = current_node[0].clusters_to_nodes(clusters)
+                node = current_node[0]
+                node.children = node.clusters_to_nodes(clusters)
+                children_ids = [child.id for child in node.children]
+                for representative, translation, cluster in node.cluster_copies:
+                    copy_id = random.getrandbits(32)
+                    copies.append((copy_id, node.id, representative.id, translation, cluster))
+                    children_ids.append(copy_id)
+                nodes_to_decompose += [(child, None, child.cluster) for child in node.children]
+                self._add_phase_time('clusters', start)
+                yield self.add_inner_node(*current_node, children_ids=children_ids)
+                continue
+            self._add_phase_time('clusters', start)
+
+            start = time.time()
+            cuts = current_node[0].find_cuts(nr_cuts=nr_cuts)
+            self._add_phase_time('cuts', start)
+            start = time.time()
+            current_node[0].best_cut(cuts)
+            self._add_phase_time('best_cut', start)
+            # if the children of the node are generated by a cut, they result by intersection
+            # with the halfspace (cut, -1) resp. (cut, 1)
+            nodes_to_decompose += [(n, n.halfspace, None)
+                                   for n in current_node[0].children]
+            yield self.add_inner_node(*current_node)
+
+        # copies inside the subtree of a representative are recorded after the representative,
+        # so they are instantiated first and end up in the copies of the representative as well
+        for copy_id, parent_id, representative_id, translation, cluster in reversed(copies):
+            start = time.time()
+            light_nodes = self.copy_subtree(representative_id,
+                                            translation,
+                                            copy_id,
+                                            parent_id,
+                                            cluster)
+            self._add_phase_time('copies', start)
+            for light_node in light_nodes:
+                yield light_node
+
+    def copy_subtree(self, node_id, translation, copy_id, parent_id, cluster):
+        """
+        Adds a translated copy of the finished subtree below a node to the tree.
+        The metrics of the nodes are taken over, their halfspaces, bounding boxes and hulls
+        are translated and they get new ids.
+        :param node_id: id of the root of the subtree
+        :param translation: np.array by which the subtree is moved
+        :param copy_id: id of the copy of the root of the subtree
+        :param parent_id: id of the parent of the copy
+        :param cluster: set of polytope indices (in the parent) of the copy
+        :return: list of the new LightNodes, parents before their children
+        """
+        light_nodes = self.light_nodes()
+        leaf_ids = set(str(leaf.id) for leaf in self.leafes)
+        ids = {str(node_id): (copy_id, parent_id)}
+        new_light_nodes = []
+        # subtree lists every node before its children
+        for light_node in self.subtree(light_nodes[str(node_id)]):
+            new_id, new_parent_id = ids[str(light_node.id)]
+            children_ids = []
+            for child_id in light_node.dict['children']:
+                ids[child_id] = (random.getrandbits(32), new_id)
+                children_ids.append(str(ids[child_id][0]))
+            new_light_node = translated_light_node(light_node, translation, new_id, new_parent_id)
+            new_light_node.dict['children'] = children_ids
+            if new_id == copy_id:
+                new_light_node.cluster = cluster
+                new_light_node.dict['cluster'] = sorted(cluster)
+            if str(light_node.id) in leaf_ids:
+                self.leafes.append(new_light_node)
             else:
-                cuts = current_node[0].find_cuts(nr_cuts=nr_cuts)
-                best_cut = current_node[0].best_cut(cuts)
-            if len(clusters) > 1:
-                nodes_to_decompose += [(node, None, clusters[i])
-                                       for i, node in enumerate(current_node[0].children)]
+                self.inner_nodes.append(new_light_node)
+            new_light_nodes.append(new_light_node)
+        return new_light_nodes
 
+    def add_leaf(self, node, halfspace, cluster):
+        bbox = node.bounding_box()
+        light_node = LightNode(
+            node.id,
+            node.parent_id,
+            hull=self._hull(node),
+            halfspace=halfspace,
+            cluster=cluster,
+            dict=node_dict(node, halfspace, cluster, bbox),
+            bbox=bbox
+        )
+        node.release()
+        self.leafes.append(light_node)
+        return light_node
+
+    def add_inner_node(self, node, halfspace, cluster, children_ids=None):
+        bbox = node.bounding_box()
+        light_node = LightNode(
+            node.id,
+            node.parent_id,
+            hull=self._hull(node),
+            halfspace=halfspace,
+            cluster=cluster,
+            dict=node_dict(node, halfspace, cluster, bbox),
+            bbox=bbox
+        )
+        if children_ids is not None:
+            light_node.dict['children'] = [str(child_id) for child_id in children_ids]
+        # the children have been created, so the node is not needed anymore
+        node.release()
+        self.inner_nodes.append(light_node)
+        return light_node
+
+    def _hull(self, node):
+        if not self.keep_hulls:
+            return None
+        return node.hull_arrays()
+
+    def warm_start(self, previous_tree, nr_cuts):
+        """
+        Decomposes the tree starting from the finished nodes of a previous tree
+        that was built with the same cut parameters and the same or a looser tolerance
+        (see warm_start_possible).
+        Finished nodes of the previous tree are reused as long as their recorded decision
+        is still valid for the tolerances of this tree. Nodes that fail the new tolerance or
+        depth limit are restored from their halfspace and cluster provenance and refined.
+        :param previous_tree: tree dict as returned by Tree.as_dict() (e.g. loaded from tree.json)
+        :param nr_cuts: Nr of cuts that are tried in each step.
+        """
+        for _ in self.iter_warm_start(previous_tree, nr_cuts):
+            pass
+
+    def iter_warm_start(self, previous_tree, nr_cuts):
+        """
+        Generator version of warm_start. It first yields the reused LightNodes of the previous
+        tree and then the nodes that are finished during refinement.
+        """
+        previous = {str(node_id): d for node_id, d in previous_tree.items()}
+        tol_rel, tol_abs, max_depth = self.root.tol_rel, self.root.tol_abs, self.root.max_depth
+
+        def error_ok(d):
+            return error_small_enough(d['relative_error'], d['total_error'], tol_rel, tol_abs)
+
+        def finished(d):
+            return error_ok(d) or d['depth'] >= max_depth
+
+        def decision_valid(d):
+            # best_cut stops early if the errors of all children are small enough for the old
+            # tolerance. The cut is still the one best_cut would choose if that is true for the
+            # new one. The depth limit plays no role in best_cut.
+            return not d.get('early_exit') or all(error_ok(previous[child_id])
+                                                  for child_id in d['children'])
+
+        nodes_to_decompose = []
+        ids_to_check = ['root']
+        while ids_to_check:
+            node_id = ids_to_check.pop()
+            d = previous[node_id]
+            light_node = light_node_from_dict(node_id, d)
+            if finished(d):
+                light_node.dict['children'] = []
+                self.leafes.append(light_node)
+                yield light_node
+            elif d['children'] and decision_valid(d):
+                self.inner_nodes.append(light_node)
+                ids_to_check += d['children']
+                yield light_node
             else:
-                # if the children of the node are generated by a cut, they result by intersection
-                # with the halfspace (cut, -1) for children[0] and resp. (cut, 1) for children[1]
-                nodes_to_decompose += [(n, (best_cut, 2 * i - 1), None)
-                                       for i, n in enumerate(current_node[0].children)]
-            self.inner_nodes.append(LightNode(
-                current_node[0].id,
-                current_node[0].parent_id,
-                halfspace=current_node[1],
-                cluster=current_node[2],
-                dict=current_node[0].as_dict()
-            ))
+                logging.info("Refining node {} of previous tree".format(node_id))
+                node = self.root if node_id == 'root' else self.restore_node(node_id, previous)
+                nodes_to_decompose.append((node, light_node.halfspace, light_node.cluster))
+        for light_node in self.iter_dfs(nr_cuts, nodes_to_decompose):
+            yield light_node
+
+    def restore_node(self, node_id, tree_dict):
+        """
+        Restores a node from the halfspaces and clusters on its path from the root.
+        :param node_id: id of the node in tree_dict
+        :param tree_dict: tree dict with string ids, as returned by Tree.as_dict()
+        :return: Node object
+        """
+        path = []
+        current_id = node_id
+        while current_id != 'root':
+            path.append(tree_dict[current_id])
+            current_id = tree_dict[current_id]['parent_id']
+
+        union_cd = self.union_cd
+        for d in reversed(path):
+            union_cd = self.root.restricted_union(union_cd,
+                                                  cluster=d.get('cluster'),
+                                                  halfspace=halfspace_from_dict(d['halfspace']))
+
+        d = tree_dict[node_id]
+        # the convex hull is built by the node, with the hull backend of the tree
+        return self.root.__class__(union_cd,
+                                   None,
+                                   id=node_id,
+                                   depth=d['depth'],
+                                   parent_id=d['parent_id'],
+                                   halfspace=halfspace_from_dict(d['halfspace']),
+                                   cluster=set(d['cluster']) if d.get('cluster') is not None
+                                   else None,
+                                   **self.root.child_parameters())
+
+    def light_nodes(self):
+        """
+        :return: dictionary that maps the (string) id of every finished node to its LightNode
+        """
+        return {str(node.id): node for node in self.leafes + self.inner_nodes}
+
+    def subtree(self, light_node):
+        """
+        Collects the LightNodes of the subtree below (and including) a finished node.
+        :param light_node: a LightNode of this tree
+        :return: list of LightNodes
+        """
+        light_nodes = self.light_nodes()
+        subtree = []
+        stack = [light_node]
+        while stack:
+            current = stack.pop()
+            subtree.append(current)
+            stack += [light_nodes[child_id] for child_id in current.dict['children']]
+        return subtree
 
     def as_dict(self):
         d = {node.id: node.dict for node in [self.root] + self.leafes + self.inner_nodes}
         return d
 
 
+def halfspace_as_dict(halfspace):
+    if halfspace is None:
+        return None
+    hyperplane, orientation = halfspace
+    return {'a': [float(a_i) for a_i in hyperplane.a],
+            'b': float(hyperplane.b),
+            'orientation': orientation}
+
+
+def halfspace_from_dict(d):
+    if d is None:
+        return None
+    return Hyperplane(np.array(d['a']), d['b']), d['orientation']
+
+
+def node_dict(node, halfspace, cluster, bbox):
+    """
+    Method returns the dict of a finished node together with its provenance,
+    i.e. the halfspace or the cluster (polytope indices in the parent) the node results from.
+    """
+    d = node.as_dict()
+    d['halfspace'] = halfspace_as_dict(halfspace)
+    d['cluster'] = sorted(cluster) if cluster is not None else None
+    d['bbox'] = [list(bbox[0]), list(bbox[1])]
+    return d
+
+
+def light_node_from_dict(node_id, d):
+    d = dict(d)
+    return LightNode(node_id,
+                     d['parent_id'],
+                     dict=d,
+                     halfspace=halfspace_from_dict(d.get('halfspace')),
+                     cluster=set(d['cluster']) if d.get('cluster') is not None else None,
+                     bbox=np.array(d['bbox']) if d.get('bbox') is not None else None)
+
+
+def translated_light_node(light_node, translation, id, parent_id):
+    """
+    :return: LightNode of a node moved by translation, with a new id and parent id
+    """
+    translation = np.asarray(translation, dtype=float)
+    halfspace, bbox, hull = light_node.halfspace, light_node.bbox, light_node.hull
+    if halfspace is not None:
+        # a*x + b = 0 moved by t is a*x + b - a*t = 0
+        hyperplane, orientation = halfspace
+        halfspace = (Hyperplane(hyperplane.a, float(hyperplane.b) - np.dot(hyperplane.a,
+                                                                           translation)),
+                     orientation)
+    if bbox is not None:
+        bbox = (np.asarray(bbox[0]) + translation, np.asarray(bbox[1]) + translation)
+    if hull is not None:
+        A, b, vertices = hull
+        hull = (A, b - A.dot(translation), vertices + translation)
+    d = dict(light_node.dict)
+    d['parent_id'] = str(parent_id)
+    d['halfspace'] = halfspace_as_dict(halfspace)
+    if bbox is not None:
+        d['bbox'] = [list(bbox[0]), list(bbox[1])]
+    return LightNode(id,
+                     parent_id,
+                     dict=d,
+                     hull=hull,
+                     halfspace=halfspace,
+                     cluster=light_node.cluster,
+                     bbox=bbox)
+
+
 def render_tree_dict(tree_path, outpath=None):
     """
     Method renders ACD_tree dict as returned by ACD_tree.as_dict() (stored in a json).
@@ -96,6 +404,15 @@ def render_tree_dict(tree_path, outpath=None):
     :param outpath: path to save tree. if none tree is saved in same directory as json as tree.png
     :return:
     """
+    # rendering dependencies are only loaded when a tree is rendered
+    try:
+        import pygraphviz as pgv
+        import matplotlib.pyplot as plt
+        import matplotlib.colors as colors
+        import matplotlib.cm as cmx
+    except ImportError:
+        raise ImportError("rendering needs pygraphviz and matplotlib: pip install hacd[render]")
+
     data = json.load(open(tree_path))
     if not outpath:
         outpath = os.path.join(os.path.dirname(tree_path), 'tree.png')
@@ -126,10 +443,104 @@ def build_acd(union_cd,
               max_vol_error=0.05,
               max_depth=10,
               cut_generator=CutGenerator.SWEEP,
-              nr_cuts=10
+              nr_cuts=10,
+              previous_tree=None,
+              previous_parameters=None,
+              sweeps_per_orthant=100,
+              nr_exact_cuts=None,
+              cache=None,
+              keep_hulls=False,
+              processes=None,
+              hull_backend=HullBackend.SWEEP,
+              progress_file=None,
+              progress_interval=10.0
               ):
+    """
+    Method builds the ACD tree for a union of polytopes.
+    :param union_cd: CellDecomposition object for the union of polytopes or, for the planar
+     engine (see hacd.planar), a PlanarUnion object
+    :param convex_cd: CellDecomposition object for the convex hull of the union
+     (None for a PlanarUnion)
+    :param max_vol_error: Maximal relative (to total) volume error tolerated in any node
+    :param max_depth: Maximum depth of the tree
+    :param cut_generator: CutGenerator (enum) object
+    :param nr_cuts: Nr of cuts that are tried in each step.
+    :param previous_tree: tree dict (e.g. from tree.json) of an earlier run on the same input.
+     Its nodes are reused as starting frontier (warm start).
+    :param previous_parameters: dict as returned by acd_parameters for the earlier run (e.g. from
+     its parameters.json). The warm start is skipped if it is missing, if the parameters of the
+     cut generation differ or if max_vol_error is larger than before.
+    :param sweeps_per_orthant: Nr of sweep directions per orthant for the sweep cut generator.
+    :param nr_exact_cuts: If set, the nr_cuts candidates are screened by volume estimates and
+     only the nr_exact_cuts most promising ones are evaluated exactly.
+    :param cache: NodeCache object. If given, volumes, convex hulls, clusters and cuts of the
+     nodes are looked up in and stored to it.
+    :param keep_hulls: If True, the convex hulls of the nodes are kept as arrays
+     (LightNode.hull), e.g. for overlap queries. Otherwise no hull is kept once a node is
+     finished.
+    :param processes: Nr of processes that evaluate sweep directions for nodes with many events.
+     The pool of processes is started once and shared by all nodes.
+    :param hull_backend: HullBackend (enum) object for the convex hulls of the nodes.
+     QHULL needs scipy.
+    :param progress_file: If given, the progress of the decomposition is written to this json
+     file (see hacd.progress) at most every progress_interval seconds.
+    :param progress_interval: Nr of seconds between two updates of the progress file
+    :return: Tree object
+    """
+    tree, finished_nodes = _acd(union_cd,
+                                convex_cd,
+                                max_vol_error=max_vol_error,
+                                max_depth=max_depth,
+                                cut_generator=cut_generator,
+                                nr_cuts=nr_cuts,
+                                previous_tree=previous_tree,
+                                previous_parameters=previous_parameters,
+                                sweeps_per_orthant=sweeps_per_orthant,
+                                nr_exact_cuts=nr_exact_cuts,
+                                cache=cache,
+                                keep_hulls=keep_hulls,
+                                processes=processes,
+                                hull_backend=hull_backend,
+                                progress_file=progress_file,
+                                progress_interval=progress_interval)
+    for _ in finished_nodes:
+        pass
+    return tree
 
-    root_node = Node(
+
+def iter_acd(union_cd, convex_cd, **kwargs):
+    """
+    Generator version of build_acd, it takes the same arguments.
+    Every node is yielded as LightNode as soon as it is finished, i.e. as leaf or as inner node
+    whose children have been created. LightNode.halfspace resp. LightNode.cluster tell
+    where a node comes from. The decomposition stops when the generator is dropped.
+    """
+    tree, finished_nodes = _acd(union_cd, convex_cd, **kwargs)
+    for light_node in finished_nodes:
+        yield light_node
+
+
+def _acd(union_cd,
+         convex_cd,
+         max_vol_error=0.05,
+         max_depth=10,
+         cut_generator=CutGenerator.SWEEP,
+         nr_cuts=10,
+         previous_tree=None,
+         previous_parameters=None,
+         sweeps_per_orthant=100,
+         nr_exact_cuts=None,
+         cache=None,
+         keep_hulls=False,
+         processes=None,
+         hull_backend=HullBackend.SWEEP,
+         progress_file=None,
+         progress_interval=10.0):
+    # returns the tree and the generator that decomposes it
+    planar = isinstance(union_cd, PlanarUnion)
+    node_class = PlanarNode if planar else Node
+    pool = None if planar else sweep_pool(processes)
+    root_node = node_class(
         union_cd,
         convex_cd,
         id='root',
@@ -138,9 +549,251 @@ def build_acd(union_cd,
         tol_rel=max_vol_error,
         tol_abs=None,
         max_depth=max_depth,
-        cut_generator=cut_generator
+        cut_generator=cut_generator,
+        sweeps_per_orthant=sweeps_per_orthant,
+        nr_exact_cuts=nr_exact_cuts,
+        cache=cache,
+        processes=processes,
+        pool=pool,
+        hull_backend=hull_backend
     )
 
-    tree = Tree(root_node)
-    tree.dfs(nr_cuts)
-    return tree
+    tree = Tree(root_node, keep_hulls=keep_hulls)
+    if previous_tree is not None and warm_start_possible(previous_parameters,
+                                                         acd_parameters(max_vol_error,
+                                                                        max_depth,
+                                                                        cut_generator,
+                                                                        nr_cuts,
+                                                                        sweeps_per_orthant,
+                                                                        nr_exact_cuts)):
+        finished_nodes = tree.iter_warm_start(previous_tree, nr_cuts)
+    else:
+        finished_nodes = tree.iter_dfs(nr_cuts)
+    if pool is not None:
+        finished_nodes = _closing(finished_nodes, pool)
+    if progress_file is not None:
+        monitor = ProgressMonitor(progress_file, tree, interval=progress_interval)
+        finished_nodes = _monitored(finished_nodes, monitor)
+    return tree, finished_nodes
+
+
+def _closing(finished_nodes, pool):
+    # passes the finished nodes on and closes the pool of the sweeps when the decomposition
+    # ends or the generator is dropped
+    try:
+        for light_node in finished_nodes:
+            yield light_node
+    finally:
+        close_sweep_pool(pool)
+
+
+def _monitored(finished_nodes, monitor):
+    # passes the finished nodes on and records them in the progress file
+    for light_node in finished_nodes:
+        monitor.update(light_node)
+        yield light_node
+    monitor.close()
+
+
+def acd_parameters(max_vol_error,
+                   max_depth,
+                   cut_generator,
+                   nr_cuts,
+                   sweeps_per_orthant=100,
+                   nr_exact_cuts=None):
+    return {
+        'max_vol_error': max_vol_error,
+        'max_depth': max_depth,
+        'cut_generator': cut_generator.value,
+        'nr_cuts': nr_cuts,
+        'sweeps_per_orthant': sweeps_per_orthant,
+        'nr_exact_cuts': nr_exact_cuts
+    }
+
+
+# parameters that determine which cuts are found for a node
+CUT_PARAMETERS = ['cut_generator', 'nr_cuts', 'sweeps_per_orthant', 'nr_exact_cuts']
+
+
+def warm_start_possible(previous_parameters, parameters):
+    """
+    The recorded decisions of a previous tree are valid for a tree with the same cut parameters
+    and the same or a tighter tolerance: best_cut stops at the first cut whose children meet the
+    tolerance, for a looser tolerance that may be an earlier cut.
+    :param previous_parameters: dict as returned by acd_parameters for the previous tree or None
+    :param parameters: dict as returned by acd_parameters for the new tree
+    :return: True if the previous tree can be used as starting frontier
+    """
+    if previous_parameters is None or previous_parameters.get('max_vol_error') is None:
+        logging.warning("Tolerance of the previous tree is not known -> no warm start possible")
+        return False
+    if parameters['max_vol_error'] > previous_parameters['max_vol_error']:
+        logging.warning("Previous tree was built for the tighter tolerance {}"
+                        " -> no warm start possible".format(previous_parameters['max_vol_error']))
+        return False
+    # trees of older runs do not record the parameters that had no choice back then
+    defaults = {'sweeps_per_orthant': 100, 'nr_exact_cuts': None}
+    if any(previous_parameters.get(key, defaults.get(key)) != parameters[key]
+           for key in CUT_PARAMETERS):
+        logging.warning("Previous tree was built with parameters {} -> no warm start possible"
+                        .format(previous_parameters))
+        return False
+    return True
+
+
+def update_acd(tree, union_cd, convex_cd, changed_polytopes, nr_cuts=10):
+    """
+    Method updates an ACD tree after polytopes have been added to or removed from the union.
+    A node is recomputed only if one of the changed polytopes meets its region, i.e. the
+    halfspaces and cluster bounding boxes on its path from the root. Cuts of recomputed inner
+    nodes are reused, subtrees of untouched nodes are taken over as they are.
+    Leaves and cluster splits that are touched are decomposed anew.
+    :param tree: Tree object of the old union of polytopes (as returned by build_acd)
+    :param union_cd: CellDecomposition object for the new union of polytopes
+    :param convex_cd: CellDecomposition object for the convex hull of the new union
+    :param changed_polytopes: list of Polytope objects that have been added or removed
+    :param nr_cuts: Nr of cuts that are tried when a node is decomposed anew.
+    :return: updated Tree object
+    """
+    changed = [np.array(p.get_vertex_coordinates(), dtype=float) for p in changed_polytopes]
+    old_nodes = tree.light_nodes()
+    old_leafes = set(str(leaf.id) for leaf in tree.leafes)
+
+    parameters = tree.root.child_parameters()
+    # the absolute tolerance is derived from the volume of the new union
+    parameters['tol_abs'] = None
+    # the pool of the old build is closed
+    parameters['pool'] = None
+    if not isinstance(union_cd, PlanarUnion):
+        parameters['pool'] = sweep_pool(parameters['processes'])
+    root_node = tree.root.__class__(
+        union_cd,
+        convex_cd,
+        id='root',
+        depth=0,
+        parent_id=None,
+        **parameters
+    )
+    new_tree = Tree(root_node, keep_hulls=tree.keep_hulls)
+
+    def touched(halfspaces, bbox=None):
+        # True if a changed polytope may meet the region given by halfspaces and bbox
+        return any(
+            not any(halfspace_excludes(vertices, halfspace) for halfspace in halfspaces) and
+            (bbox is None or boxes_overlap((vertices.min(axis=0), vertices.max(axis=0)), bbox))
+            for vertices in changed
+        )
+
+    # polytope indices of the old union -> indices of the same polytopes in the new union
+    new_indices = dict((key, i) for i, key in enumerate(polytope_keys(union_cd)))
+    old_to_new = dict((i, new_indices[key]) for i, key in enumerate(polytope_keys(tree.union_cd))
+                      if key in new_indices)
+
+    def renumbered(cluster):
+        # clusters further down refer to the order of the polytopes in this cluster,
+        # so the renumbering has to keep it
+        if any(i not in old_to_new for i in cluster):
+            return None
+        indices = [old_to_new[i] for i in sorted(cluster)]
+        return set(indices) if indices == sorted(indices) else None
+
+    def reused_subtree(old_node):
+        # LightNodes of the subtree of an old node whose parent has the polytopes of the whole
+        # union. Clusters that refer to the numbering of the whole union are renumbered, None if
+        # that is not possible.
+        light_nodes = []
+        # ids of the nodes whose polytopes are numbered as in the whole union
+        global_ids = {str(old_node.parent_id)}
+        for light_node in tree.subtree(old_node):
+            if str(light_node.parent_id) in global_ids:
+                if light_node.cluster is None:
+                    global_ids.add(str(light_node.id))
+                else:
+                    cluster = renumbered(light_node.cluster)
+                    if cluster is None:
+                        return None
+                    light_node = copy.copy(light_node)
+                    light_node.cluster = cluster
+                    light_node.dict = dict(light_node.dict, cluster=sorted(cluster))
+            light_nodes.append(light_node)
+        return light_nodes
+
+    def reuse(light_nodes):
+        for light_node in light_nodes:
+            if str(light_node.id) in old_leafes:
+                new_tree.leafes.append(light_node)
+            else:
+                new_tree.inner_nodes.append(light_node)
+
+    # entries: (new node, old LightNode, halfspace, cluster, halfspaces of the region)
+    nodes_to_update = [(root_node, old_nodes['root'], None, None, [])]
+    nodes_to_decompose = []
+    while nodes_to_update:
+        node, old_node, halfspace, cluster, halfspaces = nodes_to_update.pop()
+        old_children = [old_nodes[child_id] for child_id in old_node.dict['children']]
+        if str(old_node.id) in old_leafes or not old_children or node.check_abort():
+            nodes_to_decompose.append((node, halfspace, cluster))
+            continue
+
+        if old_children[0].halfspace is not None:
+            # node was split by a cut -> apply the same cut again
+            cut = old_children[0].halfspace[0]
+            old_children = {old_child.halfspace[1]: old_child for old_child in old_children}
+            children_ids = []
+            for orientation in [-1, 1]:
+                child_halfspace = (cut, orientation)
+                child_halfspaces = halfspaces + [child_halfspace]
+                old_child = old_children.get(orientation)
+                light_nodes = None
+                if old_child is not None and not touched(child_halfspaces):
+                    light_nodes = reused_subtree(old_child)
+                if light_nodes is not None:
+                    reuse(light_nodes)
+                    children_ids.append(old_child.id)
+                    continue
+                child = node.child_from_halfspace(cut,
+                                                  orientation,
+                                                  id=str(old_child.id) if old_child else None)
+                if child is None:
+                    continue
+                children_ids.append(child.id)
+                if old_child is None:
+                    # the halfspace was empty before, so there is nothing to reuse
+                    nodes_to_decompose.append((child, child_halfspace, None))
+                else:
+                    nodes_to_update.append((child, old_child, child_halfspace, None,
+                                            child_halfspaces))
+            new_tree.add_inner_node(node, halfspace, cluster, children_ids=children_ids)
+            continue
+
+        # node was split into clusters -> untouched clusters are reused
+        clusters = node.find_clusters()
+        if len(clusters) == 1:
+            nodes_to_decompose.append((node, halfspace, cluster))
+            continue
+        children_ids = []
+        for poly_indices in clusters:
+            events = [e for e in node.union_cd.events if poly_indices & set(e.incident_polytopes)]
+            if not events:
+                continue
+            bbox = events_bounding_box(events)
+            reusable = [old_child for old_child in old_children
+                        if np.allclose(old_child.bbox, bbox) and
+                        not touched(halfspaces, old_child.bbox)]
+            light_nodes = reused_subtree(reusable[0]) if reusable else None
+            if light_nodes is not None and light_nodes[0].cluster == poly_indices:
+                reuse(light_nodes)
+                children_ids.append(reusable[0].id)
+                continue
+            child = node.clusters_to_nodes([poly_indices])
+            if not child:
+                continue
+            children_ids.append(child[0].id)
+            nodes_to_decompose.append((child[0], None, poly_indices))
+        new_tree.add_inner_node(node, halfspace, cluster, children_ids=children_ids)
+
+    try:
+        new_tree.dfs(nr_cuts, nodes_to_decompose)
+    finally:
+        close_sweep_pool(parameters['pool'])
+    return new_tree
@@ -12,31 +12,68 @@ from sweepvolume.cell_decomposition import Cell_Decomposition
 from sweepvolume.sweep import Sweep
 from sweepvolume.geometry import Polytope, vector_distance
 
+from hacd.util.union_find import UnionFind
+from hacd.util.geometry import event_coordinates
+
 import numpy as np
-import pandas as pd
 import logging
+import copy
 
 
-def conv_hull_cell_decomposition(cell_decomposition, reduce_hyperplanes=True):
+def conv_hull_cell_decomposition(cell_decomposition,
+                                 reduce_hyperplanes=True,
+                                 h_representation=None):
     """
     Method computes Cell Decomposition for convex hull of events of input cell decomposition
     :param cell_decomposition: CellDecomposition object
     :param reduce_hyperplanes: boolean if close hyperplanes should be removed from convex hull
+    :param h_representation: (hyperplanes, position vectors) of the convex hull as returned by
+     conv_hull_h_representation. If None it is computed.
     :return: cell decomposition object for convex hull
     """
+    if h_representation is None:
+        h_representation = conv_hull_h_representation(cell_decomposition, reduce_hyperplanes)
+    hyperplanes, pos_vec = h_representation
+
+    logging.info('create convex hull cell decomposition from {} hyperplanes'
+                 .format(len(hyperplanes), len(cell_decomposition.events)))
+    return Cell_Decomposition(hyperplanes,
+                              pos_vec,
+                              bounding_box=cell_decomposition.bbox)
+
 
+def conv_hull_h_representation(cell_decomposition, reduce_hyperplanes=True):
+    """
+    Method computes the (pertubated) facet hyperplanes of the convex hull of the events
+    of a cell decomposition.
+    :param cell_decomposition: CellDecomposition object
+    :param reduce_hyperplanes: boolean if close hyperplanes should be removed from convex hull
+    :return: hyperplanes, position vectors (a list with the single polytope of the convex hull)
+    """
     p = Polytope(vertices=set([e.vertex for e in cell_decomposition.events]))
     hyperplanes = p.hyperplanes
-    pos_vec = [zip(range(len(hyperplanes)), [1] * len(hyperplanes))]
+    pos_vec = [set(zip(range(len(hyperplanes)), [1] * len(hyperplanes)))]
     if reduce_hyperplanes:
         hyperplanes, pos_vec = drop_facets(hyperplanes, pos_vec)
     hyperplanes = [h.pertubate() for h in hyperplanes]
+    return hyperplanes, pos_vec
 
-    logging.info('create convex hull cell decomposition from {} hyperplanes'
-                 .format(len(hyperplanes), len(cell_decomposition.events)))
-    return Cell_Decomposition(hyperplanes,
-                              pos_vec,
-                              bounding_box=cell_decomposition.bbox)
+
+def restrict_to_cluster(cell_decomposition, cluster):
+    """
+    Method restricts a cell decomposition to a subset of its polytopes.
+    :param cell_decomposition: CellDecomposition object
+    :param cluster: iterable of polytope indices
+    :return: CellDecomposition object for the union of the polytopes in cluster.
+     Polytope i of the result is the i-th smallest index of cluster.
+    """
+    polytope_vectors = [cell_decomposition.polytope_vectors[i] for i in sorted(cluster)]
+    union_cd = copy.deepcopy(cell_decomposition)
+    for v in union_cd.possible_events:
+        v.update_position_vector(union_cd.hyperplanes)
+    union_cd.polytope_vectors = polytope_vectors
+    union_cd.events = union_cd.find_events()
+    return union_cd
 
 
 def convex_hull_and_union_sweeps(union_cd, conv_hull_cd, sweep_planes):
@@ -116,6 +153,26 @@ def evaluation_points(union_sweep, eps=np.exp(-8)):
     return eval_times, eval_events
 
 
+def diff_delta_at_cut(union_events, conv_hull_events, cut, eps=np.exp(-8)):
+    """
+    Method computes the quasi differential of the convexification error at a cut.
+    Union and convex hull are swept along the (pertubated) normal of the cut.
+    :param union_events: events of the union of polytopes
+    :param conv_hull_events: events of the convex hull
+    :param cut: Hyperplane object
+    :param eps: step before/after the cut at which the sweeps are evaluated
+    :return: quasi differential of convex hull volume - union volume at the cut
+    """
+    cut = cut.pertubate()
+    norm = np.linalg.norm(np.asarray(cut.a, dtype=float))
+    sweep_plane = np.asarray(cut.a, dtype=float) / norm
+    lam = -float(cut.b) / norm
+    times = np.array([lam - eps, lam, lam + eps])
+    union_volumes = Sweep(union_events, sweep_plane=sweep_plane).calculate_volumes(times)
+    conv_hull_volumes = Sweep(conv_hull_events, sweep_plane=sweep_plane).calculate_volumes(times)
+    return diff_deltas(conv_hull_volumes, union_volumes)[0]
+
+
 def lam_close_to_border(lam, start_lam, end_lam, tolerance=0.01):
     scale = end_lam - start_lam
     if (
@@ -142,28 +199,145 @@ def union_only_events(union_sweeps):
     for sweep in union_sweeps:
         conv_vertices.add(sweep.sorted_events[0][0])
         conv_vertices.add(sweep.sorted_events[-1][0])
-    logging.debug('union vertices: {},'.format(len(union_vertices)),
-                  'conv vertices: {},'.format(len(conv_vertices)),
-                  'inner_vertices:{}'.format(len(union_vertices - conv_vertices)))
+    logging.debug('union vertices: {}, conv vertices: {}, inner_vertices: {}'.format(
+        len(union_vertices), len(conv_vertices), len(union_vertices - conv_vertices)))
     return union_vertices - conv_vertices
 
 
-def detect_clusters(sweep):
+def detect_clusters(events):
     """
-    Method finds clusters through the polytope incidence graph.
-    :param sweep: a sweep object
+    Method finds clusters of polytopes that are connected through common events.
+    Polytopes that are incident to the same event are merged in a union-find structure.
+    :param events: iterable of events of a cell decomposition
     :return: a list of sets whereby each set is a list of ints,
      which describe indices of polytopes in that cluster
     """
-    import networkx as nx
-    g = sweep.graph()
-    clusters = []
-    for c in nx.connected_components(g.to_undirected()):
-        cluster = set()
-        for node in c:
-            cluster.update(node.incident_polytopes)
-        clusters.append(cluster)
-    return clusters
+    polytope_sets = UnionFind()
+    for event in events:
+        polytope_sets.union_all(event.incident_polytopes)
+    return polytope_sets.sets()
+
+
+def polytope_adjacency(events):
+    """
+    Method computes which polytopes meet in common events.
+    :param events: iterable of events of a cell decomposition
+    :return: dict that maps pairs (i, j), i <= j, of polytope indices to an np.array of the
+     coordinates of the events that are incident to both polytopes.
+     The pair (i, i) holds the events of polytope i.
+    """
+    witnesses = {}
+    for event in events:
+        polytopes = sorted(event.incident_polytopes)
+        if not polytopes:
+            continue
+        coordinates = [float(x) for x in event.vertex.coordinates]
+        for k, i in enumerate(polytopes):
+            for j in polytopes[k:]:
+                witnesses.setdefault((i, j), []).append(coordinates)
+    return {pair: np.array(coordinates) for pair, coordinates in witnesses.items()}
+
+
+def restrict_adjacency_to_halfspace(adjacency, events, halfspace, tolerance=1e-7):
+    """
+    Method derives the polytope adjacency of a child node from the adjacency of its parent.
+    Witness events strictly inside the halfspace are events of the child as well, so only
+    pairs of polytopes without such a witness could have been separated by the cut. The only
+    events of the child that are not events of the parent lie on the cut hyperplane.
+    :param adjacency: polytope adjacency of the parent as returned by polytope_adjacency
+    :param events: events of the child
+    :param halfspace: (Hyperplane, orientation) tuple the child results from
+    :param tolerance: events closer than tolerance to the hyperplane count as on the hyperplane
+    :return: polytope adjacency of the child
+    """
+    hyperplane, orientation = halfspace
+    a, b = np.asarray(hyperplane.a, dtype=float), float(hyperplane.b)
+    restricted = {}
+    for pair, coordinates in adjacency.items():
+        inside = orientation * (coordinates.dot(a) + b) > tolerance
+        if inside.all():
+            restricted[pair] = coordinates
+        elif inside.any():
+            restricted[pair] = coordinates[inside]
+
+    events = list(events)
+    if events:
+        on_cut = np.abs(event_coordinates(events).dot(a) + b) <= tolerance
+        new_events = [event for event, new in zip(events, on_cut) if new]
+        for pair, coordinates in polytope_adjacency(new_events).items():
+            if pair in restricted:
+                coordinates = np.vstack([restricted[pair], coordinates])
+            restricted[pair] = coordinates
+    return restricted
+
+
+def sweep_order(events, sweep_plane):
+    """
+    :param events: iterable of events of a cell decomposition
+    :param sweep_plane: sweep direction
+    :return: list of the events in the order in which a sweep in direction sweep_plane meets them
+    """
+    events = list(events)
+    if not events:
+        return events
+    order = np.argsort(event_coordinates(events).dot(sweep_plane), kind='mergesort')
+    return [events[k] for k in order]
+
+
+def restrict_sweep_order(sorted_coordinates, events, sweep_plane, halfspace, tolerance=1e-7):
+    """
+    Method derives the sweep order of the events of a child node from the order of its parent.
+    Events strictly inside the halfspace are events of the parent as well and keep their order,
+    only the events on the cut hyperplane are sorted and merged in.
+    :param sorted_coordinates: np.array of the coordinates of the parent events in sweep order
+    :param events: events of the child
+    :param sweep_plane: sweep direction of the parent order
+    :param halfspace: (Hyperplane, orientation) tuple the child results from
+    :param tolerance: events closer than tolerance to the hyperplane count as on the hyperplane
+    :return: list of the events of the child in sweep order
+    """
+    events = list(events)
+    if not events:
+        return events
+    hyperplane, orientation = halfspace
+    a, b = np.asarray(hyperplane.a, dtype=float), float(hyperplane.b)
+    coordinates = event_coordinates(events)
+    index = {tuple(c): k for k, c in enumerate(np.round(coordinates, 9).tolist())}
+    inside = orientation * (sorted_coordinates.dot(a) + b) > tolerance
+    kept = [index.pop(tuple(c)) for c in np.round(sorted_coordinates[inside], 9).tolist()
+            if tuple(c) in index]
+    # events on the cut and, numerically, events the parent did not have
+    new = np.array(sorted(index.values()), dtype=int)
+    lams = coordinates.dot(sweep_plane)
+    kept = np.array(kept, dtype=int)
+    new = new[np.argsort(lams[new], kind='mergesort')]
+    order = np.insert(kept, np.searchsorted(lams[kept], lams[new], side='right'), new)
+    return [events[k] for k in order]
+
+
+def restrict_adjacency_to_cluster(adjacency, cluster):
+    """
+    Method restricts a polytope adjacency to a cluster and renumbers the polytopes
+    as in restrict_to_cluster.
+    :param adjacency: polytope adjacency as returned by polytope_adjacency
+    :param cluster: iterable of polytope indices
+    :return: polytope adjacency of the cluster
+    """
+    index = {polytope: i for i, polytope in enumerate(sorted(cluster))}
+    return {(index[i], index[j]): coordinates for (i, j), coordinates in adjacency.items()
+            if i in index and j in index}
+
+
+def clusters_from_adjacency(adjacency):
+    """
+    Method finds clusters of polytopes from a polytope adjacency.
+    :param adjacency: polytope adjacency as returned by polytope_adjacency
+    :return: a list of sets of polytope indices as in detect_clusters
+    """
+    polytope_sets = UnionFind()
+    for i, j in adjacency:
+        polytope_sets.union(i, j)
+    return polytope_sets.sets()
 
 
 def cut_data(union_sweeps, convex_hull_sweeps):
@@ -175,14 +349,43 @@ def cut_data(union_sweeps, convex_hull_sweeps):
     :param convex_hull_sweeps: list of sweep objects
     :return: pandas data frame containing information about sweep and best cut
     """
-    cuts = []
-    for sweep_ind in range(len(union_sweeps)):
-        scale = abs(union_sweeps[sweep_ind].sorted_events[-1][1] -
-                    union_sweeps[sweep_ind].sorted_events[0][1])
-        sweepplane = union_sweeps[sweep_ind].sweep_plane
-        lam, diff, active_hyperplanes = max_diff_delta(union_sweeps[sweep_ind],
-                                                       convex_hull_sweeps[sweep_ind])
-        cuts.append((sweepplane, lam, diff, scale, active_hyperplanes))
+    cuts = [cut_row(union_sweep, convex_hull_sweep)
+            for union_sweep, convex_hull_sweep in zip(union_sweeps, convex_hull_sweeps)]
+    return cut_data_frame(cuts)
+
+
+def cut_row(union_sweep, convex_hull_sweep):
+    """
+    :return: (sweep plane, cut lambda, diff delta, scale, active hyperplanes) of one sweep direction
+    """
+    scale = abs(union_sweep.sorted_events[-1][1] - union_sweep.sorted_events[0][1])
+    lam, diff, active_hyperplanes = max_diff_delta(union_sweep, convex_hull_sweep)
+    return union_sweep.sweep_plane, lam, diff, scale, active_hyperplanes
+
+
+def sweep_cut_rows(union_events, conv_hull_events, sweep_planes):
+    """
+    Method sweeps union and convex hull in every direction and computes the best cut
+    of each direction. Sweeps are discarded after their direction has been evaluated.
+    :param union_events: events of the union of polytopes
+    :param conv_hull_events: events of the convex hull
+    :param sweep_planes: iterable of sweep directions
+    :return: list of rows as returned by cut_row
+    """
+    return [cut_row(Sweep(union_events, sweep_plane=sweep_plane),
+                    Sweep(conv_hull_events, sweep_plane=sweep_plane))
+            for sweep_plane in sweep_planes]
+
+
+def cut_data_frame(cuts):
+    """
+    :param cuts: list of rows as returned by cut_row
+    :return: pandas data frame containing information about sweep and best cut
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("cut data frames need pandas: pip install hacd[analysis]")
 
     cut_dataframe = pd.DataFrame(data=cuts,
                                  columns=[
@@ -229,8 +432,86 @@ def drop_facets(hyperplanes, polytope_vectors):
     return reduced_hyperplanes, reduced_polytope_vectors
 
 
-def random_normed_directions(nr_directions, dim=2):
-    np.random.seed(0)
-    x = np.random.normal(size=(nr_directions, dim))
+def random_normed_directions(nr_directions, dim=2, seed=0):
+    # own random state, so the global numpy random state is left untouched
+    x = np.random.RandomState(seed).normal(size=(nr_directions, dim))
+    x /= np.linalg.norm(x, axis=1)[:, np.newaxis]
+    return x
+
+
+_DIRECTION_BANK = {}
+
+
+def direction_bank(nr_directions, dim=2):
+    """
+    Method returns a cached set of well spread unit directions.
+    The set is computed once per (nr_directions, dim) and reused for all nodes.
+    :param nr_directions: number of directions
+    :param dim: dimension
+    :return: np.array of shape (nr_directions, dim)
+    """
+    key = (nr_directions, dim)
+    if key not in _DIRECTION_BANK:
+        _DIRECTION_BANK[key] = spread_directions(nr_directions, dim)
+    return _DIRECTION_BANK[key].copy()
+
+
+def spread_directions(nr_directions, dim=2, seed=0):
+    """
+    Method computes unit directions that cover a hemisphere evenly. A direction and its opposite
+    give the same cut planes, so the other hemisphere is left out.
+    In 2D the directions are equiangular, in 3D they form a Fibonacci lattice and in higher
+    dimensions they are computed from a Halton sequence through the Box-Muller transform and
+    mirrored into the hemisphere.
+    The whole set is rotated randomly, so no direction is parallel to a coordinate axis.
+    :param nr_directions: number of directions
+    :param dim: dimension
+    :param seed: seed of the random rotation
+    :return: np.array of shape (nr_directions, dim)
+    """
+    k = np.arange(nr_directions) + 0.5
+    if dim == 1:
+        x = np.ones((nr_directions, 1))
+    elif dim == 2:
+        angles = np.pi * k / nr_directions
+        x = np.column_stack([np.cos(angles), np.sin(angles)])
+    elif dim == 3:
+        z = 1 - k / nr_directions
+        r = np.sqrt(1 - z ** 2)
+        angles = np.pi * (3 - np.sqrt(5)) * k
+        x = np.column_stack([r * np.cos(angles), r * np.sin(angles), z])
+    else:
+        u = halton_sequence(nr_directions, 2 * ((dim + 1) // 2))
+        radii = np.sqrt(-2 * np.log(u[:, 0::2]))
+        angles = 2 * np.pi * u[:, 1::2]
+        x = np.hstack([radii * np.cos(angles), radii * np.sin(angles)])[:, :dim]
+        x *= np.where(x[:, :1] < 0, -1., 1.)
+    rotation, _ = np.linalg.qr(np.random.RandomState(seed).normal(size=(dim, dim)))
+    x = x.dot(rotation)
     x /= np.linalg.norm(x, axis=1)[:, np.newaxis]
     return x
+
+
+def halton_sequence(nr_points, dim, skip=1):
+    """
+    Method computes points of the Halton low-discrepancy sequence in the unit cube.
+    :param nr_points: number of points
+    :param dim: dimension
+    :param skip: number of leading points that are skipped (the first point is 0)
+    :return: np.array of shape (nr_points, dim) with entries in (0, 1)
+    """
+    primes = []
+    candidate = 2
+    while len(primes) < dim:
+        if all(candidate % p != 0 for p in primes):
+            primes.append(candidate)
+        candidate += 1
+    points = np.zeros((nr_points, dim))
+    for j, base in enumerate(primes):
+        indices = np.arange(skip, nr_points + skip)
+        factor = 1.
+        while indices.any():
+            factor /= base
+            points[:, j] += factor * (indices % base)
+            indices //= base
+    return points
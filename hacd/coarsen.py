@@ -0,0 +1,140 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Coarsening of a finished ACD tree to at most K pieces.
+
+The convex hulls of a set of nodes that covers every leaf exactly once (a cut of the
+hierarchy) form a decomposition of the union. Its error is the sum of the recorded total
+errors (convex volume - volume) of the nodes, so the best cut with at most K nodes is found by
+dynamic programming over the tree without any geometry.
+
+Usage: python -m hacd.coarsen --treePath results/tree.json --maxPieces 8
+"""
+import argparse
+import json
+import logging
+
+INFINITY = float('inf')
+
+
+def coarsen(tree_dict, max_pieces):
+    """
+    Method selects the cut of the hierarchy with at most max_pieces nodes and minimal total
+    error.
+    :param tree_dict: tree dict as returned by Tree.as_dict() (e.g. loaded from tree.json)
+    :param max_pieces: maximal nr of nodes of the cut
+    :return: (total error, list of the (string) ids of the nodes of the cut) tuple
+    """
+    assert isinstance(max_pieces, int) and max_pieces > 0
+    nodes = {str(node_id): d for node_id, d in tree_dict.items()}
+
+    # best[node_id][j]: minimal error of a cut of the subtree with at most j nodes (j >= 1).
+    # The tables are only as long as the subtree has leaves, more pieces do not help.
+    best = {}
+    # split[node_id][j]: True if the best cut with at most j nodes lies below the node
+    split = {}
+    # allocations[node_id][k][j]: nr of nodes of the cut that child k gets, if the children
+    # up to k share at most j nodes
+    allocations = {}
+    for node_id in _post_order(nodes):
+        d = nodes[node_id]
+        children = d['children']
+        if not children:
+            best[node_id] = [INFINITY, d['total_error']]
+            split[node_id] = [False, False]
+            continue
+        # every child needs at least one node, so there are no cuts with fewer nodes
+        merged = [0.]
+        allocations[node_id] = []
+        for child_id in children:
+            merged, allocation = _merge(merged, best[child_id], max_pieces)
+            allocations[node_id].append(allocation)
+        best[node_id] = [INFINITY] + [min(d['total_error'], error) for error in merged[1:]]
+        split[node_id] = [False] + [error < d['total_error'] for error in merged[1:]]
+
+    cut = []
+    stack = [('root', max_pieces)]
+    while stack:
+        node_id, pieces = stack.pop()
+        pieces = min(pieces, len(best[node_id]) - 1)
+        if not split[node_id][pieces]:
+            cut.append(node_id)
+            continue
+        children = nodes[node_id]['children']
+        for k in reversed(range(len(children))):
+            child_pieces = allocations[node_id][k][pieces]
+            stack.append((children[k], child_pieces))
+            pieces -= child_pieces
+    return best['root'][min(max_pieces, len(best['root']) - 1)], cut
+
+
+def _merge(merged, child_best, max_pieces):
+    # combines the cuts of the previous children with the cuts of one more child
+    size = min(len(merged) - 1 + len(child_best) - 1, max_pieces)
+    combined = [INFINITY] * (size + 1)
+    allocation = [0] * (size + 1)
+    for j in range(1, size + 1):
+        for i in range(1, min(j, len(child_best) - 1) + 1):
+            if j - i >= len(merged):
+                continue
+            error = merged[j - i] + child_best[i]
+            if error < combined[j]:
+                combined[j], allocation[j] = error, i
+    return combined, allocation
+
+
+def _post_order(nodes):
+    order = []
+    stack = ['root']
+    while stack:
+        node_id = stack.pop()
+        order.append(node_id)
+        stack += nodes[node_id]['children']
+    return reversed(order)
+
+
+def coarsened_tree(tree_dict, cut):
+    """
+    :return: tree dict restricted to the nodes above and on the cut, the nodes of the cut are
+     leaves
+    """
+    nodes = {str(node_id): d for node_id, d in tree_dict.items()}
+    cut = set(cut)
+    result = {}
+    stack = ['root']
+    while stack:
+        node_id = stack.pop()
+        d = dict(nodes[node_id])
+        if node_id in cut:
+            d['children'] = []
+        result[node_id] = d
+        stack += d['children']
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--treePath", required=True, help="File Path of tree.json")
+    parser.add_argument("--maxPieces", required=True, type=int,
+                        help="Maximal nr of convex pieces")
+    parser.add_argument("--outputPath", default=None,
+                        help="If given, the coarsened tree is written to this json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with open(args.treePath) as fin:
+        tree_dict = json.load(fin)
+    total_error, cut = coarsen(tree_dict, args.maxPieces)
+    logging.info("{} pieces with total error {}".format(len(cut), total_error))
+    print(json.dumps({'total_error': total_error, 'nodes': cut}, indent=3))
+    if args.outputPath:
+        with open(args.outputPath, 'w') as fout:
+            json.dump(coarsened_tree(tree_dict, cut), fout, indent=3)
@@ -0,0 +1,124 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+import logging
+
+import numpy as np
+
+from sweepvolume.geometry import Polytope, Vertex
+
+from hacd.analysis import halton_sequence
+from hacd.util.geometry import event_coordinates
+
+
+def screen_cuts(node, cuts, nr_exact_cuts, nr_points=4096):
+    """
+    Method ranks candidate cuts by quasi Monte Carlo estimates of the volumes of the children
+    and returns the most promising ones for exact evaluation.
+    One Halton point sample in the bounding box of the node is shared by all cuts.
+    :param node: Node for which the cuts are evaluated
+    :param cuts: list of Hyperplane objects
+    :param nr_exact_cuts: number of cuts that are returned
+    :param nr_points: size of the point sample
+    :return: the nr_exact_cuts cuts with the smallest estimated convex hull volume of the
+     children, sorted by that estimate
+    """
+    if len(cuts) <= nr_exact_cuts:
+        return cuts
+    estimator = VolumeEstimator(node.union_cd, nr_points=nr_points)
+    scores = []
+    for cut in cuts:
+        union_volumes, hull_volumes = estimator.child_volumes(cut)
+        logging.debug("Screening cut <{}> : union volumes {}, convex volumes {}".format(
+            str(cut), union_volumes, hull_volumes))
+        scores.append(sum(hull_volumes))
+    order = np.argsort(scores, kind='mergesort')[:nr_exact_cuts]
+    logging.info("Screened {} cuts, evaluating {} exactly".format(len(cuts), nr_exact_cuts))
+    return [cuts[i] for i in order]
+
+
+class VolumeEstimator(object):
+    """
+    Quasi Monte Carlo volume estimation for the children of a union of polytopes.
+    """
+
+    def __init__(self, union_cd, nr_points=4096, tolerance=1e-9):
+        coordinates = event_coordinates(union_cd.events)
+        lower, upper = coordinates.min(axis=0), coordinates.max(axis=0)
+        self.box_volume = np.prod(upper - lower)
+        self.tolerance = tolerance
+        self.points = lower + halton_sequence(nr_points, union_cd.dim) * (upper - lower)
+
+        a = np.array([np.asarray(h.a, dtype=float) for h in union_cd.hyperplanes])
+        b = np.array([float(h.b) for h in union_cd.hyperplanes])
+        values = self.points.dot(a.T) + b
+        self.in_union = np.zeros(nr_points, dtype=bool)
+        for polytope in union_cd.polytope_vectors:
+            inside = np.ones(nr_points, dtype=bool)
+            for idx, orientation in polytope:
+                inside &= orientation * values[:, idx] >= -tolerance
+            self.in_union |= inside
+
+        # Each polytope is the convex hull of the events it is incident to.
+        vertices = {}
+        for event, coordinate in zip(union_cd.events, coordinates):
+            for polytope in event.incident_polytopes:
+                vertices.setdefault(polytope, []).append(coordinate)
+        self.polytope_vertices = [np.array(v) for v in vertices.values()]
+
+    def child_volumes(self, cut):
+        """
+        Estimates the volumes of union and convex hull for both children of a cut.
+        :param cut: Hyperplane object
+        :return: (union_volumes, hull_volumes), each a list for the halfspaces (cut, -1), (cut, 1)
+        """
+        a, b = np.asarray(cut.a, dtype=float), float(cut.b)
+        side = self.points.dot(a) + b
+        union_volumes, hull_volumes = [], []
+        for orientation in [-1, 1]:
+            in_halfspace = orientation * side >= 0
+            union_volumes.append(self.box_volume * np.mean(self.in_union & in_halfspace))
+            hull_volumes.append(self.box_volume * np.mean(self._in_child_hull(a, b, orientation)))
+        return union_volumes, hull_volumes
+
+    def _in_child_hull(self, a, b, orientation):
+        vertices = self._child_vertices(a, b, orientation)
+        if len(vertices) <= len(a):
+            return np.zeros(len(self.points), dtype=bool)
+        try:
+            hull = Polytope(vertices=set(Vertex.vertex_from_coordinates(v) for v in vertices))
+        except Exception as e:
+            # degenerate (not full dimensional) children have no volume
+            logging.debug("No convex hull for child: {}".format(e))
+            return np.zeros(len(self.points), dtype=bool)
+        inside = np.ones(len(self.points), dtype=bool)
+        for h in hull.hyperplanes:
+            inside &= self.points.dot(np.asarray(h.a, dtype=float)) + float(h.b) >= -self.tolerance
+        return inside
+
+    def _child_vertices(self, a, b, orientation):
+        """
+        The convex hull of a child is spanned by the vertices of the polytopes in the halfspace
+        and by the points where segments between vertices of a polytope cross the cut.
+        """
+        child_vertices = []
+        for vertices in self.polytope_vertices:
+            values = orientation * (vertices.dot(a) + b)
+            child_vertices.append(vertices[values >= 0])
+            inside, outside = vertices[values > 0], vertices[values < 0]
+            if len(inside) == 0 or len(outside) == 0:
+                continue
+            v_in, v_out = values[values > 0][:, np.newaxis], values[values < 0][np.newaxis, :]
+            t = (v_in / (v_in - v_out))[:, :, np.newaxis]
+            crossings = inside[:, np.newaxis, :] + t * (outside[np.newaxis, :, :] -
+                                                        inside[:, np.newaxis, :])
+            child_vertices.append(crossings.reshape(-1, len(a)))
+        child_vertices = np.vstack(child_vertices)
+        return np.unique(np.round(child_vertices, 9), axis=0)
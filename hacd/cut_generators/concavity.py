@@ -0,0 +1,95 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+import logging
+from itertools import combinations
+
+import numpy as np
+
+from sweepvolume.sweep import Sweep
+from sweepvolume.geometry import Hyperplane
+
+import hacd.analysis as ana
+from hacd.cut_generators.principal import principal_cuts, polytope_centroids
+from hacd.util.geometry import event_coordinates, distinct_hyperplanes
+
+# Nr of candidates per requested cut that are scored by sweeps. The candidates are ranked by the
+# depth of their witness first, scoring costs two sweeps per candidate.
+SCORED_CANDIDATES_PER_CUT = 2
+
+
+def concavity_cuts(node, n=10, nr_sweeps=None):
+    """
+    Method generates cuts through concavity witnesses, i.e. events of the union of polytopes
+    that are not vertices of its convex hull. Candidates are the hyperplanes incident to a
+    witness and the planes through a witness that separate the centroids of two polytopes
+    incident to it. Candidates of deeper witnesses (see witness_depths) come first and only the
+    first SCORED_CANDIDATES_PER_CUT * n are scored by a sweep of union and convex hull.
+    :param node: Node for which cuts are to be generated
+    :param n: Number of cuts to be returned.
+    :param nr_sweeps: Nr of sweeps that look for witnesses (default: 4 per orthant)
+    :return: a list of the best n cuts
+    """
+    witnesses = concavity_witnesses(node, nr_sweeps or 4 * 2 ** node.dim)
+    logging.debug("-- found {} concavity witnesses".format(len(witnesses)))
+    if not witnesses:
+        logging.info("No concavity witnesses found, using principal cuts")
+        return principal_cuts(node, n)
+
+    centroids = polytope_centroids(node.union_cd, event_coordinates(node.union_cd.events))
+    A, b, _ = node.hull_arrays()
+    depths = witness_depths(witnesses, A, b)
+    candidates = []
+    for event in [witnesses[k] for k in np.argsort(-depths, kind='mergesort')]:
+        coordinates = np.array([float(x) for x in event.vertex.coordinates])
+        for idx in sorted(event.incidences):
+            hyperplane = node.union_cd.hyperplanes[idx]
+            candidates.append(Hyperplane(hyperplane.a, hyperplane.b))
+        for p, q in combinations(sorted(event.incident_polytopes), 2):
+            normal = centroids[q] - centroids[p]
+            if np.linalg.norm(normal) > 1e-9:
+                candidates.append(Hyperplane(normal, -normal.dot(coordinates)))
+    candidates = distinct_hyperplanes(candidates)[:SCORED_CANDIDATES_PER_CUT * n]
+    logging.debug("-- scoring {} candidate cuts...".format(len(candidates)))
+
+    scores = [ana.diff_delta_at_cut(node.union_cd.events, node.convex_cd.events, cut)
+              for cut in candidates]
+    order = np.argsort(-np.array(scores), kind='mergesort')
+    return [candidates[i] for i in order[:n]]
+
+
+def witness_depths(witnesses, A, b):
+    """
+    :param witnesses: list of events inside the convex hull
+    :param A, b: arrays of the convex hull {x : A*x + b >= 0}
+    :return: np.array of the distances of the witnesses to the boundary of the convex hull
+    """
+    if not witnesses:
+        return np.zeros(0)
+    distances = (event_coordinates(witnesses).dot(A.T) + b) / np.linalg.norm(A, axis=1)
+    return distances.min(axis=1)
+
+
+def concavity_witnesses(node, nr_sweeps):
+    """
+    :return: list of the events of the union of polytopes that are not vertices of the
+     convex hull
+    """
+    union_sweeps = [Sweep(node.union_cd.events, sweep_plane=sweep_plane)
+                    for sweep_plane in ana.direction_bank(nr_sweeps, node.dim)]
+    # a few sweeps do not meet every vertex of the convex hull first or last
+    inner_events = ana.union_only_events(union_sweeps)
+    hull_vertices = event_coordinates(node.convex_cd.events)
+    witnesses = []
+    for event in inner_events:
+        coordinates = np.array([float(x) for x in event.vertex.coordinates])
+        if np.linalg.norm(hull_vertices - coordinates, axis=1).min() > 1e-6:
+            witnesses.append(event)
+    return witnesses
@@ -14,6 +14,8 @@ from enum import Enum
 class CutGenerator(Enum):
     SWEEP = 'sweep'
     FACET = 'facet'
+    PRINCIPAL = 'principal'
+    CONCAVITY = 'concavity'
 
     def __eq__(self, other):
         if self.value == other.value:
@@ -11,6 +11,7 @@
 from sweepvolume.sweep import Sweep
 from sweepvolume.geometry import Hyperplane
 from hacd.analysis import lam_close_to_border
+from hacd.util.geometry import distinct_hyperplanes
 
 import numpy as np
 
@@ -34,7 +35,8 @@ def facet_cuts(ACDNode, nr_cuts=10):
         logging.debug('cut: <{}> ; difference delta: {}'.format(str(hyperplane), diff_delta))
         cuts.append((Hyperplane(hyperplane.a, hyperplane.b), diff_delta))
     cuts = sorted(cuts, key=lambda x: x[1], reverse=True)
-    return list(zip(*cuts[:nr_cuts])[0])
+    # equal hyperplanes with different scale or sign would be tried twice
+    return distinct_hyperplanes([cut for cut, _ in cuts])[:nr_cuts]
 
 
 def get_sweeps(ACDNode, hyperplane):
@@ -0,0 +1,92 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+import logging
+
+import numpy as np
+
+from sweepvolume.geometry import Hyperplane
+
+import hacd.analysis as ana
+from hacd.cut_generators.sweep import move_cuts
+from hacd.util.geometry import event_coordinates, distinct_hyperplanes
+
+
+def principal_cuts(node, n=10):
+    """
+    Method generates cuts from a few directions that are derived from the geometry of the node:
+    the principal axes of the events, the directions between the centroids of the polytopes on
+    both sides of the median along each principal axis and the directions between the most
+    distant polytope centroids. Each direction is swept once and cut at the event with the
+    largest quasi derivative of the convexification error, as in sweep_cuts.
+    :param node: Node for which cuts are to be generated
+    :param n: Number of cuts to be returned.
+    :return: a list of the best n cuts
+    """
+    directions = principal_directions(node.union_cd, n)
+    logging.debug("-- using {} principal sweep planes...".format(len(directions)))
+    rows = ana.sweep_cut_rows(node.union_cd.events, node.convex_cd.events, directions)
+    rows = sorted([row for row in rows if row[1] is not None], key=lambda row: -row[2])
+    cuts_with_hyperplanes = [[Hyperplane(direction, -lam), active_hyperplanes]
+                             for direction, lam, _, _, active_hyperplanes in rows]
+    cuts = move_cuts(cuts_with_hyperplanes, node.union_cd, tolerance=0.01)
+    return distinct_hyperplanes(cuts)[:n]
+
+
+def principal_directions(union_cd, n=10):
+    """
+    :param union_cd: CellDecomposition object
+    :param n: number of directions between distant polytope centroids
+    :return: np.array of normed directions, one per row
+    """
+    coordinates = event_coordinates(union_cd.events)
+    centered = coordinates - coordinates.mean(axis=0)
+    # eigenvectors of the covariance, largest variance first
+    _, axes = np.linalg.eigh(centered.T.dot(centered))
+    axes = axes.T[::-1]
+    directions = list(axes)
+
+    centroids = polytope_centroids(union_cd, coordinates)
+    centroids = centroids[~np.isnan(centroids).any(axis=1)]
+    for axis in axes:
+        projections = centroids.dot(axis)
+        lower = projections <= np.median(projections)
+        if lower.all():
+            continue
+        directions.append(centroids[~lower].mean(axis=0) - centroids[lower].mean(axis=0))
+
+    first, second = np.triu_indices(len(centroids), 1)
+    differences = centroids[second] - centroids[first]
+    distances = np.linalg.norm(differences, axis=1)
+    directions += list(differences[np.argsort(-distances, kind='mergesort')[:n]])
+
+    # directions that differ only by sign give the same sweep cuts
+    directions = np.array([h.a / np.linalg.norm(h.a) for h in distinct_hyperplanes(
+        [Hyperplane(d, 0.) for d in directions if np.linalg.norm(d) > 1e-9])])
+    # sweeps along facet normals are degenerate (see facet.get_sweeps), so the directions are
+    # tilted slightly; move_cuts snaps the resulting cuts back onto nearby hyperplanes
+    directions += 1e-4 * np.random.RandomState(0).normal(size=directions.shape)
+    return directions / np.linalg.norm(directions, axis=1)[:, np.newaxis]
+
+
+def polytope_centroids(union_cd, coordinates):
+    """
+    :return: np.array with the mean of the events incident to each polytope, one per row.
+     Rows of polytopes without events are nan.
+    """
+    sums = np.zeros((len(union_cd.polytope_vectors), union_cd.dim))
+    counts = np.zeros(len(union_cd.polytope_vectors))
+    for event, coordinate in zip(union_cd.events, coordinates):
+        for polytope in event.incident_polytopes:
+            sums[polytope] += coordinate
+            counts[polytope] += 1
+    centroids = np.full(sums.shape, np.nan)
+    centroids[counts > 0] = sums[counts > 0] / counts[counts > 0][:, np.newaxis]
+    return centroids
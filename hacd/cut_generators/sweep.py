@@ -9,7 +9,7 @@
 #                  http://www.gnu.org/licenses/
 # *****************************************************************************
 import logging
-import pandas
+import multiprocessing
 
 import numpy as np
 
@@ -18,61 +18,164 @@ from sweepvolume.geometry import vector_distance
 import hacd.analysis as ana
 from sweepvolume.geometry import Hyperplane
 
+from hacd.util.geometry import distinct_hyperplanes
+from hacd.util.shared_geometry import SharedGeometry, cell_decomposition_arrays
+from hacd.util.shared_geometry import cell_decomposition_from_arrays
+
+# Nodes with fewer events are swept in the calling process, a pool does not pay off for them.
+PARALLEL_MIN_EVENTS = 100
+# Nor does it for fewer sweep directions per process.
+PARALLEL_MIN_DIRECTIONS = 32
+
 
 def sweep_cuts(node,
                n=10,
-               sweeps_per_orthant=100):
+               sweeps_per_orthant=100,
+               processes=None,
+               pool=None):
     """
     Method to generate cuts via Sweep-Plane.
     :param node: Node for which cuts are to be generated
     :param n: Number of cuts to be returned.
     :param sweeps_per_orthant: Number of sweeps that are tried
+    :param processes: Nr of processes of pool
+    :param pool: multiprocessing.Pool object as returned by sweep_pool or None. The sweep
+     directions of nodes with many events are split into chunks that are evaluated by the pool.
     :return: a list of the best n cuts
     """
 
     assert isinstance(n, int) and n > 0
     nr_sweeps = sweeps_per_orthant * 2 ** node.dim
-    # Generate random sweep planes.
-    logging.debug("-- generating {} random sweep planes...".format(nr_sweeps))
-    sweepplanes = ana.random_normed_directions(nr_sweeps, node.dim)
+    # Get well spread sweep planes.
+    logging.debug("-- using {} sweep planes...".format(nr_sweeps))
+    sweepplanes = ana.direction_bank(nr_sweeps, node.dim)
 
     # Apply sweep plane algorithm to the union of polytopes and their convex hull.
     logging.debug("-- applying sweep plane algorithm...")
-    sweeps_polys, sweeps_convhull = ana.convex_hull_and_union_sweeps(node.union_cd,
-                                                                     node.convex_cd,
-                                                                     sweepplanes)
-    cut_data = ana.cut_data(sweeps_polys, sweeps_convhull)
+    if (pool is not None and len(node.union_cd.events) >= PARALLEL_MIN_EVENTS and
+            len(sweepplanes) >= PARALLEL_MIN_DIRECTIONS * processes):
+        rows = parallel_sweep_cut_rows(node.union_cd,
+                                       node.convex_cd,
+                                       sweepplanes,
+                                       pool,
+                                       processes)
+    else:
+        rows = ana.sweep_cut_rows(node.union_cd.events, node.convex_cd.events, sweepplanes)
+    # Return n best cut suggestions (sorted according to score).
+    return select_sweep_cuts(rows, node.union_cd, n, node.dim)
+
 
+def select_sweep_cuts(rows, cd, n, dim):
+    """
+    Method selects the best distinct cuts from the best cuts of the sweep directions.
+    :param rows: list of rows as returned by ana.cut_row, one per sweep direction
+    :param cd: cell decomposition whose hyperplanes the cuts may be moved to
+    :param n: Number of cuts to be returned.
+    :param dim: dimension
+    :return: a list of the best n cuts
+    """
     # Choose cuts that are distinct (enough -> see tolerance in method)
     logging.info("-- selecting {} best cuts...".format(n))
 
     # tolerance dependant on dimension and nr of cuts (n)
-    close_vector_tolerance = 0.005 / np.sqrt(n) * 2**node.dim
-    best_cuts = get_best_distinct_cuts(cut_data, nr_of_cuts=n, tolerance=close_vector_tolerance)
+    close_vector_tolerance = 0.005 / np.sqrt(n) * 2**dim
+    # moving cuts can map several directions to the same hyperplane,
+    # the additional candidates take the place of such duplicates
+    best_cuts = get_best_distinct_cuts(rows,
+                                       nr_of_cuts=2 * n,
+                                       tolerance=close_vector_tolerance)
     cuts_with_hyperplanes = [
-        [Hyperplane(sweep['direction'], -sweep['cut_lambda']), sweep['active_hyperplanes']]
-        for _, sweep in best_cuts.iterrows()
+        [Hyperplane(direction, -cut_lambda), active_hyperplanes]
+        for direction, cut_lambda, _, _, active_hyperplanes in best_cuts
     ]
     # Move cuts to closest hyperplanes if close enough, tolerance
-    cuts = move_cuts(cuts_with_hyperplanes, node.union_cd, tolerance=close_vector_tolerance * 0.5)
+    cuts = move_cuts(cuts_with_hyperplanes, cd, tolerance=close_vector_tolerance * 0.5)
+    return distinct_hyperplanes(cuts)[:n]
 
-    # Return n best cut suggestions (sorted according to score).
-    return cuts
-
-
-def get_best_distinct_cuts(cut_data, nr_of_cuts=10, tolerance=0.1):
-    cut_data = cut_data.sort_values(by=['diff_delta'], ascending=False)
-    best_cuts = pandas.DataFrame(columns=['direction',
-                                          'cut_lambda',
-                                          'diff_delta',
-                                          'scale',
-                                          'active_hyperplanes'])
-    for id, row in cut_data.iterrows():
-        if best_cuts.shape[0] == nr_of_cuts:
+
+def sweep_pool(processes):
+    """
+    Method starts the process pool that evaluates the sweeps of all nodes of a build.
+    :param processes: Nr of processes
+    :return: multiprocessing.Pool object or None if processes is at most 1 or the calling
+     process is daemonic (e.g. a worker of hacd.service) and cannot have children
+    """
+    if not processes or processes <= 1:
+        return None
+    if multiprocessing.current_process().daemon:
+        logging.info("Running in a daemonic process, sweeping sequentially")
+        return None
+    return multiprocessing.Pool(processes)
+
+
+def close_sweep_pool(pool):
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+# prefixes of the arrays of union and convex hull in the shared memory block
+_PREFIXES = ('union/', 'convex/')
+
+
+def _unprefixed(arrays, prefix):
+    return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+
+def _sweep_chunk(task):
+    union_events, conv_hull_events, sweep_planes = task
+    return ana.sweep_cut_rows(union_events, conv_hull_events, sweep_planes)
+
+
+def _shared_sweep_chunk(task):
+    handle, event_classes, sweep_planes = task
+    shared = SharedGeometry.attach(handle)
+    try:
+        events = [cell_decomposition_from_arrays(_unprefixed(shared.arrays, prefix),
+                                                 event_class).events
+                  for prefix, event_class in zip(_PREFIXES, event_classes)]
+    finally:
+        shared.close()
+    return ana.sweep_cut_rows(events[0], events[1], sweep_planes)
+
+
+def parallel_sweep_cut_rows(union_cd, convex_cd, sweep_planes, pool, processes):
+    """
+    Method computes ana.sweep_cut_rows in a process pool. The sweep directions are split into
+    one chunk per process. The geometry of union and convex hull is placed once in a shared
+    memory block (see util.shared_geometry) that the processes attach to by its handle, only
+    without shared memory (python < 3.8) the events are sent to every process.
+    :return: list of rows in the order of sweep_planes
+    """
+    chunks = [chunk for chunk in np.array_split(sweep_planes, processes) if len(chunk)]
+    if not SharedGeometry.available():
+        chunk_rows = pool.map(_sweep_chunk,
+                              [(union_cd.events, convex_cd.events, chunk) for chunk in chunks])
+        return [row for rows in chunk_rows for row in rows]
+
+    arrays = {}
+    for prefix, cd in zip(_PREFIXES, (union_cd, convex_cd)):
+        arrays.update((prefix + name, array)
+                      for name, array in cell_decomposition_arrays(cd).items())
+    event_classes = (type(union_cd.events[0]), type(convex_cd.events[0]))
+    with SharedGeometry.create(arrays) as shared:
+        chunk_rows = pool.map(_shared_sweep_chunk,
+                              [(shared.handle, event_classes, chunk) for chunk in chunks])
+    return [row for rows in chunk_rows for row in rows]
+
+
+def get_best_distinct_cuts(rows, nr_of_cuts=10, tolerance=0.1):
+    """
+    :param rows: list of rows as returned by ana.cut_row
+    :return: list of the rows with the largest diff delta whose directions are further apart
+     than tolerance
+    """
+    best_cuts = []
+    for row in sorted(rows, key=lambda row: row[2], reverse=True):
+        if len(best_cuts) == nr_of_cuts:
             break
-        if all([vector_distance(cut['direction'], row['direction']) > tolerance for
-                _, cut in best_cuts.iterrows()]):
-            best_cuts = best_cuts.append(row)
+        if all(vector_distance(cut[0], row[0]) > tolerance for cut in best_cuts):
+            best_cuts.append(row)
     return best_cuts
 
 
@@ -0,0 +1,187 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Runs hacd for a grid of parameters.
+
+Trees for the same cut generator and nr of cuts agree on all nodes that are decomposed under
+every configuration. The configurations of such a group are therefore run from the coarsest to
+the finest one, each one warm started from the tree of the previous one (see
+Tree.warm_start), so every node is decomposed only once. The cuts of a tree are only valid for
+the same or a tighter tolerance (see warm_start_possible), so this order gives the same trees
+as independent runs.
+
+Usage: python -m hacd.grid --polytopePath p.json --maxVolErrors 0.1 0.05 0.01 --maxDepths 5 10
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from itertools import groupby, product
+
+from hacd.acd_tree import build_acd, acd_parameters
+from hacd.cut_generators.cut_generators_enum import CutGenerator
+from hacd.util.data_reader import get_cell_decompositions
+from hacd.util.geometry import PolytopeDescription
+from hacd.util.json_encoder import NumpyEncoder
+
+
+def grid_configurations(max_vol_errors, max_depths, nr_cuts):
+    """
+    :return: list of dicts with the keys max_vol_error, max_depth and nr_cuts,
+     one for every combination of the given values
+    """
+    return [{'max_vol_error': max_vol_error, 'max_depth': max_depth, 'nr_cuts': n}
+            for max_vol_error, max_depth, n in product(max_vol_errors, max_depths, nr_cuts)]
+
+
+def run_grid(union_cd, convex_cd, configurations, cut_generator=CutGenerator.SWEEP, **kwargs):
+    """
+    Method builds the ACD trees for a grid of configurations.
+    :param union_cd: CellDecomposition object for the union of polytopes
+    :param convex_cd: CellDecomposition object for the convex hull of the union
+    :param configurations: list of dicts with the keys max_vol_error, max_depth and nr_cuts
+    :param cut_generator: CutGenerator (enum) object used for all configurations
+    :param kwargs: further arguments of build_acd that are the same for all configurations
+    :return: list of (configuration, Tree object, seconds) tuples in the order of configurations.
+     seconds is the time spent on the configuration after the previous one of its group.
+    """
+    results = {}
+
+    def group(index):
+        return configurations[index]['nr_cuts']
+
+    def coarsest_first(index):
+        return (group(index),
+                -configurations[index]['max_vol_error'],
+                configurations[index]['max_depth'])
+
+    for nr_cuts, indices in groupby(sorted(range(len(configurations)), key=coarsest_first),
+                                    group):
+        previous_tree, previous_parameters = None, None
+        for index in indices:
+            configuration = configurations[index]
+            logging.info("Running configuration {}".format(configuration))
+            start = time.time()
+            tree = build_acd(union_cd,
+                             convex_cd,
+                             max_vol_error=configuration['max_vol_error'],
+                             max_depth=configuration['max_depth'],
+                             cut_generator=cut_generator,
+                             nr_cuts=nr_cuts,
+                             previous_tree=previous_tree,
+                             previous_parameters=previous_parameters,
+                             **kwargs)
+            results[index] = (configuration, tree, time.time() - start)
+            previous_tree = tree.as_dict()
+            previous_parameters = acd_parameters(configuration['max_vol_error'],
+                                                 configuration['max_depth'],
+                                                 cut_generator,
+                                                 nr_cuts,
+                                                 kwargs.get('sweeps_per_orthant', 100),
+                                                 kwargs.get('nr_exact_cuts'))
+    return [results[index] for index in range(len(configurations))]
+
+
+def tree_metrics(tree):
+    """
+    :return: dict with size, depth and relative volume error of the decomposition of a tree
+    """
+    leaves = [light_node.dict for light_node in tree.leafes]
+    union_volume = sum(d['volume'] for d in leaves)
+    convex_volume = sum(d['convex_volume'] for d in leaves)
+    return {
+        'nr_nodes': len(tree.leafes) + len(tree.inner_nodes),
+        'nr_leaves': len(leaves),
+        'depth': max(d['depth'] for d in leaves),
+        'relative_error': convex_volume / union_volume - 1
+    }
+
+
+def write_grid(results, output_dir, cut_generator, sweeps_per_orthant=100, nr_exact_cuts=None):
+    """
+    Method writes tree.json and parameters.json of every configuration into a sub directory
+    of output_dir and the comparison of all configurations into output_dir/grid.json.
+    sweeps_per_orthant and nr_exact_cuts are the values the grid was run with (see run_grid),
+    so that a parameters.json can be passed as previous_parameters of a warm start.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    comparison = []
+    for configuration, tree, seconds in results:
+        directory = os.path.join(output_dir, '{}_mD{}_nrC{}_mVE{}'.format(
+            cut_generator.value,
+            configuration['max_depth'],
+            configuration['nr_cuts'],
+            configuration['max_vol_error']))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, 'tree.json'), 'w') as fout:
+            json.dump(tree.as_dict(), fout, indent=3, cls=NumpyEncoder)
+        with open(os.path.join(directory, 'parameters.json'), 'w') as fout:
+            json.dump(acd_parameters(configuration['max_vol_error'],
+                                     configuration['max_depth'],
+                                     cut_generator,
+                                     configuration['nr_cuts'],
+                                     sweeps_per_orthant,
+                                     nr_exact_cuts), fout, indent=3)
+        row = dict(configuration, seconds=seconds, **tree_metrics(tree))
+        comparison.append(row)
+        logging.info("mVE {max_vol_error} mD {max_depth} nrC {nr_cuts}: error {relative_error:.4f},"
+                     " {nr_leaves} leaves, {seconds:.2f}s".format(**row))
+    with open(os.path.join(output_dir, 'grid.json'), 'w') as fout:
+        json.dump(comparison, fout, indent=3, cls=NumpyEncoder)
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--polytopePath", required=True,
+                        help="File Path of json that describes polytope")
+    parser.add_argument("--polytopeDescription", default='INNER_DESCRIPTION',
+                        choices=[d.name for d in PolytopeDescription],
+                        help="Description of polytope")
+    parser.add_argument("--outputDir", default="./results", help="Directory for output data files")
+    parser.add_argument("--cutGenerator", default='SWEEP', choices=[c.name for c in CutGenerator],
+                        help="Method for generation of cuts")
+    parser.add_argument("--maxVolErrors", nargs='+', type=float, default=[0.05],
+                        help="Maximal relative volume errors")
+    parser.add_argument("--maxDepths", nargs='+', type=int, default=[10],
+                        help="Maximal depths of the trees")
+    parser.add_argument("--nrCuts", nargs='+', type=int, default=[10],
+                        help="Nrs of cuts that are tried in each step")
+    parser.add_argument("--sweepsPerOrthant", type=int, default=100,
+                        help="Nr of sweep directions per orthant that the sweep cut generator"
+                             " tries")
+    parser.add_argument("--nrExactCuts", type=int, default=0,
+                        help="If positive, the cuts are screened by estimated volumes"
+                             " and only the nrExactCuts best are evaluated exactly")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    cut_generator = CutGenerator[args.cutGenerator]
+    union_cd, convex_cd = get_cell_decompositions(
+        args.polytopePath,
+        description=PolytopeDescription[args.polytopeDescription])
+    instance = os.path.splitext(os.path.basename(args.polytopePath))[0]
+    output_dir = os.path.abspath(os.path.join(args.outputDir, instance + '_grid'))
+    configurations = grid_configurations(args.maxVolErrors, args.maxDepths, args.nrCuts)
+    nr_exact_cuts = args.nrExactCuts or None
+    write_grid(run_grid(union_cd,
+                        convex_cd,
+                        configurations,
+                        cut_generator=cut_generator,
+                        sweeps_per_orthant=args.sweepsPerOrthant,
+                        nr_exact_cuts=nr_exact_cuts),
+               output_dir,
+               cut_generator,
+               sweeps_per_orthant=args.sweepsPerOrthant,
+               nr_exact_cuts=nr_exact_cuts)
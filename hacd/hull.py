@@ -0,0 +1,70 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+from enum import Enum
+
+import numpy as np
+
+from sweepvolume.geometry import Hyperplane
+
+from hacd.analysis import drop_facets
+from hacd.util.geometry import event_coordinates
+
+
+class HullBackend(Enum):
+    # convex hull cell decomposition via sweepvolume, volume by a sweep
+    SWEEP = 'sweep'
+    # quickhull (scipy.spatial) on the events, the cell decomposition is built only when needed
+    QHULL = 'qhull'
+
+    def __eq__(self, other):
+        if self.value == other.value:
+            return True
+        else:
+            return False
+
+
+def qhull(union_cd):
+    """
+    Method computes the convex hull of the events of a cell decomposition with quickhull.
+    :param union_cd: CellDecomposition object
+    :return: scipy.spatial.ConvexHull object
+    """
+    from scipy.spatial import ConvexHull
+
+    return ConvexHull(event_coordinates(union_cd.events))
+
+
+def qhull_volume(union_cd):
+    """
+    :param union_cd: CellDecomposition object
+    :return: volume of the convex hull of the events of union_cd
+    """
+    return float(qhull(union_cd).volume)
+
+
+def qhull_h_representation(union_cd, reduce_hyperplanes=True):
+    """
+    Method computes the facet hyperplanes of the convex hull of the events of a cell
+    decomposition with quickhull. The result has the same form as
+    analysis.conv_hull_h_representation.
+    :param union_cd: CellDecomposition object
+    :param reduce_hyperplanes: boolean if close hyperplanes should be removed from convex hull
+    :return: hyperplanes, position vectors (a list with the single polytope of the convex hull)
+    """
+    # qhull facets are {x : normal*x + offset <= 0} with unit normals; simplicial facets of the
+    # same facet are identified by drop_facets
+    hyperplanes = [Hyperplane(-equation[:-1], -equation[-1])
+                   for equation in np.unique(np.round(qhull(union_cd).equations, 12), axis=0)]
+    pos_vec = [set(zip(range(len(hyperplanes)), [1] * len(hyperplanes)))]
+    if reduce_hyperplanes:
+        hyperplanes, pos_vec = drop_facets(hyperplanes, pos_vec)
+    hyperplanes = [h.pertubate() for h in hyperplanes]
+    return hyperplanes, pos_vec
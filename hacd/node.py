@@ -10,22 +10,58 @@
 # *****************************************************************************
 import logging
 import copy
+import functools
 import json
 
 from sweepvolume.sweep import Sweep
-from analysis import detect_clusters
+from analysis import polytope_adjacency, clusters_from_adjacency
+from analysis import restrict_adjacency_to_halfspace, restrict_adjacency_to_cluster
+from analysis import random_normed_directions, sweep_order, restrict_sweep_order
 
 from hacd.cut_generators.cut_generators_enum import CutGenerator
 from hacd.cut_generators.facet import facet_cuts
 from hacd.cut_generators.sweep import sweep_cuts
+from hacd.cut_generators.principal import principal_cuts
+from hacd.cut_generators.concavity import concavity_cuts
+from hacd.cut_evaluation import screen_cuts
+from hacd.hull import HullBackend, qhull_volume, qhull_h_representation
 
-from analysis import conv_hull_cell_decomposition
+from analysis import conv_hull_cell_decomposition, conv_hull_h_representation
+from analysis import restrict_to_cluster
+from hacd.util.geometry import events_bounding_box, hyperplane_as_tuple
+from hacd.util.geometry import h_representation_arrays, event_coordinates
+from hacd.util.geometry import canonical_hyperplane, distinct_hyperplanes
+
+from sweepvolume.geometry import Hyperplane
+
+import numpy as np
 
 import random
 
 random.seed(1)
 
 
+def error_small_enough(relative_error, absolute_error, tol_rel, tol_abs, eps=1e-5):
+    """
+    Method checks the volume error of a node against the tolerances.
+    :param relative_error: convex hull volume / union volume - 1
+    :param absolute_error: convex hull volume - union volume
+    :param tol_rel: Relative error tolerance.
+    :param tol_abs: Absolute error tolerance.
+    :param eps: numerical slack
+    :return: True if one of the tolerances is met
+    """
+    return relative_error <= tol_rel + eps or absolute_error <= tol_abs + eps
+
+
+def volume_sweep_plane(dim):
+    """
+    :return: sweep direction of the union volume sweeps. It is the same for all nodes, so the
+     children derive the order of their events from the order of the parent.
+    """
+    return random_normed_directions(1, dim, seed=1)[0]
+
+
 class Node(object):
     """
     Class for a node of the Approximate Convex Decomposition tree.
@@ -40,7 +76,18 @@ class Node(object):
                  tol_rel=0.01,
                  tol_abs=None,
                  max_depth=100,
-                 cut_generator=None):
+                 cut_generator=None,
+                 halfspace=None,
+                 adjacency=None,
+                 sweeps_per_orthant=100,
+                 nr_exact_cuts=None,
+                 cache=None,
+                 processes=None,
+                 pool=None,
+                 hull_backend=HullBackend.SWEEP,
+                 volume=None,
+                 cluster=None,
+                 sorted_events=None):
         """
         Node constructor.
         :param union_cd: CellDecomposition object representing a union of polytopes
@@ -52,6 +99,23 @@ class Node(object):
         :param tol_abs: Absolute error tolerance.
         :param max_depth: Maximum depth of the ACD tree.
         :param cut_generator: A CutGenerator (enum) object
+        :param halfspace: (Hyperplane, orientation) tuple if the node results from a cut
+        :param adjacency: polytope adjacency (see analysis.polytope_adjacency) or a callable
+         that derives it from the adjacency of the parent. If None it is computed from scratch.
+        :param sweeps_per_orthant: Nr of sweep directions per orthant for the sweep cut generator.
+        :param nr_exact_cuts: If set, candidate cuts are screened by quasi Monte Carlo volume
+         estimates and only the nr_exact_cuts most promising ones are evaluated exactly.
+        :param cache: NodeCache object for volumes, convex hulls, clusters and cuts or None
+        :param processes: Nr of processes of pool.
+        :param pool: process pool of the build for the sweep cut generator (see
+         sweep.sweep_pool) or None
+        :param hull_backend: HullBackend (enum) object. With QHULL the volume of the convex hull
+         is computed from the events directly and convex_cd may be None; it is built when needed.
+        :param volume: Volume of union_cd if it is already known. Otherwise it is computed.
+        :param cluster: set of polytope indices (in the parent) if the node results from a cluster
+        :param sorted_events: events of union_cd in the order of the volume sweep (see
+         volume_sweep_plane) or a callable that derives them from the order of the parent.
+         If None they are sorted from scratch.
         """
 
         self.dim = union_cd.dim
@@ -65,19 +129,41 @@ class Node(object):
         self.id = id if id is not None else random.getrandbits(32)
         self.parent_id = parent_id
         self.depth = depth
+        self.halfspace = halfspace
+        self.cluster = cluster
+        self._adjacency = adjacency
+        self._sorted_events = sorted_events
+        self._sorted_coordinates = None
         self.union_cd = union_cd
-        self.convex_cd = convex_cd
+        self._convex_cd = convex_cd
 
         # Store cutGenerator
         self.cut_generator = cut_generator
+        self.sweeps_per_orthant = sweeps_per_orthant
+        self.nr_exact_cuts = nr_exact_cuts
+        self.cache = cache
+        self.processes = processes
+        self.pool = pool
+        self.hull_backend = hull_backend
 
-        self.convex_hull_volume = self._convex_hull_volume()
+        self.convex_hull_volume = self._compute_convex_hull_volume()
 
         # Compute volume of union of polytopes.
-        self.volume = self._union_volume()
+        if volume is None:
+            volume = self._compute_volume()
+        self.volume = volume
 
         # Init list of child ACD nodes.
         self.children = []
+        # clusters that are translated copies of a child, see clusters_to_nodes
+        self.cluster_copies = []
+
+        # Indicates if the search in best_cut stopped early because all children were good enough.
+        self.early_exit = False
+
+        # Restricted cell decompositions of the halfspaces that have been tried as cuts,
+        # keyed by the canonical form of the cut and the orientation w.r.t. it.
+        self._restricted_cds = {}
 
         # Store tolerances.
         self.tol_rel = tol_rel
@@ -86,11 +172,132 @@ class Node(object):
 
         logging.info("Initialized %s" % self)
 
+    def _compute_convex_hull_volume(self):
+        """
+        :return: volume of the convex hull of union_cd
+        """
+        if self._convex_cd is None and self.hull_backend == HullBackend.QHULL:
+            return self._cached('hull_volume', self.union_cd, self._qhull_volume)
+        return self._cached('volume', self.convex_cd, self._convex_hull_volume)
+
+    def _compute_volume(self):
+        """
+        :return: volume of union_cd
+        """
+        return self._cached('volume', self.union_cd, self._union_volume)
+
     def _convex_hull_volume(self):
         return Sweep(self.convex_cd.events).calculate_volume()
 
     def _union_volume(self):
-        return Sweep(self.union_cd.events).calculate_volume()
+        # the events are passed in sweep order, so the sweep does not have to sort them again
+        return Sweep(self.sorted_events(),
+                     sweep_plane=volume_sweep_plane(self.dim)).calculate_volume()
+
+    def sorted_events(self):
+        """
+        :return: events of union_cd in the order of the volume sweep (see volume_sweep_plane)
+        """
+        if self._sorted_events is None:
+            self._sorted_events = sweep_order(self.union_cd.events, volume_sweep_plane(self.dim))
+        elif callable(self._sorted_events):
+            self._sorted_events = self._sorted_events()
+        return self._sorted_events
+
+    def _child_sorted_events(self, events, halfspace):
+        # Children derive the order of their events lazily from the order of the parent.
+        if self._sorted_coordinates is None:
+            self._sorted_coordinates = event_coordinates(self.sorted_events())
+        return functools.partial(restrict_sweep_order,
+                                 self._sorted_coordinates,
+                                 events,
+                                 volume_sweep_plane(self.dim),
+                                 halfspace)
+
+    def _qhull_volume(self):
+        try:
+            return qhull_volume(self.union_cd)
+        except ImportError:
+            raise
+        except Exception as e:
+            # quickhull fails for degenerate (e.g. flat) sets of events
+            logging.debug("Quickhull failed, using the sweep instead: {}".format(e))
+            return self._convex_hull_volume()
+
+    @property
+    def convex_cd(self):
+        """
+        CellDecomposition object of the convex hull. Built on first use if the node was created
+        without it.
+        """
+        if self._convex_cd is None and self.union_cd is not None:
+            self._convex_cd = self._conv_hull_cell_decomposition(self.union_cd)
+        return self._convex_cd
+
+    @convex_cd.setter
+    def convex_cd(self, convex_cd):
+        self._convex_cd = convex_cd
+
+    def _cached(self, kind, cell_decomposition, compute, **parameters):
+        if self.cache is None:
+            return compute()
+        return self.cache.cached(kind, cell_decomposition, compute, **parameters)
+
+    def _h_representation(self, union_cd):
+        if self.hull_backend == HullBackend.QHULL:
+            try:
+                return qhull_h_representation(union_cd)
+            except ImportError:
+                raise
+            except Exception as e:
+                logging.debug("Quickhull failed, using sweepvolume instead: {}".format(e))
+        return conv_hull_h_representation(union_cd)
+
+    def _conv_hull_cell_decomposition(self, union_cd):
+        if self.cache is None:
+            return conv_hull_cell_decomposition(union_cd,
+                                                h_representation=self._h_representation(union_cd))
+
+        def h_representation():
+            hyperplanes, pos_vec = self._h_representation(union_cd)
+            return [hyperplane_as_tuple(h) for h in hyperplanes], pos_vec
+
+        hyperplanes, pos_vec = self._cached('convex_hull',
+                                            union_cd,
+                                            h_representation,
+                                            hull_backend=self.hull_backend.value)
+        return conv_hull_cell_decomposition(
+            union_cd,
+            h_representation=([Hyperplane(np.array(a), b) for a, b in hyperplanes], pos_vec)
+        )
+
+    @staticmethod
+    def restricted_union(union_cd, cluster=None, halfspace=None):
+        """
+        :param union_cd: CellDecomposition object
+        :param cluster: set of polytope indices or None
+        :param halfspace: (Hyperplane, orientation) tuple, used if cluster is None
+        :return: union_cd restricted to the cluster resp. the halfspace, as for a child node
+        """
+        if cluster is not None:
+            return restrict_to_cluster(union_cd, cluster)
+        union_cd = copy.deepcopy(union_cd)
+        union_cd.restrict_to_halfspace(*halfspace)
+        return union_cd
+
+    def hull_arrays(self):
+        """
+        :return: (A, b, vertices) arrays of the convex hull {x : A*x + b >= 0}
+        """
+        A, b = h_representation_arrays(self.convex_cd)
+        return A, b, event_coordinates(self.convex_cd.events)
+
+    def bounding_box(self):
+        """
+        Bounding box of the events of the union of polytopes.
+        :return: (lower_bounds, upper_bounds) tuple of np.arrays
+        """
+        return events_bounding_box(self.union_cd.events)
 
     def check_abort(self):
         """
@@ -111,11 +318,9 @@ class Node(object):
         return False
 
     def volume_error_small_enough(self):
-        eps = 1e-5
-
         # Check volume tolerance threshold.
         vol_error_abs = self.convex_hull_volume - self.volume
-        if self.relative_error() <= self.tol_rel + eps or vol_error_abs <= self.tol_abs + eps:
+        if error_small_enough(self.relative_error(), vol_error_abs, self.tol_rel, self.tol_abs):
             logging.info("Volume error is small enough --> no further decomposition!")
             return True
         return False
@@ -123,72 +328,192 @@ class Node(object):
     def relative_error(self):
         return self.convex_hull_volume / self.volume - 1
 
+    def polytope_adjacency(self):
+        if self._adjacency is None:
+            self._adjacency = polytope_adjacency(self.union_cd.possible_events)
+        elif callable(self._adjacency):
+            self._adjacency = self._adjacency()
+        return self._adjacency
+
+    def _child_adjacency(self, restriction, *args):
+        # Children derive their adjacency lazily from the parent if it is already known.
+        if self._adjacency is None or callable(self._adjacency):
+            return None
+        return functools.partial(restriction, self._adjacency, *args)
+
     def find_clusters(self):
-        clusters = detect_clusters(Sweep(self.union_cd.possible_events))
+        clusters = self._cached('clusters',
+                                self.union_cd,
+                                lambda: clusters_from_adjacency(self.polytope_adjacency()))
         logging.info("Clusters found : %s" % clusters)
         return clusters
 
+    def _child_conv_hull_cell_decomposition(self, union_cd):
+        # with quickhull, children build the cell decomposition of their hull only if expanded
+        if self.hull_backend == HullBackend.QHULL:
+            return None
+        return self._conv_hull_cell_decomposition(union_cd)
+
     def cluster_to_cell_decomposition(self, cluster):
-        polytope_vectors = [self.union_cd.polytope_vectors[i] for i in cluster]
-        union_cd = copy.deepcopy(self.union_cd)
-        for v in union_cd.possible_events:
-            v.update_position_vector(union_cd.hyperplanes)
-        union_cd.polytope_vectors = polytope_vectors
-        union_cd.events = union_cd.find_events()
-        conv_cd = conv_hull_cell_decomposition(union_cd)
+        union_cd = restrict_to_cluster(self.union_cd, cluster)
+        conv_cd = self._child_conv_hull_cell_decomposition(union_cd)
 
         return union_cd, conv_cd
 
     def clusters_to_nodes(self, clusters):
+        """
+        Method creates the child nodes of clusters. Clusters that are translated copies of an
+        earlier cluster (see cluster_shape) get no node of their own; they are recorded in
+        cluster_copies as (representative child, translation, cluster) tuples instead, so that
+        the subtree of the representative can be copied once it is finished.
+        :param clusters: list of sets of polytope indices
+        :return: list of child nodes
+        """
         children = []
+        representatives = {}
         for poly_indices in clusters:
             logging.info("processing cluster: {!s}".format(poly_indices))
-            cds = self.cluster_to_cell_decomposition(poly_indices)
+            key, lower = self.cluster_shape(poly_indices)
             # It can happen that a not full dimensional cluster is found.
-            # In this case the corresponding cell decomposition should have no events.
-            # We do not add that cluster.
-            if len(cds[0].events) == 0:
+            # It has no events and we do not add that cluster.
+            if key is None:
+                continue
+            if key in representatives:
+                representative, representative_lower = representatives[key]
+                logging.info("cluster {!s} is a translated copy of cluster {!s}".format(
+                    poly_indices, representative.cluster))
+                self.cluster_copies.append((representative,
+                                            lower - representative_lower,
+                                            poly_indices))
                 continue
+            cds = self.cluster_to_cell_decomposition(poly_indices)
             child_node = self.__class__(cds[0],
                                         cds[1],
                                         parent_id=self.id,
                                         depth=self.depth + 1,
-                                        tol_rel=self.tol_rel,
-                                        tol_abs=self.tol_abs,
-                                        max_depth=self.max_depth,
-                                        cut_generator=self.cut_generator)
+                                        adjacency=self._child_adjacency(
+                                            restrict_adjacency_to_cluster,
+                                            poly_indices),
+                                        cluster=poly_indices,
+                                        **self.child_parameters())
             children.append(child_node)
+            representatives[key] = (child_node, lower)
 
         return children
 
+    def cluster_shape(self, cluster, decimals=6):
+        """
+        Method computes a form of a cluster that does not depend on its position: the bounding
+        hyperplanes of its polytopes, taken in the order of the polytope indices, relative to the
+        lower corner of the bounding box of the cluster. Two clusters with the same form are
+        translated copies of each other and their polytopes correspond in index order, so their
+        decompositions agree up to the translation.
+        :param cluster: set of polytope indices
+        :param decimals: coefficients of the hyperplanes are rounded to this many decimals
+        :return: (key, lower corner) tuple or (None, None) if the cluster has no events
+        """
+        events = [e for e in self.union_cd.events if cluster & set(e.incident_polytopes)]
+        if not events:
+            return None, None
+        lower = events_bounding_box(events)[0]
+        key = []
+        for i in sorted(cluster):
+            polytope = []
+            for idx, orientation in self.union_cd.polytope_vectors[i]:
+                hyperplane = self.union_cd.hyperplanes[idx]
+                # hyperplane after moving the lower corner to the origin
+                moved = Hyperplane(hyperplane.a, float(hyperplane.b) + np.dot(hyperplane.a, lower))
+                hyperplane_key, sign = canonical_hyperplane(moved, decimals=decimals)
+                polytope.append((hyperplane_key, sign * orientation))
+            key.append(tuple(sorted(polytope)))
+        return tuple(key), lower
+
+    def child_parameters(self):
+        """
+        :return: dict of the parameters that child nodes inherit from this node
+        """
+        return {
+            'tol_rel': self.tol_rel,
+            'tol_abs': self.tol_abs,
+            'max_depth': self.max_depth,
+            'cut_generator': self.cut_generator,
+            'sweeps_per_orthant': self.sweeps_per_orthant,
+            'nr_exact_cuts': self.nr_exact_cuts,
+            'cache': self.cache,
+            'processes': self.processes,
+            'pool': self.pool,
+            'hull_backend': self.hull_backend
+        }
+
     def find_cuts(self, nr_cuts):
+        if self.cache is None:
+            return self._find_cuts(nr_cuts)
+        cuts = self._cached('cuts',
+                            self.union_cd,
+                            lambda: [hyperplane_as_tuple(cut) for cut in self._find_cuts(nr_cuts)],
+                            cut_generator=self.cut_generator.value,
+                            nr_cuts=nr_cuts,
+                            sweeps_per_orthant=self.sweeps_per_orthant)
+        return [Hyperplane(np.array(a), b) for a, b in cuts]
+
+    def _find_cuts(self, nr_cuts):
+        return distinct_hyperplanes(self._generate_cuts(nr_cuts))[:nr_cuts]
+
+    def _generate_cuts(self, nr_cuts):
         if self.cut_generator == CutGenerator.FACET:
             return facet_cuts(self, nr_cuts)
         elif self.cut_generator == CutGenerator.SWEEP:
-            return sweep_cuts(self, nr_cuts)
+            return sweep_cuts(self,
+                              nr_cuts,
+                              sweeps_per_orthant=self.sweeps_per_orthant,
+                              processes=self.processes,
+                              pool=self.pool)
+        elif self.cut_generator == CutGenerator.PRINCIPAL:
+            return principal_cuts(self, nr_cuts)
+        elif self.cut_generator == CutGenerator.CONCAVITY:
+            return concavity_cuts(self, nr_cuts)
         else:
             return NotImplementedError
 
-    def as_dict(self):
+    def release(self):
+        """
+        Frees the cell decompositions of a finalized node. Afterwards only the metrics and the
+        parameters of the node are available, its children are no longer referenced.
+        """
+        self.union_cd = None
+        self.convex_cd = None
+        self._adjacency = None
+        self._sorted_events = None
+        self._sorted_coordinates = None
+        self._restricted_cds = {}
+        self.children = []
+        self.cluster_copies = []
+
+    def as_dict(self, with_cell_decomposition=False):
         node_dict = {
             'depth': self.depth,
             'volume': self.volume,
-            'cell_decomposition': self.union_cd.as_dict(),
             'convex_volume': self.convex_hull_volume,
             'parent_id': str(self.parent_id),
             'children': [str(child.id) for child in self.children],
             'total_error': self.convex_hull_volume - self.volume,
-            'relative_error': self.relative_error()
+            'relative_error': self.relative_error(),
+            'early_exit': self.early_exit
         }
+        if with_cell_decomposition:
+            node_dict['cell_decomposition'] = self.union_cd.as_dict()
         return node_dict
 
     def to_json(self, path):
         with open(path, 'w') as outfile:
-            json.dump(self.as_dict(), outfile, sort_keys=True, indent=4, separators=(',', ': '))
+            json.dump(self.as_dict(with_cell_decomposition=True), outfile,
+                      sort_keys=True, indent=4, separators=(',', ': '))
         return
 
     def best_cut(self, cuts):
 
+        if self.nr_exact_cuts:
+            cuts = screen_cuts(self, cuts, self.nr_exact_cuts)
         logging.info("Searching best cut out of {} cuts".format(len(cuts)))
 
         min_score = self.convex_hull_volume
@@ -209,6 +534,7 @@ class Node(object):
                 best_cut = cut
                 children = cut_children
                 if all(node.volume_error_small_enough() for node in children):
+                    self.early_exit = i < len(cuts) - 1
                     break
 
         # set node children
@@ -251,34 +577,65 @@ class Node(object):
         # Init list of child ACD nodes.
         childACDNodes = []
 
-        # Create child ACD nodes.
-        for i in [0, 1]:
+        # Create child ACD nodes, the second one gets the union volume the first one leaves over.
+        remaining_volume = self.volume
+        for orientation in [-1, 1]:
+            volume = remaining_volume if orientation == 1 else None
+            if volume is not None and volume < 1e-9 * self.volume:
+                # cancellation, the difference cannot be trusted
+                volume = None
+            child = self.child_from_halfspace(cut, orientation, volume=volume)
+            if child is not None:
+                childACDNodes.append(child)
+                remaining_volume -= child.volume
 
-            cds = self.restrict_cds(cut, -1 if i == 0 else 1)
-            if not cds:
-                logging.warning("union cd is empty! cut: {},"
-                                " halfspace : {}".format(str(cut), -1 if i == 0 else 1))
-                continue
+        return childACDNodes
 
-            childACDNodes.append(
-                Node(cds[0],
-                     cds[1],
-                     depth=self.depth + 1,
-                     parent_id=self.id,
-                     tol_rel=self.tol_rel,
-                     tol_abs=self.tol_abs,
-                     max_depth=self.max_depth,
-                     cut_generator=self.cut_generator)
-            )
+    def child_from_halfspace(self, cut, orientation, id=None, volume=None):
+        """
+        Create the child ACD node that results from intersecting this node with a halfspace.
+        :param cut: A Hyperplane object.
+        :param orientation: -1 or 1, side of the cut the child lies on.
+        :param id: id of the child. If None a random id is drawn.
+        :param volume: union volume of the child if it is known
+        :return: The child ACD node or None if the intersection is empty.
+        """
+        cds = self.restrict_cds(cut, orientation)
+        if not cds:
+            logging.warning("union cd is empty! cut: {},"
+                            " halfspace : {}".format(str(cut), orientation))
+            return None
 
-        return childACDNodes
+        return Node(cds[0],
+                    cds[1],
+                    id=id,
+                    depth=self.depth + 1,
+                    parent_id=self.id,
+                    halfspace=(cut, orientation),
+                    adjacency=self._child_adjacency(restrict_adjacency_to_halfspace,
+                                                    cds[0].possible_events,
+                                                    (cut, orientation)),
+                    volume=volume,
+                    sorted_events=self._child_sorted_events(cds[0].events, (cut, orientation)),
+                    **self.child_parameters())
 
     def restrict_cds(self, cut, orientation):
-        union_cd = copy.deepcopy(self.union_cd)
-        union_cd.restrict_to_halfspace(cut, orientation)
+        """
+        Restricts the cell decompositions of the node to the halfspace (cut, orientation).
+        Results are memoized, so trying an equal cut again does not recompute them.
+        :return: [union_cd, conv_cd] or None if the intersection is empty
+        """
+        key, sign = canonical_hyperplane(cut)
+        key = (key, sign * orientation)
+        if key not in self._restricted_cds:
+            self._restricted_cds[key] = self._restrict_cds(cut, orientation)
+        return self._restricted_cds[key]
+
+    def _restrict_cds(self, cut, orientation):
+        union_cd = self.restricted_union(self.union_cd, halfspace=(cut, orientation))
         if len(union_cd.events) == 0:
             return None
-        conv_cd = conv_hull_cell_decomposition(union_cd)
+        conv_cd = self._child_conv_hull_cell_decomposition(union_cd)
         return [union_cd, conv_cd]
 
     def logStatistics(self):
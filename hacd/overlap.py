@@ -0,0 +1,101 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Broad phase overlap queries between two ACD trees.
+
+The trees are used as bounding volume hierarchies: a pair of nodes is only refined if the
+bounding boxes and, if the trees were built with keep_hulls=True, the convex hulls of the nodes
+overlap. Hulls are tested with separating axes along their facet normals. In 3D and higher
+this does not try the cross products of edges, so pairs whose hulls are close but disjoint can
+be reported; pairs that overlap are never missed.
+"""
+import numpy as np
+
+
+def overlapping_leaves(tree, other_tree, translations=None, tolerance=1e-9):
+    """
+    Method finds the pairs of leaves of two trees whose bounding volumes overlap.
+    :param tree: Tree object
+    :param other_tree: Tree object
+    :param translations: optional np.array of shape (nr_translations, dim). other_tree is
+     tested at every translation.
+    :param tolerance: bounding volumes closer than tolerance count as overlapping
+    :return: list of (leaf id of tree, leaf id of other_tree) tuples or, if translations are
+     given, one such list per translation
+    """
+    single = translations is None
+    translations = (np.zeros((1, tree.root.dim)) if single
+                    else np.atleast_2d(translations).astype(float))
+
+    nodes, other_nodes = tree.light_nodes(), other_tree.light_nodes()
+    pairs = [[] for _ in translations]
+    stack = [(nodes['root'], other_nodes['root'], np.arange(len(translations)))]
+    while stack:
+        node, other_node, active = stack.pop()
+        active = active[overlap(node, other_node, translations[active], tolerance)]
+        if len(active) == 0:
+            continue
+        children = node.dict['children']
+        other_children = other_node.dict['children']
+        if not children and not other_children:
+            for i in active:
+                pairs[i].append((node.id, other_node.id))
+        elif not other_children or (children and _volume(node) >= _volume(other_node)):
+            # descend into the larger bounding volume first
+            stack += [(nodes[child_id], other_node, active) for child_id in children]
+        else:
+            stack += [(node, other_nodes[child_id], active) for child_id in other_children]
+    return pairs[0] if single else pairs
+
+
+def overlap(node, other_node, translations, tolerance=1e-9):
+    """
+    Method tests the bounding volumes of two LightNodes for overlap.
+    :param translations: np.array of shape (nr_translations, dim) by which other_node is moved
+    :return: boolean np.array, True for the translations at which the bounding volumes overlap
+    """
+    if node.bbox is None or other_node.bbox is None:
+        # records of old trees have no bounding box
+        overlapping = np.ones(len(translations), dtype=bool)
+    else:
+        lower, upper = np.asarray(node.bbox[0]), np.asarray(node.bbox[1])
+        other_lower = np.asarray(other_node.bbox[0]) + translations
+        other_upper = np.asarray(other_node.bbox[1]) + translations
+        overlapping = ((lower <= other_upper + tolerance) &
+                       (other_lower <= upper + tolerance)).all(axis=1)
+    if node.hull is None or other_node.hull is None or not overlapping.any():
+        return overlapping
+    overlapping[overlapping] = hulls_overlap(node.hull,
+                                             other_node.hull,
+                                             translations[overlapping],
+                                             tolerance)
+    return overlapping
+
+
+def hulls_overlap(hull, other_hull, translations, tolerance=1e-9):
+    """
+    Separating axis test of two convex hulls along their facet normals.
+    :param hull: (A, b, vertices) arrays as in LightNode.hull
+    :param other_hull: (A, b, vertices) arrays as in LightNode.hull
+    :param translations: np.array of shape (nr_translations, dim) by which other_hull is moved
+    :return: boolean np.array, False for the translations at which a separating axis was found
+    """
+    normals = np.vstack([hull[0], other_hull[0]])
+    projections = hull[2].dot(normals.T)
+    other_projections = other_hull[2].dot(normals.T)
+    shift = translations.dot(normals.T)
+    separated = ((projections.max(axis=0) + tolerance < other_projections.min(axis=0) + shift) |
+                 (other_projections.max(axis=0) + shift + tolerance < projections.min(axis=0)))
+    return ~separated.any(axis=1)
+
+
+def _volume(light_node):
+    return light_node.dict['convex_volume']
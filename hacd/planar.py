@@ -0,0 +1,564 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Opt-in engine for planar (2D) instances.
+
+The union of polytopes is kept as a list of convex polygons (PlanarUnion) instead of a cell
+decomposition. Cuts clip the polygons, areas follow from the shoelace formula and convex hulls
+from the monotone chain algorithm. Sweeps are evaluated exactly from the width of the polygons
+along the sweep direction, which is linear between their vertices. Neither Cell_Decomposition
+nor Sweep is used:
+
+    union = planar_union_from_json('test_data/test2D.json')
+    tree = build_acd(union, None, max_vol_error=0.05)
+
+The sweep and the facet cut generator are available. The node cache and the screening of cuts
+by volume estimates (nr_exact_cuts) work on cell decompositions and are not used.
+"""
+import logging
+
+import numpy as np
+
+from sweepvolume.geometry import Hyperplane
+
+import hacd.analysis as ana
+from hacd.cut_generators.cut_generators_enum import CutGenerator
+from hacd.cut_generators.sweep import select_sweep_cuts
+from hacd.hull import HullBackend
+from hacd.node import Node
+from hacd.util.data_reader import polytopes_from_json
+from hacd.util.geometry import PolytopeDescription, boxes_overlap, distinct_hyperplanes
+from hacd.util.union_find import UnionFind
+
+TOLERANCE = 1e-9
+
+
+def polygon_area(vertices):
+    """
+    Shoelace formula.
+    :param vertices: np.array of the vertices of a polygon in order, one per row
+    :return: area of the polygon
+    """
+    x, y = vertices[:, 0], vertices[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def convex_hull(points, tolerance=TOLERANCE):
+    """
+    Andrew's monotone chain algorithm.
+    :param points: np.array of points, one per row
+    :return: np.array of the vertices of the convex hull in counterclockwise order, starting at
+     the lexicographically smallest one. Collinear points are dropped.
+    """
+    points = np.unique(np.asarray(points, dtype=float).reshape(-1, 2), axis=0)
+    if len(points) < 3:
+        return points
+
+    def chain(points):
+        vertices = []
+        for point in points:
+            while len(vertices) >= 2 and _cross(vertices[-2], vertices[-1], point) <= tolerance:
+                vertices.pop()
+            vertices.append(point)
+        return vertices[:-1]
+
+    return np.array(chain(points) + chain(points[::-1]))
+
+
+def halfplanes(vertices):
+    """
+    :param vertices: np.array of the vertices of a convex polygon in counterclockwise order
+    :return: (A, b) tuple with polygon {x : A*x + b >= 0}, the rows of A are normed
+    """
+    edges = np.roll(vertices, -1, axis=0) - vertices
+    lengths = np.linalg.norm(edges, axis=1)
+    # clipping can leave (almost) repeated vertices
+    proper = lengths > TOLERANCE
+    A = np.column_stack([-edges[proper, 1], edges[proper, 0]]) / lengths[proper, np.newaxis]
+    return A, -np.einsum('ij,ij->i', A, vertices[proper])
+
+
+def clip_polygon(vertices, a, b, orientation=1, tolerance=TOLERANCE):
+    """
+    Method intersects a convex polygon with the halfspace orientation * (a*x + b) >= 0.
+    All edges are clipped at once (Sutherland-Hodgman for a single halfspace).
+    :param vertices: np.array of the vertices of a convex polygon in order, one per row
+    :return: vertices of the intersection in the same order or None if it has no area
+    """
+    a = np.asarray(a, dtype=float)
+    s = orientation * (vertices.dot(a) + b) / np.linalg.norm(a)
+    s[np.abs(s) <= tolerance] = 0.
+    if (s >= 0).all():
+        return vertices
+    if (s <= 0).all():
+        return None
+    s_next = np.roll(s, -1)
+    crossing = s * s_next < 0
+    t = s / np.where(crossing, s - s_next, 1.)
+    intersections = vertices + t[:, np.newaxis] * (np.roll(vertices, -1, axis=0) - vertices)
+    # vertex i (if inside) is followed by the intersection on edge i (if the edge crosses)
+    candidates = np.stack([vertices, intersections], axis=1).reshape(-1, 2)
+    clipped = candidates[np.stack([s >= 0, crossing], axis=1).reshape(-1)]
+    if len(clipped) < 3 or polygon_area(clipped) <= tolerance:
+        return None
+    return clipped
+
+
+def polygon_difference(vertices, other, tolerance=TOLERANCE):
+    """
+    :param vertices: np.array of the vertices of a convex polygon in order
+    :param other: np.array of the vertices of a convex polygon in counterclockwise order
+    :return: list of convex polygons with disjoint interiors that cover vertices minus other
+    """
+    if not boxes_overlap((vertices.min(axis=0), vertices.max(axis=0)),
+                         (other.min(axis=0), other.max(axis=0))):
+        return [vertices]
+    pieces = []
+    remaining = vertices
+    for a, b in zip(*halfplanes(other)):
+        outside = clip_polygon(remaining, a, b, -1, tolerance)
+        if outside is not None:
+            pieces.append(outside)
+        remaining = clip_polygon(remaining, a, b, 1, tolerance)
+        if remaining is None:
+            break
+    return pieces
+
+
+def _widths(vertices, direction):
+    # distinct levels direction*x of the vertices and the length of the intersection of the
+    # polygon with the line direction*x = level
+    s = vertices.dot(direction)
+    p = vertices.dot([-direction[1], direction[0]])
+    levels = np.unique(s)
+    ds, dp = np.roll(s, -1) - s, np.roll(p, -1) - p
+    proper = ds != 0
+    s, p, ds, dp = s[proper], p[proper], ds[proper], dp[proper]
+    t = (levels[:, np.newaxis] - s) / ds
+    on_edge = (t >= -TOLERANCE) & (t <= 1 + TOLERANCE)
+    points = p + t * dp
+    widths = (np.where(on_edge, points, -np.inf).max(axis=1) -
+              np.where(on_edge, points, np.inf).min(axis=1))
+    return levels, widths
+
+
+def sweep_areas(polygons, direction, times):
+    """
+    Method computes the area of the part {x : direction*x <= t} of polygons for every t of times.
+    The width of a convex polygon along the sweep is linear between its vertices, so the area is
+    a quadratic function of t between them.
+    :param polygons: list of convex polygons with disjoint interiors
+    :param direction: normed sweep direction
+    :param times: iterable of sweep times
+    :return: np.array of the areas
+    """
+    times = np.asarray(times, dtype=float)
+    areas = np.zeros(len(times))
+    for vertices in polygons:
+        levels, widths = _widths(vertices, direction)
+        if len(levels) < 2:
+            continue
+        steps = np.diff(levels)
+        slopes = np.diff(widths) / steps
+        cumulative = np.append(0., np.cumsum(0.5 * (widths[:-1] + widths[1:]) * steps))
+        k = np.clip(np.searchsorted(levels, times, side='right') - 1, 0, len(steps) - 1)
+        dt = np.clip(times - levels[k], 0., steps[k])
+        areas += cumulative[k] + widths[k] * dt + 0.5 * slopes[k] * dt ** 2
+    return areas
+
+
+class PlanarUnion(object):
+    """
+    Union of convex polygons, the planar counterpart of the cell decomposition of a union of
+    polytopes.
+    polygons[i] are the vertices of polytope i (within the region of the node) in
+    counterclockwise order or None if nothing of the polytope is left. pieces are convex
+    polygons with disjoint interiors that cover the union, piece k is part of polytope
+    piece_polytopes[k].
+    """
+    dim = 2
+
+    def __init__(self, polygons, pieces, piece_polytopes, tolerance=TOLERANCE):
+        self.polygons = polygons
+        self.pieces = pieces
+        self.piece_polytopes = piece_polytopes
+        self.tolerance = tolerance
+        self._vertices = None
+        self._hyperplanes = None
+
+    @classmethod
+    def from_polygons(cls, polygons, tolerance=TOLERANCE):
+        """
+        :param polygons: list of np.arrays of points, polytope i is the convex hull of polygons[i]
+        :return: PlanarUnion object
+        """
+        polygons = [convex_hull(points, tolerance) for points in polygons]
+        polygons = [polygon if len(polygon) >= 3 else None for polygon in polygons]
+        pieces, piece_polytopes = [], []
+        for i, polygon in enumerate(polygons):
+            if polygon is None:
+                continue
+            # the parts of a polytope that are covered by an earlier one are left out
+            remaining = [polygon]
+            for earlier in polygons[:i]:
+                if earlier is None:
+                    continue
+                remaining = [piece for vertices in remaining
+                             for piece in polygon_difference(vertices, earlier, tolerance)]
+            pieces += remaining
+            piece_polytopes += [i] * len(remaining)
+        return cls(polygons, pieces, piece_polytopes, tolerance)
+
+    @classmethod
+    def from_polytopes(cls, polytopes, tolerance=TOLERANCE):
+        """
+        :param polytopes: list of (2D) Polytope objects
+        :return: PlanarUnion object
+        """
+        return cls.from_polygons([np.array(p.get_vertex_coordinates(), dtype=float)
+                                  for p in polytopes], tolerance)
+
+    def area(self):
+        return sum(polygon_area(piece) for piece in self.pieces)
+
+    def hull(self):
+        """
+        :return: vertices of the convex hull of the union in counterclockwise order
+        """
+        return convex_hull(self._polygon_vertices(), self.tolerance)
+
+    def bounding_box(self):
+        coordinates = self._polygon_vertices()
+        return coordinates.min(axis=0), coordinates.max(axis=0)
+
+    def _polygon_vertices(self):
+        return np.vstack([polygon for polygon in self.polygons if polygon is not None])
+
+    @property
+    def hyperplanes(self):
+        """
+        Distinct lines of the edges of the polygons. The edges of the pieces lie on them as well.
+        """
+        if self._hyperplanes is None:
+            lines = []
+            for polygon in self.polygons:
+                if polygon is None:
+                    continue
+                A, b = halfplanes(polygon)
+                lines += [Hyperplane(a, float(b_i)) for a, b_i in zip(A, b)]
+            self._hyperplanes = distinct_hyperplanes(lines)
+        return self._hyperplanes
+
+    def vertices(self):
+        """
+        Vertices of the polygons and of the pieces, the latter include the points where the
+        boundaries of two polygons cross. They take the place of the events of a cell
+        decomposition.
+        :return: (coordinates, incident polytopes, incidences) tuple: np.array with one vertex per
+         row, for every vertex the set of the polytopes that contain it and the list of the
+         indices of the hyperplanes through it
+        """
+        if self._vertices is None:
+            coordinates = np.unique(np.round(np.vstack([self._polygon_vertices()] + self.pieces),
+                                             9), axis=0)
+            incident_polytopes = [set() for _ in coordinates]
+            for i, polygon in enumerate(self.polygons):
+                if polygon is None:
+                    continue
+                A, b = halfplanes(polygon)
+                inside = (coordinates.dot(A.T) + b >= -self.tolerance).all(axis=1)
+                for k in np.flatnonzero(inside):
+                    incident_polytopes[k].add(i)
+            A = np.array([h.a for h in self.hyperplanes], dtype=float)
+            b = np.array([float(h.b) for h in self.hyperplanes])
+            distances = np.abs(coordinates.dot(A.T) + b) / np.linalg.norm(A, axis=1)
+            incidences = [list(np.flatnonzero(row <= self.tolerance)) for row in distances]
+            self._vertices = coordinates, incident_polytopes, incidences
+        return self._vertices
+
+    def clusters(self):
+        """
+        :return: polytopes that are connected through common vertices, as a list of sets of
+         polytope indices (see analysis.clusters_from_adjacency)
+        """
+        polytope_sets = UnionFind(i for i, polygon in enumerate(self.polygons)
+                                  if polygon is not None)
+        for polytopes in self.vertices()[1]:
+            polytope_sets.union_all(sorted(polytopes))
+        return polytope_sets.sets()
+
+    def restrict_to_halfspace(self, hyperplane, orientation):
+        """
+        :return: PlanarUnion of the intersection with the halfspace (hyperplane, orientation)
+         or None if the intersection has no area
+        """
+        a, b = np.asarray(hyperplane.a, dtype=float), float(hyperplane.b)
+        polygons = [None if polygon is None
+                    else clip_polygon(polygon, a, b, orientation, self.tolerance)
+                    for polygon in self.polygons]
+        pieces, piece_polytopes = [], []
+        for piece, i in zip(self.pieces, self.piece_polytopes):
+            piece = clip_polygon(piece, a, b, orientation, self.tolerance)
+            if piece is not None:
+                pieces.append(piece)
+                piece_polytopes.append(i)
+        if not pieces:
+            return None
+        return PlanarUnion(polygons, pieces, piece_polytopes, self.tolerance)
+
+    def restrict_to_cluster(self, cluster):
+        """
+        :param cluster: iterable of polytope indices that contains every polytope overlapping one
+         of its polytopes, as the clusters of clusters() do
+        :return: PlanarUnion of the polytopes in cluster. Polytope i of the result is the i-th
+         smallest index of cluster (as in analysis.restrict_to_cluster).
+        """
+        indices = sorted(cluster)
+        rank = {i: k for k, i in enumerate(indices)}
+        pieces = [(piece, rank[i]) for piece, i in zip(self.pieces, self.piece_polytopes)
+                  if i in rank]
+        return PlanarUnion([self.polygons[i] for i in indices],
+                           [piece for piece, _ in pieces],
+                           [k for _, k in pieces],
+                           self.tolerance)
+
+    def as_dict(self):
+        return {
+            'polygons': [polygon.tolist() if polygon is not None else None
+                         for polygon in self.polygons],
+            'pieces': [piece.tolist() for piece in self.pieces],
+            'piece_polytopes': list(self.piece_polytopes)
+        }
+
+
+def planar_union_from_json(filepath, description=PolytopeDescription.INNER_DESCRIPTION):
+    """
+    Method reads polytopes from a JSON file (see data_reader.polytopes_from_json).
+    :return: PlanarUnion object
+    """
+    return PlanarUnion.from_polytopes(polytopes_from_json(filepath, description=description))
+
+
+def planar_cut_row(union, hull, direction, eps=np.exp(-8)):
+    """
+    Planar counterpart of analysis.cut_row.
+    :param union: PlanarUnion object
+    :param hull: vertices of the convex hull of union
+    :param direction: normed sweep direction
+    :return: (sweep plane, cut lambda, diff delta, scale, active hyperplanes) of the direction
+    """
+    coordinates, incident_polytopes, incidences = union.vertices()
+    lams = coordinates.dot(direction)
+    order = np.argsort(lams, kind='mergesort')
+    start, end = lams[order[0]], lams[order[-1]]
+    # as analysis.evaluation_points
+    candidates = [k for k in order if len(incident_polytopes[k]) > 1 and
+                  not ana.lam_close_to_border(lams[k], start, end)]
+    if not candidates:
+        return direction, None, 0, end - start, None
+    times = (lams[candidates][:, np.newaxis] + np.array([-eps, 0., eps])).flatten()
+    diff_delta = ana.diff_deltas(sweep_areas([hull], direction, times),
+                                 sweep_areas(union.pieces, direction, times))
+    best = diff_delta.argmax()
+    return (direction,
+            lams[candidates[best]],
+            diff_delta[best],
+            end - start,
+            incidences[candidates[best]])
+
+
+def planar_sweep_cuts(node, n=10, sweeps_per_orthant=100):
+    """
+    Planar counterpart of sweep.sweep_cuts.
+    :param node: PlanarNode for which cuts are to be generated
+    :param n: Number of cuts to be returned.
+    :param sweeps_per_orthant: Number of sweeps that are tried per orthant
+    :return: a list of the best n cuts
+    """
+    assert isinstance(n, int) and n > 0
+    sweep_planes = ana.direction_bank(sweeps_per_orthant * 2 ** node.dim, node.dim)
+    logging.debug("-- using {} sweep planes...".format(len(sweep_planes)))
+    rows = [planar_cut_row(node.union_cd, node.hull, direction) for direction in sweep_planes]
+    return select_sweep_cuts(rows, node.union_cd, n, node.dim)
+
+
+def planar_facet_cuts(node, nr_cuts=10, epsilon=1e-6):
+    """
+    Planar counterpart of facet.facet_cuts.
+    :param node: PlanarNode for which cuts are to be generated
+    :param nr_cuts: The best nr_of_cuts are returned.
+    :return: best nr_cuts as list of hyperplane objects
+    """
+    union = node.union_cd
+    coordinates, incident_polytopes, incidences = union.vertices()
+    cuts = []
+    for ind, hyperplane in enumerate(union.hyperplanes):
+        # sweeps along the normal of a facet are degenerate, see facet.get_sweeps
+        cut_plane = hyperplane.pertubate()
+        direction = np.asarray(cut_plane.a, dtype=float) / np.linalg.norm(cut_plane.a)
+        lams = coordinates.dot(direction)
+        order = np.argsort(lams, kind='mergesort')
+        diff_delta = 0
+        for k in order:
+            if ind not in incidences[k]:
+                continue
+            if ana.lam_close_to_border(lams[k], lams[order[0]], lams[order[-1]]):
+                break
+            if len(incident_polytopes[k]) > 1:
+                times = lams[k] + np.array([-epsilon, 0., epsilon])
+                diff = (sweep_areas([node.hull], direction, times) -
+                        sweep_areas(union.pieces, direction, times))
+                diff_delta = max(diff[1] - diff[0], diff[2] - diff[1])
+                break
+        logging.debug('cut: <{}> ; difference delta: {}'.format(str(hyperplane), diff_delta))
+        cuts.append((Hyperplane(hyperplane.a, hyperplane.b), diff_delta))
+    cuts = sorted(cuts, key=lambda x: x[1], reverse=True)
+    return distinct_hyperplanes([cut for cut, _ in cuts])[:nr_cuts]
+
+
+class PlanarNode(Node):
+    """
+    Node of the planar engine. union_cd is a PlanarUnion and the convex hull is kept as
+    polygon (hull), there is no cell decomposition of the convex hull.
+    """
+    convex_cd = None
+
+    def __init__(self,
+                 union_cd,
+                 convex_cd=None,
+                 id=None,
+                 depth=0,
+                 parent_id=None,
+                 tol_rel=0.01,
+                 tol_abs=None,
+                 max_depth=100,
+                 cut_generator=None,
+                 halfspace=None,
+                 adjacency=None,
+                 sweeps_per_orthant=100,
+                 nr_exact_cuts=None,
+                 cache=None,
+                 processes=None,
+                 pool=None,
+                 hull_backend=HullBackend.SWEEP,
+                 volume=None,
+                 cluster=None):
+        """
+        PlanarNode constructor, it takes the arguments of Node.
+        convex_cd, adjacency, cache, processes, pool and hull_backend are not used. nr_exact_cuts is
+        ignored as well, the children of all cuts are computed exactly at little cost.
+        """
+        # the hull is needed by _compute_convex_hull_volume, which Node.__init__ calls
+        self.hull = union_cd.hull()
+        Node.__init__(self,
+                      union_cd,
+                      None,
+                      id=id,
+                      depth=depth,
+                      parent_id=parent_id,
+                      tol_rel=tol_rel,
+                      tol_abs=tol_abs,
+                      max_depth=max_depth,
+                      cut_generator=cut_generator,
+                      halfspace=halfspace,
+                      sweeps_per_orthant=sweeps_per_orthant,
+                      processes=processes,
+                      hull_backend=hull_backend,
+                      volume=volume,
+                      cluster=cluster)
+
+    def _compute_convex_hull_volume(self):
+        return polygon_area(self.hull)
+
+    def _compute_volume(self):
+        return self.union_cd.area()
+
+    @staticmethod
+    def restricted_union(union_cd, cluster=None, halfspace=None):
+        if cluster is not None:
+            return union_cd.restrict_to_cluster(cluster)
+        return union_cd.restrict_to_halfspace(*halfspace)
+
+    def bounding_box(self):
+        return self.union_cd.bounding_box()
+
+    def hull_arrays(self):
+        A, b = halfplanes(self.hull)
+        return A, b, self.hull
+
+    def find_clusters(self):
+        clusters = self.union_cd.clusters()
+        logging.info("Clusters found : %s" % clusters)
+        return clusters
+
+    def cluster_to_cell_decomposition(self, cluster):
+        return self.union_cd.restrict_to_cluster(cluster), None
+
+    def cluster_shape(self, cluster, decimals=6):
+        # the polygons of the cluster relative to the lower corner of their bounding box
+        polygons = [self.union_cd.polygons[i] for i in sorted(cluster)]
+        if all(polygon is None for polygon in polygons):
+            return None, None
+        lower = np.vstack([polygon for polygon in polygons if polygon is not None]).min(axis=0)
+        key = tuple(None if polygon is None
+                    else tuple(tuple(vertex)
+                               for vertex in np.round(convex_hull(polygon - lower),
+                                                      decimals).tolist())
+                    for polygon in polygons)
+        return key, lower
+
+    def _generate_cuts(self, nr_cuts):
+        if self.cut_generator == CutGenerator.FACET:
+            return planar_facet_cuts(self, nr_cuts)
+        elif self.cut_generator == CutGenerator.SWEEP:
+            return planar_sweep_cuts(self, nr_cuts, sweeps_per_orthant=self.sweeps_per_orthant)
+        raise NotImplementedError("Cut generator {} is not available for planar instances"
+                                  .format(self.cut_generator.value))
+
+    def child_from_halfspace(self, cut, orientation, id=None, volume=None):
+        cds = self.restrict_cds(cut, orientation)
+        if not cds:
+            logging.warning("union is empty! cut: {},"
+                            " halfspace : {}".format(str(cut), orientation))
+            return None
+
+        return self.__class__(cds[0],
+                              None,
+                              id=id,
+                              depth=self.depth + 1,
+                              parent_id=self.id,
+                              halfspace=(cut, orientation),
+                              volume=volume,
+                              **self.child_parameters())
+
+    def _restrict_cds(self, cut, orientation):
+        union = self.union_cd.restrict_to_halfspace(cut, orientation)
+        if union is None:
+            return None
+        return [union, None]
+
+    def release(self):
+        super(PlanarNode, self).release()
+        self.hull = None
+
+    def logStatistics(self):
+        logging.info("ACD NODE STATISTICS")
+        logging.info("Depth in ACD tree         : {}".format(self.depth))
+        logging.info("Concavity tolerance (rel) : {:.2f}".format(self.tol_rel))
+        logging.info("Concavity tolerance (abs) : {:.2f}".format(self.tol_abs))
+        logging.info("Number of polygons        : {}".format(
+            sum(polygon is not None for polygon in self.union_cd.polygons)))
+        logging.info("Volume (polyunion)        : {:.2f}".format(self.volume))
+        logging.info("Volume (convhull)         : {:.2f}".format(self.convex_hull_volume))
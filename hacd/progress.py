@@ -0,0 +1,139 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Progress file of a running decomposition.
+
+A ProgressMonitor follows the finished nodes of a tree (see iter_acd) and rewrites a small json
+file at most every interval seconds, e.g. for a job scheduler that watches long runs:
+
+    {"elapsed": 3605.2, "finished": false, "nodes_finished": 412, "leaves": 198, "frontier": 17,
+     "max_leaf_error": 0.049, "root_error": 12.5, "error_reduction": 11.9,
+     "phase_seconds": {"clusters": 80.1, "cuts": 2950.3, "best_cut": 560.4, "copies": 0.0},
+     "eta_seconds": 150.0, ...}
+
+frontier is the nr of nodes that have been created but are not finished yet. error_reduction
+is the root error minus the error of the deepest decomposition whose nodes are all finished.
+eta_seconds assumes that every frontier node grows a subtree of the average size seen so far.
+The file is replaced atomically, readers never see a partial file.
+"""
+import json
+import os
+import tempfile
+import time
+
+from hacd.util.json_encoder import NumpyEncoder
+
+
+class ProgressMonitor(object):
+
+    def __init__(self, path, tree, interval=10.0):
+        """
+        :param path: path of the progress file
+        :param tree: Tree object that is decomposed
+        :param interval: minimal nr of seconds between two writes of the file
+        """
+        self.path = os.path.abspath(path)
+        self.tree = tree
+        self.interval = interval
+        self.start = time.time()
+        self.last_write = None
+        self.nodes_finished = 0
+        self.leaves = 0
+        self.max_leaf_error = 0.
+        self.root_error = None
+        self.error_reduction = 0.
+        # ids of created nodes that are not finished yet
+        self.frontier = set()
+        # errors of finished nodes whose children are not all finished:
+        # id -> [total error, nr of unfinished children, total error of the finished children]
+        self.open_nodes = {}
+        self.parents = {}
+
+    def update(self, light_node):
+        """
+        Records a finished node and writes the progress file if interval seconds have passed.
+        :param light_node: LightNode of the finished node
+        """
+        node_id = str(light_node.id)
+        d = light_node.dict
+        self.nodes_finished += 1
+        self.frontier.discard(node_id)
+        if self.root_error is None:
+            self.root_error = d['total_error']
+        if d['children']:
+            self.frontier.update(d['children'])
+            self.open_nodes[node_id] = [d['total_error'], len(d['children']), 0.]
+            for child_id in d['children']:
+                self.parents[child_id] = node_id
+        else:
+            self.leaves += 1
+            self.max_leaf_error = max(self.max_leaf_error, d['relative_error'])
+        self._close(node_id, d['total_error'])
+        if self.last_write is None or time.time() - self.last_write >= self.interval:
+            self.write()
+
+    def _close(self, node_id, total_error):
+        # passes the error of a finished node to its parent, a parent whose children are all
+        # finished is replaced by them in the decomposition
+        parent_id = self.parents.pop(node_id, None)
+        if parent_id not in self.open_nodes:
+            return
+        parent = self.open_nodes[parent_id]
+        parent[1] -= 1
+        parent[2] += total_error
+        if parent[1] == 0:
+            self.error_reduction += parent[0] - parent[2]
+            del self.open_nodes[parent_id]
+
+    def metrics(self, finished=False):
+        """
+        :param finished: True if the decomposition is finished
+        :return: dict of the current progress
+        """
+        elapsed = time.time() - self.start
+        eta = None
+        if finished:
+            eta = 0.
+        elif self.leaves:
+            nodes_per_leaf = float(self.nodes_finished) / self.leaves
+            eta = len(self.frontier) * nodes_per_leaf * elapsed / self.nodes_finished
+        return {
+            'time': time.time(),
+            'elapsed': elapsed,
+            'finished': finished,
+            'nodes_finished': self.nodes_finished,
+            'leaves': self.leaves,
+            'frontier': len(self.frontier),
+            'max_leaf_error': self.max_leaf_error,
+            'root_error': self.root_error,
+            'error_reduction': self.error_reduction,
+            'phase_seconds': dict(self.tree.phase_seconds),
+            'eta_seconds': eta
+        }
+
+    def write(self, finished=False):
+        """
+        Replaces the progress file atomically.
+        """
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.metrics(finished), f, indent=3, cls=NumpyEncoder)
+        os.rename(tmp_path, self.path)
+        self.last_write = time.time()
+
+    def close(self):
+        """
+        Writes the final progress file.
+        """
+        self.write(finished=True)
@@ -0,0 +1,467 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Local decomposition service.
+
+Jobs are posted as JSON to a HTTP server that only listens on the local machine:
+
+    POST   /jobs               {"polytopes": {disj: {polyID: [...]}},
+                                "description": "INNER_DESCRIPTION",
+                                "parameters": {"max_vol_error": 0.05, "max_depth": 10,
+                                               "cut_generator": "SWEEP", "nr_cuts": 10},
+                                "time_budget": 600}
+    GET    /jobs/<id>          status and, once finished, the tree dict
+    GET    /jobs/<id>/progress progress messages as JSON lines until the job is finished
+    DELETE /jobs/<id>          cancel the job
+
+Only the parameters in JOB_PARAMETERS are accepted. The progress messages report the finished
+nodes, a job keeps the last MAX_PROGRESS_MESSAGES of them.
+
+Finished jobs and their results are kept for JOB_TTL seconds, and at most MAX_FINISHED_JOBS of
+them (the oldest are dropped first). Afterwards their URLs answer 404.
+
+Jobs are queued and run by a pool of worker processes that have imported hacd before the
+first job arrives. A worker whose job is cancelled or exceeds its time budget is replaced,
+a worker that dies fails its job and is replaced as well.
+
+Usage: python -m hacd.service --port 8765 --workers 4
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import re
+import threading
+import time
+import traceback
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import queue
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import Queue as queue
+
+from hacd.acd_tree import iter_acd
+from hacd.cut_generators.cut_generators_enum import CutGenerator
+from hacd.hull import HullBackend
+from hacd.util.data_reader import polytopes_from_dict, cell_decompositions_from_polytopes
+from hacd.util.geometry import PolytopeDescription
+from hacd.util.json_encoder import NumpyEncoder
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+TIMEOUT = 'timeout'
+FINISHED = (DONE, FAILED, CANCELLED, TIMEOUT)
+
+# parameters of build_acd that a job may set, others (e.g. files to write) are rejected
+JOB_PARAMETERS = ('max_vol_error', 'max_depth', 'cut_generator', 'nr_cuts', 'sweeps_per_orthant',
+                  'nr_exact_cuts', 'hull_backend', 'reduce_hyperplanes')
+MAX_PROGRESS_MESSAGES = 1000
+# retention of finished jobs, see expired_jobs
+JOB_TTL = 3600.
+MAX_FINISHED_JOBS = 100
+
+
+def job_parameters(job):
+    """
+    :param job: dict with the keys polytopes, description and parameters (see module docstring)
+    :return: dict of the parameters of the job
+    :raises ValueError: if the job sets parameters that are not in JOB_PARAMETERS
+    """
+    parameters = dict(job.get('parameters', {}))
+    rejected = sorted(set(parameters) - set(JOB_PARAMETERS))
+    if rejected:
+        raise ValueError("Parameters {} are not accepted".format(rejected))
+    return parameters
+
+
+def run_job(job, progress=None):
+    """
+    Method computes the ACD tree for a job.
+    :param job: dict with the keys polytopes, description and parameters (see module docstring)
+    :param progress: callable that is called with the LightNode of every finished node or None
+    :return: tree dict as returned by Tree.as_dict()
+    """
+    parameters = job_parameters(job)
+    if 'cut_generator' in parameters:
+        parameters['cut_generator'] = CutGenerator[parameters['cut_generator']]
+    if 'hull_backend' in parameters:
+        parameters['hull_backend'] = HullBackend[parameters['hull_backend']]
+    description = PolytopeDescription[job.get('description', 'INNER_DESCRIPTION')]
+    # the same default as acd.py, so a job gives the same tree as a run of acd.py
+    reduce_hyperplanes = parameters.pop('reduce_hyperplanes', False)
+    polytopes = polytopes_from_dict(job['polytopes'], description=description)
+    union_cd, convex_cd = cell_decompositions_from_polytopes(polytopes,
+                                                             reduce_hyperplanes=reduce_hyperplanes)
+    tree_dict = {}
+    for light_node in iter_acd(union_cd, convex_cd, **parameters):
+        tree_dict[light_node.id] = light_node.dict
+        if progress is not None:
+            progress(light_node)
+    return tree_dict
+
+
+def expired_jobs(jobs, now, job_ttl=JOB_TTL, max_finished_jobs=MAX_FINISHED_JOBS):
+    """
+    :param jobs: iterable of Job objects
+    :param now: current time
+    :param job_ttl: seconds a finished job is kept or None
+    :param max_finished_jobs: maximal nr of finished jobs that are kept or None
+    :return: list of the finished jobs that are older than job_ttl or exceed max_finished_jobs
+    """
+    finished = sorted((job for job in jobs if job.status in FINISHED), key=lambda job: job.finished)
+    expired = [job for job in finished if job_ttl is not None and now - job.finished > job_ttl]
+    if max_finished_jobs is not None:
+        kept = [job for job in finished if job not in expired]
+        expired += kept[:max(len(kept) - max_finished_jobs, 0)]
+    return expired
+
+
+def progress_message(light_node):
+    d = light_node.dict
+    return "node {} finished at depth {}: relative error {:.4f}, {} children".format(
+        light_node.id, d['depth'], d['relative_error'], len(d['children']))
+
+
+def _worker_loop(tasks, messages):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, job = task
+
+        def progress(light_node):
+            messages.put(('progress', job_id, progress_message(light_node)))
+
+        try:
+            tree = run_job(job, progress=progress)
+            messages.put(('result', job_id, json.loads(json.dumps(tree, cls=NumpyEncoder))))
+        except Exception:
+            messages.put(('error', job_id, traceback.format_exc()))
+
+
+class _Worker(object):
+    # Every worker has its own queues, so terminating it cannot leave a shared queue locked.
+    def __init__(self):
+        self.tasks = multiprocessing.Queue()
+        self.messages = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_worker_loop,
+                                               args=(self.tasks, self.messages))
+        self.process.daemon = True
+        self.process.start()
+        self.job_id = None
+
+    def pending_messages(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+
+class Job(object):
+    def __init__(self, job, time_budget=None):
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.time_budget = time_budget
+        self.status = QUEUED
+        # the last MAX_PROGRESS_MESSAGES progress messages and the nr of older ones
+        self.progress = []
+        self.dropped_progress = 0
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def as_dict(self, with_result=True):
+        d = {
+            'id': self.id,
+            'status': self.status,
+            'nr_progress_messages': self.dropped_progress + len(self.progress),
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error
+        }
+        if with_result:
+            d['result'] = self.result
+        return d
+
+    def add_progress(self, message):
+        self.progress.append(message)
+        if len(self.progress) > MAX_PROGRESS_MESSAGES:
+            del self.progress[0]
+            self.dropped_progress += 1
+
+
+class DecompositionService(object):
+    """
+    Job queue with a pool of pre-warmed worker processes.
+    """
+
+    def __init__(self,
+                 nr_workers=None,
+                 default_time_budget=None,
+                 job_ttl=JOB_TTL,
+                 max_finished_jobs=MAX_FINISHED_JOBS):
+        self.workers = [_Worker() for _ in range(nr_workers or multiprocessing.cpu_count())]
+        self.default_time_budget = default_time_budget
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.queue = []
+        self.changed = threading.Condition()
+        self.running = True
+        self.dispatcher = threading.Thread(target=self._dispatch)
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
+
+    def submit(self, job, time_budget=None):
+        job = Job(job, time_budget or self.default_time_budget)
+        with self.changed:
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self.changed.notify_all()
+        return job
+
+    def cancel(self, job_id):
+        with self.changed:
+            job = self.jobs[job_id]
+            if job.status == QUEUED:
+                self.queue.remove(job)
+                self._finish(job, CANCELLED)
+            elif job.status == RUNNING:
+                self._replace_worker(job_id)
+                self._finish(job, CANCELLED)
+            return job
+
+    def shutdown(self):
+        with self.changed:
+            self.running = False
+            for worker in self.workers:
+                worker.process.terminate()
+
+    def _finish(self, job, status):
+        # caller holds self.changed
+        job.status = status
+        job.finished = time.time()
+        self.changed.notify_all()
+
+    def _replace_worker(self, job_id):
+        # caller holds self.changed
+        for i, worker in enumerate(self.workers):
+            if worker.job_id == job_id:
+                worker.process.terminate()
+                self.workers[i] = _Worker()
+
+    def _dispatch(self):
+        while self.running:
+            with self.changed:
+                messages = [message for worker in self.workers
+                            for message in worker.pending_messages()]
+                for kind, job_id, content in messages:
+                    self._handle_message(kind, job_id, content)
+                self._check_workers()
+                self._check_time_budgets()
+                for job in expired_jobs(self.jobs.values(),
+                                        time.time(),
+                                        self.job_ttl,
+                                        self.max_finished_jobs):
+                    del self.jobs[job.id]
+                for worker in self.workers:
+                    if worker.job_id is None and self.queue:
+                        job = self.queue.pop(0)
+                        job.status = RUNNING
+                        job.started = time.time()
+                        worker.job_id = job.id
+                        worker.tasks.put((job.id, job.job))
+                if messages:
+                    self.changed.notify_all()
+            if not messages:
+                time.sleep(0.05)
+
+    def _handle_message(self, kind, job_id, content):
+        job = self.jobs.get(job_id)
+        if kind == 'progress':
+            if job is not None and job.status == RUNNING:
+                job.add_progress(content)
+            return
+        for worker in self.workers:
+            if worker.job_id == job_id:
+                worker.job_id = None
+        if job is None or job.status != RUNNING:
+            return
+        if kind == 'result':
+            job.result = content
+            self._finish(job, DONE)
+        else:
+            job.error = content
+            self._finish(job, FAILED)
+
+    def _check_workers(self):
+        # caller holds self.changed
+        if not self.running:
+            return
+        for i, worker in enumerate(self.workers):
+            if worker.process.is_alive():
+                continue
+            # the worker may have sent the result of its job before it died
+            for kind, job_id, content in worker.pending_messages():
+                self._handle_message(kind, job_id, content)
+            self.workers[i] = _Worker()
+            job = self.jobs.get(worker.job_id)
+            if job is None or job.status != RUNNING:
+                continue
+            logging.warning("Worker of job {} died with exit code {}".format(
+                job.id, worker.process.exitcode))
+            job.error = 'worker process died with exit code {}'.format(worker.process.exitcode)
+            self._finish(job, FAILED)
+
+    def _check_time_budgets(self):
+        now = time.time()
+        for job in self.jobs.values():
+            if job.status == RUNNING and job.time_budget and now - job.started > job.time_budget:
+                logging.warning("Job {} exceeded its time budget of {}s".format(job.id,
+                                                                               job.time_budget))
+                self._replace_worker(job.id)
+                self._finish(job, TIMEOUT)
+
+    def stream_progress(self, job_id):
+        """
+        Generator that yields the progress messages of a job until it is finished.
+        """
+        job = self.jobs[job_id]
+        # nr of messages that have been sent or dropped before they could be sent
+        sent = 0
+        while True:
+            with self.changed:
+                while (sent == job.dropped_progress + len(job.progress) and
+                       job.status not in FINISHED):
+                    self.changed.wait(1.)
+                new_messages = job.progress[max(sent - job.dropped_progress, 0):]
+                sent = job.dropped_progress + len(job.progress)
+                finished = job.status in FINISHED
+            for message in new_messages:
+                yield message
+            # no progress is recorded for finished jobs
+            if finished:
+                return
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, code, data):
+            body = json.dumps(data, cls=NumpyEncoder).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_id(self):
+            match = re.match(r'^/jobs/(\w+)(/progress)?/?$', self.path)
+            if not match or match.group(1) not in service.jobs:
+                self._send_json(404, {'error': 'no such job'})
+                return None, None
+            return match.group(1), bool(match.group(2))
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/jobs':
+                return self._send_json(404, {'error': 'unknown path'})
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                job = json.loads(self.rfile.read(length).decode())
+                assert 'polytopes' in job
+            except (ValueError, AssertionError):
+                return self._send_json(400, {'error': 'expected a JSON job with polytopes'})
+            try:
+                job_parameters(job)
+            except ValueError as e:
+                return self._send_json(400, {'error': str(e)})
+            job = service.submit(job, time_budget=job.get('time_budget'))
+            self._send_json(201, job.as_dict(with_result=False))
+
+        def do_GET(self):
+            job_id, progress = self._job_id()
+            if job_id is None:
+                return
+            if not progress:
+                return self._send_json(200, service.jobs[job_id].as_dict())
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            for message in service.stream_progress(job_id):
+                self.wfile.write((json.dumps({'progress': message}) + '\n').encode())
+                self.wfile.flush()
+            job = service.jobs[job_id]
+            self.wfile.write((json.dumps(job.as_dict(), cls=NumpyEncoder) + '\n').encode())
+
+        def do_DELETE(self):
+            job_id, _ = self._job_id()
+            if job_id is None:
+                return
+            self._send_json(200, service.cancel(job_id).as_dict(with_result=False))
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return Handler
+
+
+def serve(host='127.0.0.1',
+          port=8765,
+          nr_workers=None,
+          default_time_budget=None,
+          job_ttl=JOB_TTL,
+          max_finished_jobs=MAX_FINISHED_JOBS):
+    service = DecompositionService(nr_workers=nr_workers,
+                                   default_time_budget=default_time_budget,
+                                   job_ttl=job_ttl,
+                                   max_finished_jobs=max_finished_jobs)
+    server = _ThreadingHTTPServer((host, port), make_handler(service))
+    logging.info("Serving hacd on http://{}:{} with {} workers".format(host,
+                                                                       port,
+                                                                       len(service.workers)))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--host", default='127.0.0.1', help="Interface to listen on")
+    parser.add_argument("--port", default=8765, type=int, help="Port to listen on")
+    parser.add_argument("--workers", default=None, type=int,
+                        help="Nr of worker processes (default: nr of cpus)")
+    parser.add_argument("--timeBudget", default=None, type=float,
+                        help="Default time budget per job in seconds")
+    parser.add_argument("--jobTtl", default=JOB_TTL, type=float,
+                        help="Seconds a finished job and its result are kept")
+    parser.add_argument("--maxFinishedJobs", default=MAX_FINISHED_JOBS, type=int,
+                        help="Maximal nr of finished jobs that are kept")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.workers, args.timeBudget, args.jobTtl, args.maxFinishedJobs)
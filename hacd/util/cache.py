@@ -0,0 +1,125 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+# Increase if the meaning of cached values changes.
+CACHE_VERSION = 1
+
+
+def cell_decomposition_key(cell_decomposition, decimals=9):
+    """
+    Method computes a canonical representation of the geometry of a cell decomposition.
+    :param cell_decomposition: CellDecomposition object
+    :param decimals: hyperplane coefficients are rounded to this many decimals
+    :return: tuple of hyperplanes, polytope vectors and bounding box
+    """
+    hyperplanes = tuple(
+        tuple(np.round(np.append(np.asarray(h.a, dtype=float), float(h.b)), decimals).tolist())
+        for h in cell_decomposition.hyperplanes
+    )
+    polytope_vectors = tuple(tuple(sorted(p)) for p in cell_decomposition.polytope_vectors)
+    bbox = cell_decomposition.bbox
+    if bbox is not None:
+        bbox = tuple(tuple(np.round(np.asarray(b, dtype=float), decimals).tolist()) for b in bbox)
+    return hyperplanes, polytope_vectors, bbox
+
+
+class NodeCache(object):
+    """
+    Content addressed disk cache for results of node computations.
+    Values are pickled into files named after the hash of their key.
+    When the cache grows beyond max_size bytes, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_size=2 ** 30):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    def key(self, kind, cell_decomposition, **parameters):
+        """
+        :param kind: name of the cached quantity, e.g. 'volume'
+        :param cell_decomposition: CellDecomposition object the quantity is computed for
+        :param parameters: further parameters the quantity depends on
+        :return: hex digest that identifies the quantity
+        """
+        content = repr((CACHE_VERSION,
+                        kind,
+                        cell_decomposition_key(cell_decomposition),
+                        sorted(parameters.items())))
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return default
+        # mark entry as recently used
+        os.utime(path, None)
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if os.path.exists(path):
+            self.size -= os.path.getsize(path)
+        os.rename(tmp_path, path)
+        self.size += os.path.getsize(path)
+        if self.size > self.max_size:
+            self._evict()
+
+    def cached(self, kind, cell_decomposition, compute, **parameters):
+        """
+        Method returns the cached value or computes and stores it.
+        :param compute: function without arguments that computes the value
+        """
+        key = self.key(kind, cell_decomposition, **parameters)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        else:
+            logging.debug("Cache hit for {}".format(kind))
+        return value
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def _entries(self):
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.pkl'):
+                    yield os.path.join(directory, name)
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        self.size = sum(os.path.getsize(path) for path in entries)
+        target = 0.9 * self.max_size
+        for path in entries:
+            if self.size <= target:
+                break
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+        logging.info("Evicted cache entries, cache size is now {} bytes".format(self.size))
@@ -45,28 +45,68 @@ def polytopes_from_json(filepath, description=PolytopeDescription.INNER_DESCRIPT
      If polytopes are given in outer description the elements polyID: [[a1, ..., ad, b],...,[...]]
      correspond to the halfspace a1x1 + ... + adxd + b <= 0
     """
+    return polytopes_from_dict(load_json(filepath), description=description)
+
+
+def polytopes_from_dict(disj, description=PolytopeDescription.INNER_DESCRIPTION):
+    """
+    Method to read polytopes from a dict in the format of the JSON files (see polytopes_from_json).
+    """
     polys = []
-    disj = load_json(filepath)
     for disjID, _ply in disj.items():
         logging.info("Reading polytopes of disjunction {}"
                      " which are given in {}".format(disjID,
                                                      description.name))
 
-        if description == PolytopeDescription.INNER_DESCRIPTION:
+        for plyID, ply in _ply.items():
+            polys.append(polytope_from_description(ply, description))
+
+    return polys
+
 
-            for i, (plyID, ply) in enumerate(_ply.items()):
-                poly_vertices = set([Vertex.vertex_from_coordinates(np.array(coordinates))
-                                     for coordinates in ply])
-                polys.append(Polytope(vertices=poly_vertices))
+def polytope_from_description(ply, description=PolytopeDescription.INNER_DESCRIPTION):
+    """
+    Method builds a polytope from its json description.
+    :param ply: list of vertex coordinates (inner description) or
+     list of halfspaces [a1, ..., ad, b] (outer description)
+    :param description: PolytopeDescription of ply
+    :return: Polytope object
+    """
+    if description == PolytopeDescription.INNER_DESCRIPTION:
+        poly_vertices = set([Vertex.vertex_from_coordinates(np.array(coordinates))
+                             for coordinates in ply])
+        return Polytope(vertices=poly_vertices)
 
-        elif description == PolytopeDescription.OUTER_DESCRIPTION:
+    elif description == PolytopeDescription.OUTER_DESCRIPTION:
+        halfspaces = [(Hyperplane(np.array(hyp_vec[:-1]), hyp_vec[-1]), -1)
+                      for hyp_vec in ply]
+        return Polytope(halfspaces=halfspaces)
 
-            for i, (plyID, ply) in enumerate(_ply.items()):
-                halfspaces = [(Hyperplane(np.array(hyp_vec[:-1]), hyp_vec[-1]), -1)
-                              for hyp_vec in ply]
-                polys.append(Polytope(halfspaces=halfspaces))
 
-    return polys
+def changed_polytopes(old_filepath,
+                      new_filepath,
+                      description=PolytopeDescription.INNER_DESCRIPTION):
+    """
+    Method compares two polytope json files and returns the polytopes that have been added
+    or removed. Polytopes are identified by their polyID. A polytope whose description changed
+    is returned in its old and its new version.
+    :param old_filepath: path of the json of the old disjunction
+    :param new_filepath: path of the json of the new disjunction
+    :param description: PolytopeDescription of both files
+    :return: list of Polytope objects
+    """
+    old_plys = list(load_json(old_filepath).values())[0]
+    new_plys = list(load_json(new_filepath).values())[0]
+    changed = []
+    for plyID in set(old_plys) | set(new_plys):
+        if old_plys.get(plyID) == new_plys.get(plyID):
+            continue
+        changed += [polytope_from_description(plys[plyID], description)
+                    for plys in [old_plys, new_plys] if plyID in plys]
+    logging.info("{} polytopes changed between {} and {}".format(len(changed),
+                                                                 old_filepath,
+                                                                 new_filepath))
+    return changed
 
 
 # Method computes cell decompositions for union of polytopes and the convex hull
@@ -74,6 +114,10 @@ def get_cell_decompositions(filepath,
                             reduce_hyperplanes=True,
                             description=PolytopeDescription.INNER_DESCRIPTION):
     polytopes = polytopes_from_json(filepath, description=description)
+    return cell_decompositions_from_polytopes(polytopes, reduce_hyperplanes=reduce_hyperplanes)
+
+
+def cell_decompositions_from_polytopes(polytopes, reduce_hyperplanes=True):
     hyperplanes, polytope_vectors = hyperplanes_and_polytope_vectors(polytopes)
     if reduce_hyperplanes:
         hyperplanes, polytope_vectors = ana.drop_facets(hyperplanes, polytope_vectors)
@@ -44,4 +44,122 @@ def bounding_box(polytopes):
     # we need a slightly bigger bounding box bc dropping facets
     #  and pertubation can create vertices outside of the box
     # to do : smarter tube around bbox (taking size into consideration)
-    return all_points.min(axis=0) - 10, all_points.max(axis=0) + 10
\ No newline at end of file
+    return all_points.min(axis=0) - 10, all_points.max(axis=0) + 10
+
+
+def event_coordinates(events):
+    """
+    Method collects the coordinates of events in an array.
+    :param events: iterable of sweepvolume events
+    :return: np.array of shape (nr_events, dim)
+    """
+    return np.array([[float(x) for x in e.vertex.coordinates] for e in events])
+
+
+def events_bounding_box(events):
+    """
+    Method calculates the bounding box of a set of events.
+    :param events: iterable of sweepvolume events
+    :return: (lower_bounds, upper_bounds) tuple with lower (upper) bound
+     for each coordinate.
+    """
+    coordinates = event_coordinates(events)
+    return coordinates.min(axis=0), coordinates.max(axis=0)
+
+
+def boxes_overlap(box, other_box, tolerance=1e-7):
+    """
+    Method checks if two (closed) boxes intersect.
+    :param box: (lower_bounds, upper_bounds) tuple
+    :param other_box: (lower_bounds, upper_bounds) tuple
+    :param tolerance: boxes that are closer than tolerance are considered overlapping
+    :return: True if boxes overlap, False otherwise
+    """
+    return bool((np.asarray(box[0]) <= np.asarray(other_box[1]) + tolerance).all() and
+                (np.asarray(other_box[0]) <= np.asarray(box[1]) + tolerance).all())
+
+
+def halfspace_excludes(points, halfspace, tolerance=1e-7):
+    """
+    Method checks if all points lie strictly outside of a halfspace.
+    The halfspace (hyperplane, orientation) is {x : orientation * (a*x + b) >= 0}.
+    :param points: np.array of shape (nr_points, dim)
+    :param halfspace: (Hyperplane, orientation) tuple
+    :param tolerance: points closer than tolerance to the halfspace are considered inside
+    :return: True if no point is in the halfspace, False otherwise
+    """
+    hyperplane, orientation = halfspace
+    values = orientation * (points.dot(np.asarray(hyperplane.a, dtype=float)) + float(hyperplane.b))
+    return bool((values < -tolerance).all())
+
+
+def hyperplane_as_tuple(hyperplane):
+    """
+    :return: (list of coefficients a, b) of a hyperplane a*x + b = 0
+    """
+    return [float(a_i) for a_i in hyperplane.a], float(hyperplane.b)
+
+
+def canonical_hyperplane(hyperplane, decimals=9):
+    """
+    Method computes a form of a hyperplane that does not depend on the scale and sign of (a, b):
+    a is normed and its first nonzero coefficient is positive.
+    :param hyperplane: Hyperplane object
+    :param decimals: coefficients are rounded to this many decimals
+    :return: (key, sign) tuple. key is the tuple of the coefficients (a, b) of the canonical form,
+     the halfspace (hyperplane, orientation) is the halfspace (canonical form, sign * orientation).
+    """
+    a, b = np.asarray(hyperplane.a, dtype=float), float(hyperplane.b)
+    norm = np.linalg.norm(a)
+    coefficients = np.append(a, b) / norm
+    sign = 1 if coefficients[np.flatnonzero(np.abs(a) / norm > 10 ** -decimals)[0]] > 0 else -1
+    return tuple(np.round(sign * coefficients, decimals).tolist()), sign
+
+
+def polytope_keys(cell_decomposition, decimals=6):
+    """
+    Method computes keys of the polytopes of a cell decomposition that do not depend on the
+    numbering of its hyperplanes, e.g. to find the same polytope in another cell decomposition.
+    :param cell_decomposition: CellDecomposition object
+    :param decimals: coefficients of the hyperplanes are rounded to this many decimals
+    :return: list with the frozenset of the canonical halfspaces of every polytope
+    """
+    keys = []
+    for polytope in cell_decomposition.polytope_vectors:
+        halfspaces = set()
+        for idx, orientation in polytope:
+            key, sign = canonical_hyperplane(cell_decomposition.hyperplanes[idx], decimals)
+            halfspaces.add((key, sign * orientation))
+        keys.append(frozenset(halfspaces))
+    return keys
+
+
+def distinct_hyperplanes(hyperplanes):
+    """
+    Method removes hyperplanes that are equal (up to scale and sign) to an earlier one.
+    :param hyperplanes: list of Hyperplane objects
+    :return: list of the first occurences of the distinct hyperplanes
+    """
+    keys = set()
+    distinct = []
+    for hyperplane in hyperplanes:
+        key = canonical_hyperplane(hyperplane)[0]
+        if key not in keys:
+            keys.add(key)
+            distinct.append(hyperplane)
+    return distinct
+
+
+def h_representation_arrays(cell_decomposition):
+    """
+    Method returns the H-representation of a convex cell decomposition (e.g. the convex hull
+    of a node) in array form.
+    :param cell_decomposition: CellDecomposition object consisting of one polytope
+    :return: (A, b) tuple of np.arrays such that the polytope is {x : A*x + b >= 0}
+    """
+    polytope_vector = sorted(next(iter(cell_decomposition.polytope_vectors)))
+    hyperplanes = cell_decomposition.hyperplanes
+    A = np.array([orientation * np.asarray(hyperplanes[idx].a, dtype=float)
+                  for idx, orientation in polytope_vector])
+    b = np.array([orientation * float(hyperplanes[idx].b) for idx, orientation in polytope_vector])
+    return A, b
@@ -0,0 +1,196 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+"""
+Array representation of the geometry of a cell decomposition and its transport to worker
+processes through shared memory (python >= 3.8).
+
+The parent process places the arrays once in a shared memory block:
+
+    shared = SharedGeometry.create(cell_decomposition_arrays(node.union_cd))
+    pool.map(work, [(shared.handle, task) for task in tasks])
+
+and workers attach to the block by its (small, picklable) handle without copying the arrays:
+
+    shared = SharedGeometry.attach(handle)
+    union_cd = cell_decomposition_from_arrays(shared.arrays, event_class)
+
+The events are rebuilt from the shipped event arrays, the workers do not compute them again.
+"""
+import numpy as np
+
+from sweepvolume.cell_decomposition import Cell_Decomposition
+from sweepvolume.geometry import Hyperplane, Vertex
+
+from hacd.util.geometry import event_coordinates
+
+# alignment of the arrays inside the shared memory block
+_ALIGNMENT = 64
+
+
+def cell_decomposition_arrays(cell_decomposition):
+    """
+    Method converts a cell decomposition into arrays.
+    :param cell_decomposition: CellDecomposition object
+    :return: dict of np.arrays
+     hyperplanes: (nr_hyperplanes, dim + 1), row i is (a, b) of hyperplane a*x + b = 0
+     polytopes: (nr_polytopes, nr_hyperplanes) int8, orientation of polytope j w.r.t.
+      hyperplane i or 0 if the hyperplane does not bound the polytope
+     bbox: (2, dim) lower and upper bounds of the bounding box (if the cell decomposition has one)
+     event_coordinates: (nr_events, dim)
+     event_incidences_indptr, event_incidences: indices of the hyperplanes incident to event k
+      are event_incidences[event_incidences_indptr[k]:event_incidences_indptr[k + 1]]
+     event_polytopes_indptr, event_polytopes: incident polytopes of the events, same layout
+    """
+    hyperplanes = cell_decomposition.hyperplanes
+    dim = cell_decomposition.dim
+    arrays = {
+        'hyperplanes': np.array([np.append(np.asarray(h.a, dtype=float), float(h.b))
+                                 for h in hyperplanes]).reshape(len(hyperplanes), dim + 1),
+        'polytopes': np.zeros((len(cell_decomposition.polytope_vectors), len(hyperplanes)),
+                              dtype=np.int8),
+        'event_coordinates': event_coordinates(cell_decomposition.events).reshape(-1, dim)
+    }
+    if cell_decomposition.bbox is not None:
+        arrays['bbox'] = np.array(cell_decomposition.bbox, dtype=float).reshape(2, dim)
+    for j, polytope in enumerate(cell_decomposition.polytope_vectors):
+        for idx, orientation in polytope:
+            arrays['polytopes'][j, idx] = orientation
+    events = cell_decomposition.events
+    for name, incidences in [('event_incidences', [e.incidences for e in events]),
+                             ('event_polytopes', [e.incident_polytopes for e in events])]:
+        arrays[name + '_indptr'] = np.cumsum([0] + [len(i) for i in incidences]).astype(np.int64)
+        arrays[name] = np.array([i for incidence in incidences for i in sorted(incidence)],
+                                dtype=np.int64)
+    return arrays
+
+
+def _csr_rows(indptr, indices):
+    return [set(int(i) for i in indices[indptr[k]:indptr[k + 1]]) for k in range(len(indptr) - 1)]
+
+
+def cell_decomposition_from_arrays(arrays, event_class):
+    """
+    Method rebuilds a cell decomposition from its array representation. The events are taken
+    from the event arrays, only their position vectors are derived from the hyperplanes.
+    :param arrays: dict as returned by cell_decomposition_arrays
+    :param event_class: class of the events of the original cell decomposition
+     (type(cell_decomposition.events[0]))
+    :return: CellDecomposition object. possible_events holds only the events.
+    """
+    hyperplanes = [Hyperplane(np.array(row[:-1]), float(row[-1])) for row in arrays['hyperplanes']]
+    incidences = _csr_rows(arrays['event_incidences_indptr'], arrays['event_incidences'])
+    incident_polytopes = _csr_rows(arrays['event_polytopes_indptr'], arrays['event_polytopes'])
+    events = []
+    for k, coordinates in enumerate(arrays['event_coordinates']):
+        # the constructor of the events searches incidences and polytopes, which are known
+        event = event_class.__new__(event_class)
+        event.vertex = Vertex.vertex_from_coordinates(np.array(coordinates))
+        event.incidences = incidences[k]
+        event.incident_polytopes = incident_polytopes[k]
+        event.update_position_vector(hyperplanes)
+        events.append(event)
+
+    cell_decomposition = Cell_Decomposition.__new__(Cell_Decomposition)
+    cell_decomposition.dim = arrays['hyperplanes'].shape[1] - 1
+    cell_decomposition.hyperplanes = hyperplanes
+    cell_decomposition.polytope_vectors = [
+        set((int(idx), int(polytope[idx])) for idx in np.flatnonzero(polytope))
+        for polytope in arrays['polytopes']]
+    cell_decomposition.bbox = None
+    if 'bbox' in arrays:
+        cell_decomposition.bbox = (np.array(arrays['bbox'][0]), np.array(arrays['bbox'][1]))
+    cell_decomposition.possible_events = events
+    cell_decomposition.events = events
+    return cell_decomposition
+
+
+class SharedGeometry(object):
+    """
+    Arrays in one shared memory block.
+    handle is a small tuple (block name and array layout) that is sent to workers instead of
+    the arrays.
+    """
+
+    def __init__(self, memory, layout, owner):
+        self.memory = memory
+        self.handle = (memory.name, layout)
+        self.owner = owner
+        self.arrays = {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+            for name, (dtype, shape, offset) in layout.items()
+        }
+
+    @staticmethod
+    def available():
+        """
+        :return: True if multiprocessing.shared_memory can be imported (python >= 3.8)
+        """
+        try:
+            from multiprocessing import shared_memory  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @classmethod
+    def create(cls, arrays):
+        """
+        Copies arrays into a new shared memory block. The creating process owns the block and
+        has to unlink it (see close).
+        :param arrays: dict of np.arrays, e.g. as returned by cell_decomposition_arrays
+        :return: SharedGeometry object
+        """
+        from multiprocessing import shared_memory
+
+        layout = {}
+        size = 0
+        for name, array in sorted(arrays.items()):
+            layout[name] = (array.dtype.str, array.shape, size)
+            size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(memory, layout, owner=True)
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        Attaches to a block created by another process. The arrays are read only views.
+        :param handle: SharedGeometry.handle of the creating process
+        :return: SharedGeometry object
+        """
+        from multiprocessing import shared_memory
+
+        name, layout = handle
+        try:
+            # the block must not be unlinked when the attaching process exits (python >= 3.13)
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            memory = shared_memory.SharedMemory(name=name)
+        shared = cls(memory, layout, owner=False)
+        for array in shared.arrays.values():
+            array.flags.writeable = False
+        return shared
+
+    def close(self):
+        """
+        Releases the arrays and detaches from the block. The owner also frees the block.
+        """
+        self.arrays = {}
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,64 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+
+
+class UnionFind(object):
+    """
+    Disjoint set forest with path compression and union by size.
+    """
+
+    def __init__(self, elements=()):
+        self.parent = {}
+        self.size = {}
+        for element in elements:
+            self.add(element)
+
+    def add(self, element):
+        if element not in self.parent:
+            self.parent[element] = element
+            self.size[element] = 1
+
+    def find(self, element):
+        self.add(element)
+        root = element
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[element] != root:
+            self.parent[element], element = root, self.parent[element]
+        return root
+
+    def union(self, element, other_element):
+        root, other_root = self.find(element), self.find(other_element)
+        if root == other_root:
+            return root
+        if self.size[root] < self.size[other_root]:
+            root, other_root = other_root, root
+        self.parent[other_root] = root
+        self.size[root] += self.size[other_root]
+        return root
+
+    def union_all(self, elements):
+        elements = iter(elements)
+        first = next(elements, None)
+        if first is None:
+            return
+        self.add(first)
+        for element in elements:
+            self.union(first, element)
+
+    def sets(self):
+        """
+        :return: list of the disjoint sets, ordered by their smallest element
+        """
+        sets = {}
+        for element in self.parent:
+            sets.setdefault(self.find(element), set()).add(element)
+        return sorted(sets.values(), key=min)
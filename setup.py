@@ -12,13 +12,15 @@ config = {
     'package_dir': {'hacd': 'hacd'},
     'install_requires': [
         'argparse',
-        'networkx',
         'numpy',
         'ordered_set',
-        'pandas',
-        'pygraphviz',
         'sweepvolume',
     ],
+    'extras_require': {
+        'qhull': ['scipy'],
+        'render': ['matplotlib', 'pygraphviz'],
+        'analysis': ['pandas'],
+    },
 }
 
 setup(**config)
\ No newline at end of file
@@ -0,0 +1,79 @@
+# *****************************************************************************
+#       Copyright (C) 2017      Tom Walther
+#                     2017-2018 Lovis Anderson  <lovisanderson@posteo.net>
+#                     2017-2018 Benjamin Hiller <hiller@zib.de>
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#  as published by the Free Software Foundation; either version 3 of
+#  the License, or (at youroption) any later version.
+#                  http://www.gnu.org/licenses/
+# *****************************************************************************
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+# modules that are only needed for rendering or for some cut generators
+OPTIONAL_MODULES = ['matplotlib', 'pygraphviz', 'pandas', 'networkx']
+
+COLD_START = '''
+import json, sys, time
+start = time.time()
+import {module}
+print(json.dumps({{
+    'seconds': time.time() - start,
+    'loaded': [m for m in {optional} if m in sys.modules]
+}}))
+'''
+
+
+def cold_start(module):
+    """
+    Imports a module in a fresh interpreter.
+    :return: dict with the import time in seconds and the optional modules that got loaded
+    """
+    output = subprocess.check_output([
+        sys.executable,
+        '-c',
+        COLD_START.format(module=module, optional=OPTIONAL_MODULES)
+    ])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", ['hacd.acd_tree', 'hacd.node'])
+def test_cold_start(module):
+    result = cold_start(module)
+    print('cold start of {}: {:.3f}s'.format(module, result['seconds']))
+    assert result['loaded'] == []
+
+
+@pytest.mark.parametrize("cut_generator", ['SWEEP', 'FACET', 'PRINCIPAL', 'CONCAVITY'])
+@pytest.mark.parametrize("instance", ['test2D', 'boxes2D', 'boxes3D'])
+def test_time_to_target(instance, cut_generator):
+    """
+    Time each cut generator needs to decompose an instance to the target error.
+    """
+    import random
+
+    from hacd.acd_tree import build_acd
+    from hacd.cut_generators.cut_generators_enum import CutGenerator
+    from testing.regression_testing import cell_decompositions
+    from testing.setup import INSTANCES
+
+    random.seed(1)
+    union_cd, convex_cd = cell_decompositions(INSTANCES[instance])
+    max_vol_error = 0.02
+    start = time.time()
+    tree = build_acd(union_cd,
+                     convex_cd,
+                     max_vol_error=max_vol_error,
+                     max_depth=8,
+                     cut_generator=CutGenerator[cut_generator],
+                     nr_cuts=10)
+    seconds = time.time() - start
+    leaves = [light_node.dict for light_node in tree.leafes]
+    reached = all(d['relative_error'] <= max_vol_error for d in leaves)
+    print('{} with {}: {:.2f}s, {} leaves, target error {}reached'.format(
+        instance, cut_generator, seconds, len(leaves), '' if reached else 'not '))
@@ -10,13 +10,140 @@
 # *****************************************************************************
 import logging
 import json
+import platform
+import time
+import tracemalloc
 from pathlib import Path
 
+import numpy as np
+import pytest
+
 from hacd.acd_tree import build_acd
 from hacd.util.data_reader import get_cell_decompositions
+from hacd.util.data_reader import polytopes_from_dict, cell_decompositions_from_polytopes
 from hacd.util.json_encoder import NumpyEncoder
 import random
 
+GOLDEN_DIR = Path(Path(__file__).parents[0], 'test_data', 'golden')
+# run times and peak memory depend on the machine, they are kept out of the golden outputs
+BASELINE_DIR = Path(Path(__file__).parents[0], 'test_data', 'baselines',
+                    '{}_{}'.format(platform.node(), platform.machine()))
+
+# relative tolerance for volumes and errors when trees are compared to the golden outputs
+VOLUME_TOLERANCE = 1e-3
+
+
+def cell_decompositions(run_configuration):
+    if run_configuration.get('polytopes') is not None:
+        polytopes = polytopes_from_dict(run_configuration['polytopes'],
+                                        description=run_configuration['description'])
+        return cell_decompositions_from_polytopes(polytopes)
+    return get_cell_decompositions(run_configuration['path'],
+                                   description=run_configuration['description'])
+
+
+def run_acd(run_configuration):
+    random.seed(1)
+    union_cd, convex_cd = cell_decompositions(run_configuration)
+    return build_acd(
+        union_cd,
+        convex_cd,
+        max_vol_error=run_configuration['maxVolError'],
+        max_depth=run_configuration['max_depth'],
+        cut_generator=run_configuration['cut_generator'],
+        nr_cuts=run_configuration['nr_cuts']
+    )
+
+
+def tree_summary(tree_dict):
+    """
+    Summary of a tree dict that does not depend on the (random) node ids.
+    """
+    leaves = [d for d in tree_dict.values() if not d['children']]
+    return {
+        'nr_nodes': len(tree_dict),
+        'nr_leaves': len(leaves),
+        'depth': max(d['depth'] for d in tree_dict.values()),
+        'leaves_per_depth': [sum(1 for d in leaves if d['depth'] == depth)
+                             for depth in range(max(d['depth'] for d in leaves) + 1)],
+        'leaf_volume': sum(d['volume'] for d in leaves),
+        'leaf_convex_volume': sum(d['convex_volume'] for d in leaves),
+        'max_leaf_relative_error': max(d['relative_error'] for d in leaves)
+    }
+
+
+def compare_summaries(summary, golden):
+    """
+    :return: list of messages for the entries of summary that differ from golden
+    """
+    differences = []
+    for key, golden_value in golden.items():
+        value = summary[key]
+        if isinstance(golden_value, float):
+            equal = np.isclose(value, golden_value, rtol=VOLUME_TOLERANCE, atol=1e-9)
+        else:
+            equal = value == golden_value
+        if not equal:
+            differences.append('{}: {} (golden: {})'.format(key, value, golden_value))
+    return differences
+
+
+def test_regression(run_configuration, request):
+    """
+    Builds the tree of a run configuration and compares it with the golden output in
+    testing/test_data/golden, its run time and peak memory with the baseline of the machine in
+    testing/test_data/baselines. The first run on a machine records the baseline. Run with
+    --update_golden to store the current results as golden output and baseline.
+    """
+    name = '{}_{}'.format(run_configuration['name'],
+                          run_configuration['cut_generator'].name.lower())
+    golden_path = Path(GOLDEN_DIR, name + '.json')
+    baseline_path = Path(BASELINE_DIR, name + '.json')
+
+    start = time.time()
+    tree = run_acd(run_configuration)
+    seconds = time.time() - start
+    summary = tree_summary(json.loads(json.dumps(tree.as_dict(), cls=NumpyEncoder)))
+
+    # a second run for the memory, tracemalloc slows down the computation
+    tracemalloc.start()
+    run_acd(run_configuration)
+    peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2. ** 20
+    tracemalloc.stop()
+    print('{}: {:.2f}s, {:.1f}MB peak memory, {}'.format(name, seconds, peak_memory_mb, summary))
+
+    update_golden = request.config.getoption('update_golden')
+    if update_golden or not baseline_path.exists():
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(str(baseline_path), 'w') as fout:
+            json.dump({'seconds': seconds, 'peak_memory_mb': peak_memory_mb},
+                      fout, indent=3, sort_keys=True)
+        baseline = None
+    else:
+        with open(str(baseline_path)) as fin:
+            baseline = json.load(fin)
+    if update_golden:
+        GOLDEN_DIR.mkdir(parents=True, exist_ok=True)
+        with open(str(golden_path), 'w') as fout:
+            json.dump({'summary': summary}, fout, indent=3, sort_keys=True)
+        pytest.skip('stored golden output {}'.format(golden_path))
+    assert golden_path.exists(), \
+        'no golden output for {}, run with --update_golden'.format(name)
+    with open(str(golden_path)) as fin:
+        golden = json.load(fin)
+
+    differences = compare_summaries(summary, golden['summary'])
+    assert not differences, 'tree differs from golden output: {}'.format(differences)
+    if baseline is None:
+        return
+    time_threshold = request.config.getoption('time_threshold')
+    assert seconds <= (1 + time_threshold) * baseline['seconds'], \
+        'run time regressed: {:.2f}s (baseline: {:.2f}s)'.format(seconds, baseline['seconds'])
+    memory_threshold = request.config.getoption('memory_threshold')
+    assert peak_memory_mb <= (1 + memory_threshold) * baseline['peak_memory_mb'], \
+        'peak memory regressed: {:.1f}MB (baseline: {:.1f}MB)'.format(peak_memory_mb,
+                                                                       baseline['peak_memory_mb'])
+
 
 def test_log_files(run_configuration):
     random.seed(1)
@@ -35,18 +162,7 @@ def test_log_files(run_configuration):
     logger.addHandler(hdlr)
     logger.setLevel(logging.INFO)
 
-    union_cd, convex_cd = get_cell_decompositions(
-        run_configuration['path'],
-        run_configuration['description']
-    )
-    tree = build_acd(
-        union_cd,
-        convex_cd,
-        max_vol_error=run_configuration['maxVolError'],
-        max_depth=run_configuration['max_depth'],
-        cut_generator=run_configuration['cut_generator'],
-        nr_cuts=run_configuration['nr_cuts']
-    )
+    tree = run_acd(run_configuration)
 
     map(logger.removeHandler, logger.handlers[:])
     map(logger.removeFilter, logger.filters[:])
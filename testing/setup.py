@@ -11,13 +11,17 @@
 import os
 from itertools import product
 
+import numpy as np
+
 from hacd.cut_generators.cut_generators_enum import CutGenerator
 from hacd.util.geometry import PolytopeDescription
 
 
 cut_generators = {
     'sweep': CutGenerator.SWEEP,
-    'facet': CutGenerator.FACET
+    'facet': CutGenerator.FACET,
+    'principal': CutGenerator.PRINCIPAL,
+    'concavity': CutGenerator.CONCAVITY
 }
 
 
@@ -30,10 +34,34 @@ RUN_CONFIG = {
 }
 
 
+def random_boxes(nr_boxes, dim, seed=0):
+    """
+    Generates a chain of overlapping random boxes, each box starts inside the previous one.
+    :return: polytopes dict in the input json format
+    """
+    state = np.random.RandomState(seed)
+    boxes = {}
+    lower = np.zeros(dim)
+    for i in range(nr_boxes):
+        upper = lower + state.uniform(0.5, 2., size=dim)
+        corners = product(*zip(lower, upper))
+        boxes['polytope_{:02d}'.format(i)] = [[float(x) for x in corner] for corner in corners]
+        lower = lower + state.uniform(0.2, 0.9, size=dim) * (upper - lower)
+    return {'BOXES': boxes}
+
+
 INSTANCES = {
     'test2D': {
         'path': os.path.abspath('testing/test_data/test2D.json'),
         'description': PolytopeDescription.INNER_DESCRIPTION
+    },
+    'boxes2D': {
+        'polytopes': random_boxes(30, 2, seed=1),
+        'description': PolytopeDescription.INNER_DESCRIPTION
+    },
+    'boxes3D': {
+        'polytopes': random_boxes(15, 3, seed=2),
+        'description': PolytopeDescription.INNER_DESCRIPTION
     }
 }
 
@@ -41,6 +69,12 @@ INSTANCES = {
 def pytest_addoption(parser):
     parser.addoption("--instance", help="run tests for instance", default="all")
     parser.addoption("--cut_generator", help="run tests with cut Generator", default="sweep")
+    parser.addoption("--update_golden", action="store_true",
+                     help="store trees, run times and memory as new golden outputs")
+    parser.addoption("--time_threshold", type=float, default=0.3,
+                     help="tolerated relative increase of the run time w.r.t. the golden output")
+    parser.addoption("--memory_threshold", type=float, default=0.1,
+                     help="tolerated relative increase of the peak memory w.r.t. the golden output")
 
 
 def pytest_generate_tests(metafunc):
@@ -59,7 +93,8 @@ def pytest_generate_tests(metafunc):
             configurations.append(populate_configuration(
                 RUN_CONFIG,
                 {'name': instance,
-                 'path': INSTANCES[instance]['path'],
+                 'path': INSTANCES[instance].get('path'),
+                 'polytopes': INSTANCES[instance].get('polytopes'),
                  'description': INSTANCES[instance]['description'],
                  'cut_generator': cut_generator})
             )
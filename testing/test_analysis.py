@@ -8,11 +8,35 @@
 #  the License, or (at youroption) any later version.
 #                  http://www.gnu.org/licenses/
 # *****************************************************************************
+import json
+import os
 import pytest
 import sys
 print(sys.path)
 from sweepvolume.cell_decomposition import Cell_Decomposition
 from hacd.analysis import conv_hull_cell_decomposition, union_only_events, max_diff_delta, random_normed_directions
+from hacd.analysis import detect_clusters, polytope_adjacency, clusters_from_adjacency
+from hacd.analysis import restrict_adjacency_to_cluster, direction_bank, sweep_cut_rows
+from hacd.analysis import sweep_order, restrict_sweep_order
+from hacd.node import Node
+from hacd.util.union_find import UnionFind
+from hacd.util.geometry import canonical_hyperplane, distinct_hyperplanes, event_coordinates
+from hacd.cut_evaluation import VolumeEstimator
+from hacd.util.shared_geometry import cell_decomposition_arrays, cell_decomposition_from_arrays
+from hacd.util.shared_geometry import SharedGeometry
+from hacd.cut_generators.sweep import parallel_sweep_cut_rows, sweep_pool, close_sweep_pool
+from hacd.overlap import hulls_overlap
+from hacd.acd_tree import build_acd, update_acd, acd_parameters, warm_start_possible
+from hacd.acd_tree import CUT_PARAMETERS
+from hacd.cut_generators.cut_generators_enum import CutGenerator
+from hacd.grid import tree_metrics, run_grid, grid_configurations, write_grid
+from hacd.util.data_reader import cell_decompositions_from_polytopes, polytope_from_description
+from hacd.util.data_reader import get_cell_decompositions
+from hacd.coarsen import coarsen
+from hacd.progress import ProgressMonitor
+from hacd.service import Job, job_parameters, expired_jobs, MAX_PROGRESS_MESSAGES, DONE
+from hacd.planar import PlanarUnion, convex_hull, polygon_area, sweep_areas
+from hacd.planar import planar_union_from_json
 from sweepvolume.sweep import Sweep
 from sweepvolume.geometry import Vertex, Hyperplane
 import numpy as np
@@ -44,6 +68,49 @@ def test_max_diff_delta(translated_triangles):
     assert lam == 0
 
 
+def test_detect_clusters(translated_triangles, separated_squares):
+    assert detect_clusters(translated_triangles.possible_events) == [{0, 1}]
+    assert detect_clusters(separated_squares.possible_events) == [{0}, {1}]
+
+
+def test_clusters_from_adjacency(translated_triangles, separated_squares):
+    for cd in [translated_triangles, separated_squares]:
+        adjacency = polytope_adjacency(cd.possible_events)
+        assert clusters_from_adjacency(adjacency) == detect_clusters(cd.possible_events)
+    adjacency = restrict_adjacency_to_cluster(polytope_adjacency(separated_squares.possible_events),
+                                              {1})
+    assert list(adjacency.keys()) == [(0, 0)]
+
+
+@pytest.mark.parametrize("dim", [2, 3, 4])
+def test_direction_bank(dim):
+    state = np.random.get_state()[1].copy()
+    directions = direction_bank(100, dim)
+    assert directions.shape == (100, dim)
+    assert np.allclose(np.linalg.norm(directions, axis=1), 1)
+    assert np.allclose(directions, direction_bank(100, dim))
+    assert (np.random.get_state()[1] == state).all()
+    # no two directions are opposite
+    assert directions.dot(directions.T).min() > -1 + 1e-6
+
+
+def test_volume_estimator(separated_squares):
+    estimator = VolumeEstimator(separated_squares)
+    union_volumes, hull_volumes = estimator.child_volumes(Hyperplane(np.array([1, 0]), -1.5))
+    assert np.allclose(union_volumes, [1, 1], atol=0.02)
+    assert np.allclose(hull_volumes, [1, 1], atol=0.02)
+    union_volumes, hull_volumes = estimator.child_volumes(Hyperplane(np.array([1, 0]), -2.5))
+    assert np.allclose(union_volumes, [1.5, 0.5], atol=0.02)
+    assert np.allclose(hull_volumes, [2.5, 0.5], atol=0.02)
+
+
+def test_union_find():
+    polytope_sets = UnionFind(range(5))
+    polytope_sets.union_all([3, 1])
+    polytope_sets.union(4, 3)
+    assert polytope_sets.sets() == [{0}, {1, 3, 4}, {2}]
+
+
 def test_non_regular_convex_hull(cube_simplex_overlapping_3d_2):
     cd_conv = conv_hull_cell_decomposition(cube_simplex_overlapping_3d_2)
 
@@ -76,6 +143,22 @@ def translated_triangles():
     return Cell_Decomposition(hyperplanes, [poly1, poly2])
 
 
+@pytest.fixture
+def separated_squares():
+    # geometry: [] [] two unit squares with distance 1
+    h0 = Hyperplane(np.array([1, 0]), 0)
+    h1 = Hyperplane(np.array([1, 0]), -1)
+    h2 = Hyperplane(np.array([0, 1]), 0)
+    h3 = Hyperplane(np.array([0, 1]), -1)
+    h4 = Hyperplane(np.array([1, 0]), -2)
+    h5 = Hyperplane(np.array([1, 0]), -3)
+
+    hyperplanes = [h0, h1, h2, h3, h4, h5]
+    poly1 = {(0, 1), (1, -1), (2, 1), (3, -1)}
+    poly2 = {(4, 1), (5, -1), (2, 1), (3, -1)}
+    return Cell_Decomposition(hyperplanes, [poly1, poly2])
+
+
 @pytest.fixture
 def cube_simplex_overlapping_3d_2():
     c_0 = Hyperplane(np.array([1, 0, 0]), 0)
@@ -94,4 +177,272 @@ def cube_simplex_overlapping_3d_2():
 
     simplex = {(6, -1), (7, 1), (8, 1), (9, 1)}
     unit_cube = {(0, 1), (1, 1), (2, 1), (3, -1), (4, -1), (5, -1)}
-    return Cell_Decomposition(hyperplanes, [unit_cube, simplex])
\ No newline at end of file
+    return Cell_Decomposition(hyperplanes, [unit_cube, simplex])
+
+
+def test_shared_geometry(translated_triangles):
+    arrays = cell_decomposition_arrays(translated_triangles)
+    assert arrays['event_incidences_indptr'][-1] == len(arrays['event_incidences'])
+    rebuilt = cell_decomposition_from_arrays(arrays, type(translated_triangles.events[0]))
+    assert len(rebuilt.events) == len(translated_triangles.events)
+    assert np.isclose(Sweep(rebuilt.events).calculate_volume(),
+                      Sweep(translated_triangles.events).calculate_volume())
+    if not SharedGeometry.available():
+        pytest.skip('no multiprocessing.shared_memory')
+    with SharedGeometry.create(arrays) as shared:
+        attached = SharedGeometry.attach(shared.handle)
+        for name, array in arrays.items():
+            assert np.array_equal(attached.arrays[name], array)
+        attached.close()
+    # the workers sweep the geometry they attach to
+    convex_cd = conv_hull_cell_decomposition(translated_triangles)
+    directions = direction_bank(8, 2)
+    pool = sweep_pool(2)
+    try:
+        rows = parallel_sweep_cut_rows(translated_triangles, convex_cd, directions, pool, 2)
+    finally:
+        close_sweep_pool(pool)
+    assert np.allclose([row[2] for row in rows],
+                       [row[2] for row in sweep_cut_rows(translated_triangles.events,
+                                                         convex_cd.events,
+                                                         directions)])
+
+
+def test_restrict_sweep_order(translated_triangles):
+    direction = random_normed_directions(1, 2, seed=3)[0]
+    parent_order = sweep_order(translated_triangles.events, direction)
+    for orientation in [-1, 1]:
+        halfspace = (Hyperplane(np.array([1., 0.3]), -0.2), orientation)
+        child_cd = Node.restricted_union(translated_triangles, halfspace=halfspace)
+        order = restrict_sweep_order(event_coordinates(parent_order),
+                                     child_cd.events,
+                                     direction,
+                                     halfspace)
+        assert sorted(map(id, order)) == sorted(map(id, child_cd.events))
+        lams = event_coordinates(order).dot(direction)
+        assert (np.diff(lams) >= 0).all()
+        assert np.isclose(Sweep(order, sweep_plane=direction).calculate_volume(),
+                          Sweep(child_cd.events).calculate_volume())
+
+
+def test_distinct_hyperplanes():
+    h = Hyperplane(np.array([1., 2.]), -1.)
+    scaled = Hyperplane(np.array([-2., -4.]), 2.)
+    other = Hyperplane(np.array([1., 2.]), 1.)
+    assert distinct_hyperplanes([h, scaled, other]) == [h, other]
+    assert canonical_hyperplane(h)[0] == canonical_hyperplane(scaled)[0]
+    assert canonical_hyperplane(h)[1] == -canonical_hyperplane(scaled)[1]
+
+
+def test_hulls_overlap():
+    # unit square and the triangle conv{(0, 0), (1, 0), (0, 1)}, as (A, b, vertices)
+    square = (np.array([[1., 0.], [0., 1.], [-1., 0.], [0., -1.]]),
+              np.array([0., 0., 1., 1.]),
+              np.array([[0., 0.], [1., 0.], [1., 1.], [0., 1.]]))
+    triangle = (np.array([[1., 0.], [0., 1.], [-1., -1.]]),
+                np.array([0., 0., 1.]),
+                np.array([[0., 0.], [1., 0.], [0., 1.]]))
+    translations = np.array([[0.5, 0.5], [1.5, 0.], [1.2, 1.2], [-0.4, -0.4]])
+    assert list(hulls_overlap(square, triangle, translations)) == [True, False, False, True]
+    # the bounding boxes overlap, but the hulls are separated by the line x + y = -0.1
+    assert not hulls_overlap(square, triangle, np.array([[-0.6, -0.6]]))[0]
+
+
+def test_translated_cluster_copies(separated_squares):
+    tree = build_acd(separated_squares, conv_hull_cell_decomposition(separated_squares))
+    leaves = sorted(tree.leafes, key=lambda leaf: leaf.bbox[0][0])
+    assert len(leaves) == 2
+    # the right square is the copy of the left one
+    assert np.allclose(leaves[1].bbox[0] - leaves[0].bbox[0], [2., 0.])
+    assert [leaf.dict['cluster'] for leaf in leaves] == [[0], [1]]
+    assert leaves[0].dict['volume'] == leaves[1].dict['volume']
+    assert (sorted(tree.light_nodes()['root'].dict['children']) ==
+            sorted(str(leaf.id) for leaf in leaves))
+
+
+def leaf_volumes(tree):
+    return sorted((round(leaf.dict['volume'], 6), round(leaf.dict['convex_volume'], 6))
+                  for leaf in tree.leafes)
+
+
+def l_shape_and_boxes():
+    # a rectangle far away, an L shape and a square
+    return [polytope_from_description(vertices) for vertices in [
+        [[10., 0.], [11., 0.], [11., 2.], [10., 2.]],
+        [[0., 0.], [2., 0.], [2., 1.], [0., 1.]],
+        [[0., 0.], [1., 0.], [1., 3.], [0., 3.]],
+        [[4., 0.], [5., 0.], [5., 1.], [4., 1.]]]]
+
+
+def test_warm_start_matches_cold_build():
+    union_cd, convex_cd = cell_decompositions_from_polytopes(l_shape_and_boxes())
+    coarse = build_acd(union_cd, convex_cd, max_vol_error=0.2)
+    coarse_parameters = acd_parameters(0.2, 10, CutGenerator.SWEEP, 10)
+    warm = build_acd(union_cd,
+                     convex_cd,
+                     max_vol_error=0.01,
+                     previous_tree=coarse.as_dict(),
+                     previous_parameters=coarse_parameters)
+    cold = build_acd(union_cd, convex_cd, max_vol_error=0.01)
+    assert tree_metrics(warm) == tree_metrics(cold)
+    assert leaf_volumes(warm) == leaf_volumes(cold)
+    # cuts of a tighter tolerance are not reused for a looser one
+    assert not warm_start_possible(acd_parameters(0.01, 10, CutGenerator.SWEEP, 10),
+                                   coarse_parameters)
+    assert not warm_start_possible(None, coarse_parameters)
+
+
+def test_warm_start_ignores_depth_for_early_exits():
+    # the L shape, its principal axis cut leaves errors a sweep cut does not
+    union_cd, convex_cd = cell_decompositions_from_polytopes(l_shape_and_boxes()[1:3])
+    previous = build_acd(union_cd,
+                         convex_cd,
+                         max_vol_error=0.2,
+                         max_depth=1,
+                         cut_generator=CutGenerator.PRINCIPAL).as_dict()
+    previous['root']['early_exit'] = True
+    # the children are finished by depth, but not by error, so the cut has to be searched again
+    warm = build_acd(union_cd,
+                     convex_cd,
+                     max_vol_error=0.001,
+                     max_depth=1,
+                     previous_tree=previous,
+                     previous_parameters=acd_parameters(0.2, 1, CutGenerator.SWEEP, 10))
+    cold = build_acd(union_cd, convex_cd, max_vol_error=0.001, max_depth=1)
+    assert leaf_volumes(warm) == leaf_volumes(cold)
+
+
+def test_grid_matches_cold_builds():
+    union_cd, convex_cd = cell_decompositions_from_polytopes(l_shape_and_boxes())
+    configurations = grid_configurations([0.01, 0.2, 0.05], [2, 10], [10])
+    for configuration, tree, _ in run_grid(union_cd, convex_cd, configurations):
+        cold = build_acd(union_cd,
+                         convex_cd,
+                         max_vol_error=configuration['max_vol_error'],
+                         max_depth=configuration['max_depth'],
+                         nr_cuts=configuration['nr_cuts'])
+        assert tree_metrics(tree) == tree_metrics(cold)
+        assert leaf_volumes(tree) == leaf_volumes(cold)
+
+
+def test_grid_parameters_allow_warm_start(tmpdir):
+    union_cd, convex_cd = cell_decompositions_from_polytopes(l_shape_and_boxes())
+    configurations = grid_configurations([0.2], [10], [10])
+    results = run_grid(union_cd, convex_cd, configurations, sweeps_per_orthant=20)
+    write_grid(results, str(tmpdir), CutGenerator.SWEEP, sweeps_per_orthant=20)
+    with open(str(tmpdir.join('sweep_mD10_nrC10_mVE0.2', 'parameters.json'))) as fin:
+        parameters = json.load(fin)
+    expected = acd_parameters(0.2, 10, CutGenerator.SWEEP, 10, sweeps_per_orthant=20)
+    assert all(parameters[key] == expected[key] for key in CUT_PARAMETERS)
+    assert warm_start_possible(parameters,
+                               acd_parameters(0.05, 10, CutGenerator.SWEEP, 10,
+                                              sweeps_per_orthant=20))
+
+
+def test_update_acd_matches_rebuild():
+    # the rectangle far away is removed
+    polytopes = l_shape_and_boxes()
+    tree = build_acd(*cell_decompositions_from_polytopes(polytopes), max_vol_error=0.01)
+    union_cd, convex_cd = cell_decompositions_from_polytopes(polytopes[1:])
+    updated = update_acd(tree, union_cd, convex_cd, polytopes[:1])
+    rebuilt = build_acd(union_cd, convex_cd, max_vol_error=0.01)
+    assert tree_metrics(updated) == tree_metrics(rebuilt)
+    assert leaf_volumes(updated) == leaf_volumes(rebuilt)
+    # the clusters of the reused nodes refer to the polytopes of the new union
+    tree_dict = dict((str(node_id), d) for node_id, d in updated.as_dict().items())
+    for leaf in updated.leafes:
+        node = updated.restore_node(str(leaf.id), tree_dict)
+        assert np.isclose(node.volume, leaf.dict['volume'])
+
+
+def test_coarsen():
+    def node(total_error, children=()):
+        return {'total_error': total_error, 'children': list(children)}
+
+    tree_dict = {'root': node(10., ['a', 'b']),
+                 'a': node(4., ['a1', 'a2']),
+                 'b': node(5.),
+                 'a1': node(1.),
+                 'a2': node(.5)}
+    assert coarsen(tree_dict, 1) == (10., ['root'])
+    assert coarsen(tree_dict, 2) == (9., ['a', 'b'])
+    total_error, cut = coarsen(tree_dict, 5)
+    assert total_error == 6.5 and sorted(cut) == ['a1', 'a2', 'b']
+    # a split into more children than pieces is not possible
+    tree_dict = {'root': node(10., ['a', 'b', 'c']), 'a': node(1.), 'b': node(1.), 'c': node(1.)}
+    assert coarsen(tree_dict, 2) == (10., ['root'])
+
+
+def test_planar_union():
+    square = np.array([[0., 0.], [1., 0.], [1., 1.], [0., 1.]])
+    # the vertices of the second square are given in no particular order
+    union = PlanarUnion.from_polygons([square, square[[2, 0, 3, 1]] + [0.5, 0.]])
+    assert np.isclose(union.area(), 1.5)
+    assert np.isclose(polygon_area(union.hull()), 1.5)
+    assert len(convex_hull(np.vstack([square, [[0.5, 0.5], [0.5, 0.]]]))) == 4
+    assert union.clusters() == [{0, 1}]
+    assert np.allclose(sweep_areas(union.pieces, np.array([1., 0.]), [-1., 0.25, 1., 2.]),
+                       [0., 0.25, 1., 1.5])
+    left = union.restrict_to_halfspace(Hyperplane(np.array([1., 0.]), -0.75), -1)
+    assert np.isclose(left.area(), 0.75)
+    assert union.restrict_to_halfspace(Hyperplane(np.array([1., 0.]), -2.), 1) is None
+    separated = PlanarUnion.from_polygons([square, square + [3., 0.]])
+    assert separated.clusters() == [{0}, {1}]
+    assert np.isclose(separated.restrict_to_cluster({1}).area(), 1.)
+
+
+@pytest.mark.parametrize('cut_generator', [CutGenerator.SWEEP, CutGenerator.FACET])
+def test_planar_matches_general_engine(cut_generator):
+    path = os.path.join(os.path.dirname(__file__), 'test_data', 'test2D.json')
+    planar = build_acd(planar_union_from_json(path), None, cut_generator=cut_generator)
+    general = build_acd(*get_cell_decompositions(path), cut_generator=cut_generator)
+    planar_metrics, general_metrics = tree_metrics(planar), tree_metrics(general)
+    # the volumes are computed differently, so they agree only up to rounding
+    assert np.isclose(planar_metrics.pop('relative_error'), general_metrics.pop('relative_error'))
+    assert planar_metrics == general_metrics
+    assert np.allclose(leaf_volumes(planar), leaf_volumes(general))
+
+
+def test_progress_monitor(tmpdir):
+    class Tree(object):
+        phase_seconds = {'cuts': 1.}
+
+    class Record(object):
+        def __init__(self, id, total_error, children=()):
+            self.id = id
+            self.dict = {'total_error': total_error,
+                         'relative_error': total_error / 10.,
+                         'children': list(children)}
+
+    path = str(tmpdir.join('progress.json'))
+    monitor = ProgressMonitor(path, Tree(), interval=0.)
+    monitor.update(Record('root', 10., ['a', 'b']))
+    monitor.update(Record('b', 1.))
+    with open(path) as fin:
+        metrics = json.load(fin)
+    assert metrics['frontier'] == 1 and metrics['error_reduction'] == 0.
+    monitor.update(Record('a', 2.))
+    monitor.close()
+    with open(path) as fin:
+        metrics = json.load(fin)
+    assert metrics['finished'] and metrics['frontier'] == 0
+    assert metrics['nodes_finished'] == 3 and metrics['leaves'] == 2
+    assert metrics['error_reduction'] == 7. and metrics['max_leaf_error'] == 0.2
+
+
+def test_service_jobs():
+    assert job_parameters({'parameters': {'max_vol_error': 0.1}}) == {'max_vol_error': 0.1}
+    with pytest.raises(ValueError):
+        job_parameters({'parameters': {'progress_file': '/tmp/progress.json'}})
+    job = Job({'polytopes': {}})
+    for i in range(MAX_PROGRESS_MESSAGES + 5):
+        job.add_progress(str(i))
+    assert len(job.progress) == MAX_PROGRESS_MESSAGES and job.progress[0] == '5'
+    assert job.as_dict()['nr_progress_messages'] == MAX_PROGRESS_MESSAGES + 5
+    # finished jobs are dropped after their time to live or when there are too many
+    jobs = [Job({'polytopes': {}}) for _ in range(4)]
+    for finished, job in zip([0., 50., 80.], jobs):
+        job.status, job.finished = DONE, finished
+    assert expired_jobs(jobs, 100., job_ttl=60., max_finished_jobs=None) == jobs[:1]
+    assert expired_jobs(jobs, 100., job_ttl=60., max_finished_jobs=1) == jobs[:2]
+    assert expired_jobs(jobs, 100., job_ttl=None, max_finished_jobs=3) == []